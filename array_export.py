@@ -0,0 +1,261 @@
+"""把 rawdata 中的瓦片导出为分块压缩的 N 维数组(Zarr / HDF5)，供训练任务随机读取局部区域。
+
+每个子资源(variant)导出为一个形状 (高, 宽, 3)、dtype uint8 的数组，分块边界与第 17 级瓦片网格
+对齐(每块 `--chunk-tiles` x `--chunk-tiles` 个瓦片)，读取任意区域只需解压覆盖到的块。
+导出直接从瓦片逐块拼装，不经过整幅画布；多个块由线程池并行解码、写入。
+艺术家、作品、资源与子资源的 Id 和名称写入数组属性。
+
+输出位置::
+
+    <output>/<artist_id>/<work_id>/<resource_id>/<variant_id>.zarr   (或 .h5)
+
+Zarr 需要 `pip install zarr`，HDF5 需要 `pip install h5py`，两者都依赖 numpy。
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import data_rename
+from data_rename import RAW_PREFIX, STORAGE, TileGrid
+from profiling import PROFILER
+
+logger = logging.getLogger("array_export")
+
+EXPORT_DIR = Path(os.getenv("LTFC_EXPORT_DIR", "data/arrays"))
+EXPORT_FORMAT = os.getenv("LTFC_EXPORT_FORMAT", "zarr")  # zarr | hdf5
+EXPORT_CHUNK_TILES = int(os.getenv("LTFC_EXPORT_CHUNK_TILES", "2"))
+EXPORT_WORKERS = int(os.getenv("LTFC_EXPORT_WORKERS", str(min(8, os.cpu_count() or 1))))
+TILE_LEVEL = 17
+FILL_VALUE = 255  # 缺失瓦片按白色填充，与 merge_tiles 一致
+HDF5_COMPRESSION_LEVEL = 4
+SUFFIXES = {"zarr": ".zarr", "hdf5": ".h5"}
+
+
+def _require_numpy():
+    try:
+        import numpy
+    except ImportError as exc:  # pragma: no cover - 可选依赖
+        raise SystemExit("数组导出需要安装 numpy (pip install numpy)") from exc
+    return numpy
+
+
+def _chunk_regions(grid: TileGrid, chunk_tiles: int) -> Iterator[Tuple[int, int, int, int]]:
+    """按块返回像素区域 (x0, y0, x1, y1)，块边界落在瓦片边界上。"""
+    chunk_w = grid.tile_width * chunk_tiles
+    chunk_h = grid.tile_height * chunk_tiles
+    for y0 in range(0, grid.height, chunk_h):
+        for x0 in range(0, grid.width, chunk_w):
+            yield x0, y0, min(grid.width, x0 + chunk_w), min(grid.height, y0 + chunk_h)
+
+
+def decode_region(grid: TileGrid, x0: int, y0: int, x1: int, y1: int) -> Any:
+    """解码与瓦片对齐的区域，返回 (y1 - y0, x1 - x0, 3) 的 uint8 数组。"""
+    np = _require_numpy()
+    block = np.full((y1 - y0, x1 - x0, 3), FILL_VALUE, dtype=np.uint8)
+    for ty in range(y0 // grid.tile_height, -(-y1 // grid.tile_height)):
+        for tx in range(x0 // grid.tile_width, -(-x1 // grid.tile_width)):
+            key = grid.tiles.get((tx, ty))
+            if key is None:
+                continue
+            try:
+                with PROFILER.stage("tile_decode"), data_rename.open_tile(key) as img:
+                    pixels = np.asarray(img.convert("RGB"))
+            except OSError as exc:
+                logger.warning("读取瓦片 %s 失败: %s", key, exc)
+                continue
+            top = ty * grid.tile_height - y0
+            left = tx * grid.tile_width - x0
+            height = min(pixels.shape[0], block.shape[0] - top)
+            width = min(pixels.shape[1], block.shape[1] - left)
+            block[top : top + height, left : left + width] = pixels[:height, :width]
+    return block
+
+
+class _ZarrTarget:
+    """Zarr 各块相互独立，工作线程解码后直接写入。"""
+
+    parallel_writes = True
+
+    def __init__(self, path: Path, shape: Tuple[int, int, int], chunks: Tuple[int, int, int]):
+        try:
+            import zarr
+        except ImportError as exc:  # pragma: no cover - 可选依赖
+            raise SystemExit("导出 Zarr 需要安装 zarr (pip install zarr)") from exc
+        # 使用 zarr 默认压缩器(Blosc/Zstd)
+        self.array = zarr.open_array(str(path), mode="w", shape=shape, chunks=chunks, dtype="uint8", fill_value=FILL_VALUE)
+
+    def write(self, x0: int, y0: int, block: Any) -> None:
+        self.array[y0 : y0 + block.shape[0], x0 : x0 + block.shape[1], :] = block
+
+    def set_attrs(self, attrs: Dict[str, Any]) -> None:
+        self.array.attrs.update(attrs)
+
+    def close(self) -> None:
+        pass
+
+
+class _Hdf5Target:
+    """h5py 不支持多线程并发写，解码在线程池中完成，写入回到调用线程串行执行。"""
+
+    parallel_writes = False
+
+    def __init__(self, path: Path, shape: Tuple[int, int, int], chunks: Tuple[int, int, int]):
+        try:
+            import h5py
+        except ImportError as exc:  # pragma: no cover - 可选依赖
+            raise SystemExit("导出 HDF5 需要安装 h5py (pip install h5py)") from exc
+        self.file = h5py.File(path, "w")
+        self.dataset = self.file.create_dataset(
+            "image",
+            shape=shape,
+            chunks=chunks,
+            dtype="uint8",
+            compression="gzip",
+            compression_opts=HDF5_COMPRESSION_LEVEL,
+            fillvalue=FILL_VALUE,
+        )
+
+    def write(self, x0: int, y0: int, block: Any) -> None:
+        self.dataset[y0 : y0 + block.shape[0], x0 : x0 + block.shape[1], :] = block
+
+    def set_attrs(self, attrs: Dict[str, Any]) -> None:
+        for key, value in attrs.items():
+            self.dataset.attrs[key] = value
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def export_variant(
+    grid: TileGrid,
+    output_path: Path,
+    attrs: Dict[str, Any],
+    *,
+    fmt: str = EXPORT_FORMAT,
+    chunk_tiles: int = EXPORT_CHUNK_TILES,
+    executor: Optional[ThreadPoolExecutor] = None,
+    max_in_flight: int = 16,
+) -> None:
+    """把一个瓦片网格导出到 output_path；先写临时路径，全部块写完后再改名，中断不会留下半成品。"""
+    chunk_tiles = max(1, chunk_tiles)
+    shape = (grid.height, grid.width, 3)
+    chunks = (min(grid.height, grid.tile_height * chunk_tiles), min(grid.width, grid.tile_width * chunk_tiles), 3)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    _remove(tmp_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    target = _ZarrTarget(tmp_path, shape, chunks) if fmt == "zarr" else _Hdf5Target(tmp_path, shape, chunks)
+
+    def build(region: Tuple[int, int, int, int]) -> Tuple[int, int, Any]:
+        x0, y0, x1, y1 = region
+        block = decode_region(grid, x0, y0, x1, y1)
+        if target.parallel_writes:
+            with PROFILER.stage("chunk_write"):
+                target.write(x0, y0, block)
+            return x0, y0, None
+        return x0, y0, block
+
+    def finish(result: Tuple[int, int, Any]) -> None:
+        x0, y0, block = result
+        if block is not None:
+            with PROFILER.stage("chunk_write"):
+                target.write(x0, y0, block)
+
+    try:
+        if executor is None:
+            for region in _chunk_regions(grid, chunk_tiles):
+                finish(build(region))
+        else:
+            # 限制在途块数，HDF5 串行写入跟不上解码时也不会堆积内存
+            pending: Deque["Future[Tuple[int, int, Any]]"] = deque()
+            for region in _chunk_regions(grid, chunk_tiles):
+                if len(pending) >= max_in_flight:
+                    finish(pending.popleft().result())
+                pending.append(executor.submit(build, region))
+            while pending:
+                finish(pending.popleft().result())
+        target.set_attrs(
+            dict(
+                attrs,
+                tile_level=TILE_LEVEL,
+                tile_width=grid.tile_width,
+                tile_height=grid.tile_height,
+                tile_count=len(grid.tiles),
+                missing_tiles=grid.columns * grid.rows - len(grid.tiles),
+                source=grid.tile_dir,
+            )
+        )
+    except BaseException:
+        target.close()
+        _remove(tmp_path)
+        raise
+    target.close()
+    _remove(output_path)
+    os.replace(tmp_path, output_path)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把下载的瓦片导出为分块压缩数组")
+    parser.add_argument("--format", choices=sorted(SUFFIXES), default=EXPORT_FORMAT, help="输出格式")
+    parser.add_argument("--output", type=Path, default=EXPORT_DIR, help="输出根目录")
+    parser.add_argument("--chunk-tiles", type=int, default=EXPORT_CHUNK_TILES, help="每个分块每个方向包含的瓦片数")
+    parser.add_argument("--workers", type=int, default=EXPORT_WORKERS, help="并行解码/写入分块的线程数")
+    parser.add_argument("--artist", action="append", default=None, metavar="ID", help="只导出指定艺术家，可重复")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的导出结果")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    artist_ids = args.artist or STORAGE.list_dir(RAW_PREFIX)[0]
+    if not artist_ids:
+        raise SystemExit(f"未找到原始数据目录: {RAW_PREFIX}")
+    artist_name_map = data_rename.load_artist_names(data_rename.ARTIST_CSV) if data_rename.ARTIST_CSV.exists() else {}
+
+    data_rename.start_profiling(data_rename.PROFILE_DIR / f"array_export-{int(time.time())}")
+    exported = skipped = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="array-export") as executor:
+        for tile_dir, attrs in data_rename.iter_variants(artist_ids, artist_name_map):
+            output_path = args.output.joinpath(
+                attrs["artist_id"], attrs["work_id"], attrs["resource_id"], attrs["variant_id"] + SUFFIXES[args.format]
+            )
+            if output_path.exists() and not args.overwrite:
+                skipped += 1
+                continue
+            grid = data_rename.scan_tiles(tile_dir)
+            if grid is None:
+                logger.info("目录 %s 中没有可导出的瓦片", tile_dir)
+                continue
+            try:
+                export_variant(
+                    grid,
+                    output_path,
+                    attrs,
+                    fmt=args.format,
+                    chunk_tiles=args.chunk_tiles,
+                    executor=executor,
+                    max_in_flight=max(1, args.workers) * 2,
+                )
+            except Exception as exc:  # pragma: no cover - 单个子资源失败不影响其余导出
+                logger.warning("导出 %s 失败: %s", tile_dir, exc)
+                continue
+            exported += 1
+            logger.info("已导出 %s (%s x %s)", output_path, grid.width, grid.height)
+    logger.info("导出完成：新导出 %s 个，跳过已存在 %s 个，输出位置: %s", exported, skipped, args.output)
+
+
+if __name__ == "__main__":
+    main()
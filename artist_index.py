@@ -0,0 +1,41 @@
+"""艺术家 CSV 的轻量索引。
+
+启动时只需要 `Id`、`name` 与 `worksCount` 三列，用标准库 csv 流式读取即可，
+不必为此导入 pandas 并把整张表载入内存；按 Id 查名字是一次字典查找。
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict, List, Union
+
+
+class ArtistIndex:
+    def __init__(self, ids: List[str], names: Dict[str, str], weights: Dict[str, int]):
+        self.ids = ids
+        self.names = names
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ArtistIndex":
+        ids: List[str] = []
+        names: Dict[str, str] = {}
+        weights: Dict[str, int] = {}
+        with open(path, encoding="utf-8-sig", newline="") as fp:
+            for row in csv.DictReader(fp):
+                artist_id = (row.get("Id") or "").strip()
+                if not artist_id:
+                    continue
+                ids.append(artist_id)
+                if row.get("name"):
+                    names[artist_id] = row["name"]
+                try:
+                    weights[artist_id] = int(float(row.get("worksCount") or 0))
+                except ValueError:
+                    weights[artist_id] = 0
+        return cls(ids, names, weights)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def name(self, artist_id: str) -> str:
+        return self.names.get(artist_id, artist_id)
@@ -0,0 +1,488 @@
+"""艺术家 -> 作品 -> 资源 -> 子资源 的统一目录(SQLite)，可导出为 Parquet。
+
+元数据原本散落在成千上万个 all_huia_of_artist.json / all_sufa_of_artist.json / sub_list.json /
+resource.json 与 artists.csv 中，任何统计都要遍历整棵目录树。目录把它们合并为几张表，
+并记录每个子资源的瓦片数与占用字节数::
+
+    artists(id, name, age, life_time, home_town, works_count)
+    works(artist_id, id, src, name)
+    resources(artist_id, work_id, id, name)
+    variants(artist_id, work_id, resource_id, id, name, tile_count, tile_bytes, completed)
+    catalog                     以上四表连接后的视图
+
+下载器在写入元数据、完成子资源时直接更新目录；`refresh` 按文件签名(大小、修改时间)增量重建，
+只重新解析变化过的 JSON。示例查询(瓦片超过 500 的明代书法)::
+
+    sqlite3 data/catalog.db "SELECT * FROM catalog WHERE src = 'SUFA' AND artist_age LIKE '%明%' AND tile_count > 500"
+
+命令行::
+
+    python catalog.py                   增量刷新
+    python catalog.py --full            忽略签名，全部重新解析
+    python catalog.py --parquet DIR     刷新后导出 Parquet(需要 pyarrow)
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metadata_store
+from storage import StorageBackend, join, open_storage
+
+logger = logging.getLogger(__name__)
+
+CATALOG_NAME = "catalog.db"
+RAW_PREFIX = "rawdata"
+WORK_LISTS = (("all_huia_of_artist.json", "SUHA"), ("all_sufa_of_artist.json", "SUFA"))
+TILE_DIR_NAME = "tile"
+COMPLETED_FLAG = ".completed"
+VARIANT_LIST_PREFIX = "variants:"  # sources 中记录已从 getResource 取得完整子资源列表的资源
+
+
+def catalog_path(data_dir: Path) -> Path:
+    """目录文件位置：LTFC_CATALOG 优先，否则放在数据目录下。"""
+    return Path(os.getenv("LTFC_CATALOG") or data_dir / CATALOG_NAME)
+
+
+def work_names(payload: object) -> List[Tuple[str, str]]:
+    """从 all_huia_of_artist / all_sufa_of_artist 响应中取出 (作品 Id, 名称)。"""
+    rows: List[Tuple[str, str]] = []
+    if not isinstance(payload, dict):
+        return rows
+    for item in payload.get("data") or []:
+        if not isinstance(item, dict):
+            continue
+        work_id = item.get("Id")
+        if work_id:
+            rows.append((work_id, item.get("name") or item.get("title") or work_id))
+    return rows
+
+
+def _collect_named_entries(container: Iterable) -> List[Tuple[str, str]]:
+    results: List[Tuple[str, str]] = []
+    for entry in container:
+        if isinstance(entry, dict):
+            candidate_id = entry.get("Id") or entry.get("id") or entry.get("resourceId")
+            candidate_name = entry.get("name") or entry.get("title") or entry.get("resourceName")
+            if candidate_id:
+                results.append((candidate_id, candidate_name or candidate_id))
+            for key in ("suha", "sufa", "hdp", "hdpic", "resource", "pic"):
+                nested = entry.get(key)
+                if isinstance(nested, dict):
+                    nested_id = nested.get("Id") or nested.get("id") or nested.get("resourceId")
+                    nested_name = nested.get("name") or nested.get("title") or nested.get("resourceName")
+                    if nested_id:
+                        results.append((nested_id, nested_name or nested_id))
+                elif isinstance(nested, list):
+                    results.extend(_collect_named_entries(nested))
+        elif isinstance(entry, list):
+            results.extend(_collect_named_entries(entry))
+    return results
+
+
+def resource_names(payload: object) -> Dict[str, str]:
+    """从 sub_list 响应中取出 {资源 Id: 名称}。"""
+    mapping: Dict[str, str] = {}
+    if not isinstance(payload, dict):
+        return mapping
+
+    data_section = payload.get("data", [])
+    collected = _collect_named_entries(data_section if isinstance(data_section, list) else [])
+
+    parent_data = payload.get("parentData")
+    if isinstance(parent_data, dict):
+        collected.extend(_collect_named_entries([parent_data]))
+
+    for resource_id, resource_name in collected:
+        mapping.setdefault(resource_id, resource_name)
+    return mapping
+
+
+def resource_variants(data: object, work_src: str, resource_id: str, resource_name: str) -> List[Tuple[str, str, str]]:
+    """从 getResource 响应的 data 中取出子资源 [(resourceId, 名称, 来源)]。
+
+    按来源读取 suha 或 sufa 下的 hdpic、hdpcoll 与 otherHdps，按出现顺序去重；
+    一个也没有时以资源自身作为唯一的子资源。下载器与目录共用这一解析。
+    """
+    info = data.get("suha" if work_src == "SUHA" else "sufa") if isinstance(data, dict) else None
+    info = info if isinstance(info, dict) else {}
+    hdp_info = info.get("hdp") if isinstance(info.get("hdp"), dict) else {}
+    default_name = info.get("name")
+
+    entries: List[dict] = []
+    hdpic = hdp_info.get("hdpic")
+    if isinstance(hdpic, dict):
+        entries.append(hdpic)
+    hdpcoll = hdp_info.get("hdpcoll")
+    if isinstance(hdpcoll, dict):
+        entries.extend(hdpcoll.get("hdps", []) or [])
+    entries.extend(info.get("otherHdps", []) or [])
+
+    variants: List[Tuple[str, str, str]] = []
+    seen = set()
+    for item in entries:
+        if not isinstance(item, dict):
+            continue
+        rid = item.get("resourceId")
+        if not rid or rid in seen:
+            continue
+        seen.add(rid)
+        variants.append((rid, item.get("name") or item.get("title") or default_name or rid, work_src))
+    return variants or [(resource_id, resource_name, work_src)]
+
+
+def variant_name_map(data: object) -> Dict[str, str]:
+    """从 getResource 响应的 data 中取出 {子资源 Id: 名称}，作为整理后目录名的来源。
+
+    合并 suha 与 sufa 两个来源(后出现的覆盖先出现的)，没有名称时退回子资源 Id；
+    与 resource_variants 按来源取列表不同，这里保持整理目录一直以来的命名，重跑不会改名。
+    """
+    mapping: Dict[str, str] = {}
+    if not isinstance(data, dict):
+        return mapping
+    for key in ("suha", "sufa"):
+        info = data.get(key)
+        if not isinstance(info, dict):
+            continue
+        hdp_info = info.get("hdp") if isinstance(info.get("hdp"), dict) else {}
+        entries: List[object] = []
+        hdpic = hdp_info.get("hdpic")
+        if isinstance(hdpic, dict):
+            entries.append(hdpic)
+        hdpcoll = hdp_info.get("hdpcoll")
+        if isinstance(hdpcoll, dict):
+            entries.extend(hdpcoll.get("hdps", []) or [])
+        entries.extend(info.get("otherHdps", []) or [])
+        for item in entries:
+            if isinstance(item, dict) and item.get("resourceId"):
+                mapping[item["resourceId"]] = item.get("name") or item.get("title") or item["resourceId"]
+    return mapping
+
+
+def named_variants(data: object, variants: Iterable[Tuple[str, str, str]]) -> List[Tuple[str, str]]:
+    """给 resource_variants 的结果配上 variant_name_map 中的名称，供 upsert_variants 写入。"""
+    names = variant_name_map(data)
+    return [(rid, names.get(rid, rid)) for rid, _, _ in variants]
+
+
+def _source_of(data: object) -> str:
+    """resource.json 本身不记录来源，按响应中出现的键判断。"""
+    if isinstance(data, dict) and isinstance(data.get("sufa"), dict) and not isinstance(data.get("suha"), dict):
+        return "SUFA"
+    return "SUHA"
+
+
+def _variant_list_key(artist_id: str, work_id: str, resource_id: str) -> str:
+    return VARIANT_LIST_PREFIX + join(artist_id, work_id, resource_id)
+
+
+class Catalog:
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS artists (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        age TEXT,
+        life_time TEXT,
+        home_town TEXT,
+        works_count INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS works (
+        artist_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        src TEXT,
+        name TEXT,
+        PRIMARY KEY (artist_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS resources (
+        artist_id TEXT NOT NULL,
+        work_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        name TEXT,
+        PRIMARY KEY (artist_id, work_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS variants (
+        artist_id TEXT NOT NULL,
+        work_id TEXT NOT NULL,
+        resource_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        name TEXT,
+        tile_count INTEGER,
+        tile_bytes INTEGER,
+        completed REAL,
+        PRIMARY KEY (artist_id, work_id, resource_id, id)
+    );
+    CREATE TABLE IF NOT EXISTS sources (
+        key TEXT PRIMARY KEY,
+        signature TEXT NOT NULL
+    );
+    CREATE VIEW IF NOT EXISTS catalog AS
+    SELECT
+        v.artist_id, a.name AS artist_name, a.age AS artist_age,
+        v.work_id, w.name AS work_name, w.src AS src,
+        v.resource_id, r.name AS resource_name,
+        v.id AS variant_id, v.name AS variant_name,
+        v.tile_count, v.tile_bytes, v.completed
+    FROM variants v
+    LEFT JOIN works w ON w.artist_id = v.artist_id AND w.id = v.work_id
+    LEFT JOIN resources r ON r.artist_id = v.artist_id AND r.work_id = v.work_id AND r.id = v.resource_id
+    LEFT JOIN artists a ON a.id = v.artist_id;
+    """
+    TABLES = ("artists", "works", "resources", "variants", "catalog")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _executemany(self, sql: str, rows: Sequence[Tuple]) -> None:
+        if not rows:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(sql, rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---- 写入 ----
+
+    def import_artists(self, csv_path: Path, *, full: bool = False) -> bool:
+        """导入 artists.csv；文件未变化时跳过，返回是否重新导入。"""
+        if not csv_path.exists():
+            return False
+        stat = csv_path.stat()
+        signature = f"{stat.st_size}:{stat.st_mtime}"
+        if not full and self._signature(str(csv_path)) == signature:
+            return False
+        rows = []
+        with csv_path.open("r", encoding="utf-8-sig", newline="") as fp:
+            for row in csv.DictReader(fp):
+                artist_id = (row.get("Id") or "").strip()
+                if not artist_id:
+                    continue
+                try:
+                    works_count: Optional[int] = int(float(row.get("worksCount") or 0))
+                except ValueError:
+                    works_count = None
+                rows.append(
+                    (artist_id, row.get("name") or artist_id, row.get("age"), row.get("lifeTime"), row.get("homeTown"), works_count)
+                )
+        self._executemany("INSERT OR REPLACE INTO artists VALUES (?, ?, ?, ?, ?, ?)", rows)
+        self._set_signature(str(csv_path), signature)
+        return True
+
+    def upsert_works(self, artist_id: str, src: str, rows: Iterable[Tuple[str, str]]) -> None:
+        self._executemany(
+            "INSERT INTO works VALUES (?, ?, ?, ?) ON CONFLICT(artist_id, id) DO UPDATE SET src = excluded.src, name = excluded.name",
+            [(artist_id, work_id, src, name) for work_id, name in rows],
+        )
+
+    def upsert_resources(self, artist_id: str, work_id: str, rows: Iterable[Tuple[str, str]]) -> None:
+        self._executemany(
+            "INSERT INTO resources VALUES (?, ?, ?, ?) ON CONFLICT(artist_id, work_id, id) DO UPDATE SET name = excluded.name",
+            [(artist_id, work_id, resource_id, name) for resource_id, name in rows],
+        )
+
+    def upsert_variants(self, artist_id: str, work_id: str, resource_id: str, rows: Iterable[Tuple[str, str]]) -> None:
+        """写入资源的完整子资源列表(来自 getResource 或 resource.json)，并记下该列表供 listed_variants 使用。"""
+        rows = list(rows)
+        self._executemany(
+            "INSERT INTO variants(artist_id, work_id, resource_id, id, name) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(artist_id, work_id, resource_id, id) DO UPDATE SET name = excluded.name",
+            [(artist_id, work_id, resource_id, variant_id, name) for variant_id, name in rows],
+        )
+        if rows:
+            self._set_signature(_variant_list_key(artist_id, work_id, resource_id), json.dumps([variant_id for variant_id, _ in rows]))
+
+    def record_tiles(
+        self,
+        artist_id: str,
+        work_id: str,
+        resource_id: str,
+        variant_id: str,
+        tile_count: int,
+        tile_bytes: int,
+        completed: Optional[float] = None,
+    ) -> None:
+        self._executemany(
+            "INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(artist_id, work_id, resource_id, id) DO UPDATE SET "
+            "tile_count = excluded.tile_count, tile_bytes = excluded.tile_bytes, completed = excluded.completed",
+            [(artist_id, work_id, resource_id, variant_id, variant_id, tile_count, tile_bytes, completed)],
+        )
+
+    # ---- 查询 ----
+
+    def work_names(self, artist_id: str) -> Dict[str, str]:
+        rows = self._conn().execute("SELECT id, name FROM works WHERE artist_id = ?", (artist_id,))
+        return {work_id: name or work_id for work_id, name in rows}
+
+    def resource_names(self, artist_id: str, work_id: str) -> Dict[str, str]:
+        rows = self._conn().execute("SELECT id, name FROM resources WHERE artist_id = ? AND work_id = ?", (artist_id, work_id))
+        return {resource_id: name or resource_id for resource_id, name in rows}
+
+    def variant_names(self, artist_id: str, work_id: str, resource_id: str) -> Dict[str, str]:
+        rows = self._conn().execute(
+            "SELECT id, name FROM variants WHERE artist_id = ? AND work_id = ? AND resource_id = ?",
+            (artist_id, work_id, resource_id),
+        )
+        return {variant_id: name or variant_id for variant_id, name in rows}
+
+    def listed_variants(self, artist_id: str, work_id: str, resource_id: str) -> Optional[List[str]]:
+        """返回 upsert_variants 记下的完整子资源列表；只由 record_tiles 零散写入过的资源返回 None。"""
+        signature = self._signature(_variant_list_key(artist_id, work_id, resource_id))
+        return json.loads(signature) if signature else None
+
+    # ---- 从原始数据增量重建 ----
+
+    def _signature(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT signature FROM sources WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_signature(self, key: str, signature: str) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (key, signature))
+
+    def _changed_metadata(self, storage: StorageBackend, key: str, full: bool) -> Tuple[Optional[object], Optional[str]]:
+        """元数据签名变化时返回 (解析结果, 新签名)，未变化或不存在时返回 (None, None)。"""
+        actual = metadata_store.find(storage, key)
+        if actual is None:
+            return None, None
+        stat = storage.stat(actual)
+        signature = f"{actual}:{stat[0]}:{stat[1]}" if stat else actual
+        if not full and self._signature(key) == signature:
+            return None, None
+        try:
+            return metadata_store.decode(actual, storage.read_bytes(actual)), signature
+        except (OSError, ValueError) as exc:
+            logger.warning("解析 %s 失败: %s", actual, exc)
+            return None, None
+
+    def index_artist(self, storage: StorageBackend, artist_id: str, *, full: bool = False) -> None:
+        """按签名增量索引一位艺术家：只解析变化过的元数据，只重新统计未完成子资源的瓦片。"""
+        artist_key = join(RAW_PREFIX, artist_id)
+        for file_name, src in WORK_LISTS:
+            key = join(artist_key, file_name)
+            payload, signature = self._changed_metadata(storage, key, full)
+            if signature is not None:
+                self.upsert_works(artist_id, src, work_names(payload))
+                self._set_signature(key, signature)
+
+        for work_id in storage.list_dir(artist_key)[0]:
+            work_key = join(artist_key, work_id)
+            key = join(work_key, "sub_list.json")
+            payload, signature = self._changed_metadata(storage, key, full)
+            if signature is not None:
+                self.upsert_resources(artist_id, work_id, resource_names(payload).items())
+                self._set_signature(key, signature)
+
+            resource_name_map = self.resource_names(artist_id, work_id)
+            for resource_id in storage.list_dir(work_key)[0]:
+                resource_key = join(work_key, resource_id)
+                key = join(resource_key, "resource.json")
+                payload, signature = self._changed_metadata(storage, key, full)
+                if signature is not None:
+                    data = payload.get("data") if isinstance(payload, dict) else None
+                    if isinstance(data, dict):
+                        variants = resource_variants(data, _source_of(data), resource_id, resource_name_map.get(resource_id, resource_id))
+                        self.upsert_variants(artist_id, work_id, resource_id, named_variants(data, variants))
+                    self._set_signature(key, signature)
+
+                for variant_id in storage.list_dir(resource_key)[0]:
+                    self._index_tiles(storage, artist_id, work_id, resource_id, variant_id, full)
+
+    def _index_tiles(self, storage: StorageBackend, artist_id: str, work_id: str, resource_id: str, variant_id: str, full: bool) -> None:
+        variant_key = join(RAW_PREFIX, artist_id, work_id, resource_id, variant_id)
+        flag_key = join(variant_key, COMPLETED_FLAG)
+        flag = storage.stat(flag_key)
+        signature = f"completed:{flag[1]}" if flag else None
+        # 已完成且标记未变的子资源瓦片不会再变化，不必重新列目录
+        if signature is not None and not full and self._signature(flag_key) == signature:
+            return
+        sizes = storage.file_sizes(join(variant_key, TILE_DIR_NAME))
+        self.record_tiles(
+            artist_id, work_id, resource_id, variant_id, len(sizes), sum(sizes.values()), flag[1] if flag else None
+        )
+        if signature is not None:
+            self._set_signature(flag_key, signature)
+
+    def refresh(
+        self,
+        storage: StorageBackend,
+        artist_ids: Optional[Iterable[str]] = None,
+        *,
+        artist_csv: Optional[Path] = None,
+        full: bool = False,
+    ) -> int:
+        if artist_csv is not None:
+            self.import_artists(artist_csv, full=full)
+        count = 0
+        for artist_id in artist_ids if artist_ids is not None else storage.list_dir(RAW_PREFIX)[0]:
+            self.index_artist(storage, artist_id, full=full)
+            count += 1
+        return count
+
+    def export_parquet(self, directory: Path) -> List[Path]:
+        """把各表与 catalog 视图导出为 Parquet 文件。"""
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:  # pragma: no cover - 可选依赖
+            raise RuntimeError("导出 Parquet 需要安装 pyarrow (pip install pyarrow)") from exc
+        directory.mkdir(parents=True, exist_ok=True)
+        written: List[Path] = []
+        for table in self.TABLES:
+            cursor = self._conn().execute(f"SELECT * FROM {table}")
+            columns = [column[0] for column in cursor.description]
+            data = {name: [] for name in columns}
+            for row in cursor:
+                for name, value in zip(columns, row):
+                    data[name].append(value)
+            path = directory / f"{table}.parquet"
+            pq.write_table(pa.table(data), path, compression="zstd")
+            written.append(path)
+        return written
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="构建/增量更新艺术家-作品-资源目录")
+    parser.add_argument("--storage", default=os.getenv("LTFC_STORAGE") or "data", help="原始数据所在的存储(同 LTFC_STORAGE)")
+    parser.add_argument("--artist-csv", type=Path, default=Path("data/artists.csv"), help="艺术家 CSV")
+    parser.add_argument("--catalog", type=Path, default=None, help="目录文件，默认为 LTFC_CATALOG 或 data/catalog.db")
+    parser.add_argument("--artist", action="append", default=None, metavar="ID", help="只索引指定艺术家，可重复")
+    parser.add_argument("--full", action="store_true", help="忽略文件签名，全部重新解析")
+    parser.add_argument("--parquet", type=Path, default=None, metavar="DIR", help="刷新后导出 Parquet 到该目录")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    args = parse_args(argv)
+    catalog = Catalog(args.catalog or catalog_path(Path("data")))
+    started = time.monotonic()
+    count = catalog.refresh(open_storage(args.storage), args.artist, artist_csv=args.artist_csv, full=args.full)
+    logger.info("已索引 %s 位艺术家，用时 %.1f 秒: %s", count, time.monotonic() - started, catalog.path)
+    if args.parquet is not None:
+        for path in catalog.export_parquet(args.parquet):
+            logger.info("已导出 %s", path)
+
+
+if __name__ == "__main__":
+    main()
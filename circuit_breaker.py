@@ -0,0 +1,139 @@
+"""API 限流的全局熔断/背压协调器。
+
+所有访问元数据接口的线程共享一个 `RateLimitCoordinator`：窗口内 Code=-11 的次数与比例
+超过阈值即判定为全局限流并断开(OPEN)，此时所有调用方一起暂停；冷却结束后进入半开
+(HALF_OPEN)，只放行少量探测请求，探测成功才恢复(CLOSED)，失败则以更长的冷却重新断开。
+瓦片请求走另一台主机，不经过这里。
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+OUTCOME_OK = "ok"
+OUTCOME_RATE_LIMITED = "rate_limited"
+OUTCOME_ERROR = "error"
+
+
+class RateLimitCoordinator:
+    def __init__(
+        self,
+        *,
+        window: float = 30.0,
+        trip_count: int = 5,
+        trip_ratio: float = 0.3,
+        base_cooldown: float = 5.0,
+        max_cooldown: float = 120.0,
+        half_open_probes: int = 1,
+        on_state_change: Optional[Callable[[str, str], None]] = None,
+    ):
+        self.window = window
+        self.trip_count = trip_count
+        self.trip_ratio = trip_ratio
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.half_open_probes = half_open_probes
+        self.on_state_change = on_state_change
+
+        self.state = CLOSED
+        self.trips = 0
+        self._events: Deque[Tuple[float, bool]] = deque()
+        self._limited_in_window = 0
+        self._consecutive_trips = 0
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+        self._cond = threading.Condition()
+
+    def _set_state(self, state: str) -> None:
+        previous, self.state = self.state, state
+        if previous == state:
+            return
+        if state == OPEN:
+            logger.warning("检测到全局限流，暂停元数据请求 %.1fs", self._open_until - time.monotonic())
+        elif state == HALF_OPEN:
+            logger.info("限流冷却结束，放行探测请求")
+        else:
+            logger.info("限流解除，恢复元数据请求")
+        if self.on_state_change is not None:
+            self.on_state_change(previous, state)
+        self._cond.notify_all()
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window
+        while self._events and self._events[0][0] < cutoff:
+            _, limited = self._events.popleft()
+            if limited:
+                self._limited_in_window -= 1
+
+    def _trip(self, now: float) -> None:
+        self._consecutive_trips += 1
+        self.trips += 1
+        cooldown = min(self.max_cooldown, self.base_cooldown * (2 ** (self._consecutive_trips - 1)))
+        self._open_until = now + cooldown
+        self._events.clear()
+        self._limited_in_window = 0
+        self._set_state(OPEN)
+
+    def acquire(self) -> bool:
+        """阻塞直到允许发起请求。返回值表示本次请求是否为半开状态下的探测请求。"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == CLOSED:
+                    return False
+                if self.state == OPEN:
+                    if now >= self._open_until:
+                        self._set_state(HALF_OPEN)
+                        continue
+                    self._cond.wait(self._open_until - now)
+                    continue
+                if self._probes_in_flight < self.half_open_probes:
+                    self._probes_in_flight += 1
+                    return True
+                self._cond.wait()
+
+    def release(self, probe: bool, outcome: str) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if probe:
+                self._probes_in_flight -= 1
+                if self.state == HALF_OPEN:
+                    if outcome == OUTCOME_OK:
+                        self._consecutive_trips = 0
+                        self._set_state(CLOSED)
+                    elif outcome == OUTCOME_RATE_LIMITED:
+                        self._trip(now)
+                    else:
+                        # 网络错误不说明限流是否解除，让出探测名额
+                        self._cond.notify_all()
+                    return
+            if self.state != CLOSED or outcome == OUTCOME_ERROR:
+                return
+            limited = outcome == OUTCOME_RATE_LIMITED
+            self._events.append((now, limited))
+            if limited:
+                self._limited_in_window += 1
+            self._prune(now)
+            if (
+                limited
+                and self._limited_in_window >= self.trip_count
+                and self._limited_in_window / len(self._events) >= self.trip_ratio
+            ):
+                self._trip(now)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._cond:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "open_for": max(0.0, self._open_until - time.monotonic()) if self.state == OPEN else 0.0,
+                "limited_in_window": self._limited_in_window,
+            }
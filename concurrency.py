@@ -0,0 +1,130 @@
+"""运行时自适应的请求并发控制。
+
+`ConcurrencyController` 维护一个可调上限的并发槽：每个网络请求先占槽再发出。后台线程按
+固定周期统计窗口内的吞吐、错误率与限流信号做爬山调整：
+
+- 出现限流(-11 / 熔断未闭合) 时按比例回退；
+- 错误率超过阈值时小步回退；
+- 槽位被占满且吞吐没有下降时小步上调；上调后吞吐明显变差则退回上一步。
+
+上限变化通过 `on_resize` 通知调用方，例如同步扩充会话池。
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from circuit_breaker import OUTCOME_ERROR, OUTCOME_OK, OUTCOME_RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyController:
+    def __init__(
+        self,
+        *,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        interval: float = 10.0,
+        step: int = 2,
+        backoff: float = 0.7,
+        error_threshold: float = 0.1,
+        on_resize: Optional[Callable[[int], None]] = None,
+        under_pressure: Optional[Callable[[], bool]] = None,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(self.maximum, max(self.minimum, initial))
+        self.interval = interval
+        self.step = step
+        self.backoff = backoff
+        self.error_threshold = error_threshold
+        self.on_resize = on_resize
+        self.under_pressure = under_pressure
+
+        self.in_flight = 0
+        self._peak_in_flight = 0
+        self._counts: Dict[str, int] = {OUTCOME_OK: 0, OUTCOME_ERROR: 0, OUTCOME_RATE_LIMITED: 0}
+        self._last_throughput = 0.0
+        self._last_action = "hold"
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify()
+
+    def record(self, outcome: str) -> None:
+        with self._cond:
+            self._counts[outcome] = self._counts.get(outcome, 0) + 1
+
+    def start(self) -> "ConcurrencyController":
+        self._thread = threading.Thread(target=self._run, name="concurrency-controller", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self._adjust()
+            except Exception as exc:
+                logger.warning("并发控制器调整失败: %s", exc)
+
+    def _adjust(self) -> None:
+        with self._cond:
+            counts, self._counts = self._counts, {key: 0 for key in self._counts}
+            peak, self._peak_in_flight = self._peak_in_flight, self.in_flight
+            current = self.limit
+        total = sum(counts.values())
+        throughput = counts[OUTCOME_OK] / self.interval
+        error_rate = counts[OUTCOME_ERROR] / total if total else 0.0
+
+        if counts[OUTCOME_RATE_LIMITED] or (self.under_pressure is not None and self.under_pressure()):
+            target, action = int(current * self.backoff), "backoff"
+        elif error_rate > self.error_threshold:
+            target, action = current - self.step, "decrease"
+        elif self._last_action == "increase" and throughput < self._last_throughput * 0.8:
+            # 上一步扩容后吞吐反而明显下降，说明已越过拐点
+            target, action = current - self.step, "revert"
+        elif peak >= current and throughput >= self._last_throughput * 0.95:
+            target, action = current + self.step, "increase"
+        else:
+            target, action = current, "hold"
+
+        target = min(self.maximum, max(self.minimum, target))
+        self._last_throughput = throughput
+        self._last_action = action if target != current else "hold"
+        if target == current:
+            return
+        with self._cond:
+            self.limit = target
+            self._cond.notify_all()
+        logger.info(
+            "并发上限 %s -> %s (%s, 吞吐 %.1f/s, 错误率 %.1f%%, 限流 %s)",
+            current,
+            target,
+            action,
+            throughput,
+            error_rate * 100,
+            counts[OUTCOME_RATE_LIMITED],
+        )
+        if self.on_resize is not None:
+            self.on_resize(target)
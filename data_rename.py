@@ -1,11 +1,19 @@
 import csv
-import json
+import io
 import logging
+import os
 import re
-import shutil
+import tempfile
+import threading
+import time
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import metadata_store
+from catalog import Catalog, catalog_path
+from profiling import PROFILER, start_from_env as start_profiling
+from storage import LocalStorage, StorageBackend, join, open_storage
 
 try:
     from PIL import Image
@@ -14,17 +22,34 @@ except ImportError as exc:  # pragma: no cover - 运行前检查依赖
     raise SystemExit("需要安装 Pillow 库 (pip install Pillow)") from exc
 
 
-RAW_DATA_DIR = Path("data/rawdata")
-CLEANED_DATA_DIR = Path("data/cleanedData")
-ARTIST_CSV = Path("data/artists.csv")
+DATA_DIR = Path("data")
+# 与 get_together 共用 LTFC_STORAGE：原始瓦片从该后端读取，整理结果也写回该后端
+STORAGE_URL = os.getenv("LTFC_STORAGE")
+RAW_PREFIX = "rawdata"
+CLEANED_PREFIX = "cleanedData"
+ARTIST_CSV = DATA_DIR / "artists.csv"
 MERGED_TILE_NAME = "merged.jpg"
 TILE_PATTERN = re.compile(r"^(?P<x>\d+)_(?P<y>\d+)\.(?P<ext>jpg|jpeg|png)$", re.IGNORECASE)
 INVALID_FS_CHARS = re.compile(r'[\\/:*?"<>|]')
 MAX_PIXELS_WARNING = 300_000_000  # 超过该像素数提示可能内存不足
+PROFILE_DIR = Path("data/profile")
 
 logger = logging.getLogger("data_rename")
 logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
 
+STORAGE: StorageBackend = open_storage(STORAGE_URL) if STORAGE_URL else LocalStorage(DATA_DIR)
+_CATALOG: Optional[Catalog] = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def open_catalog() -> Catalog:
+    """名称映射从统一目录查询，不再逐个解析 JSON；目录在首次使用时才打开。"""
+    global _CATALOG
+    with _CATALOG_LOCK:
+        if _CATALOG is None:
+            _CATALOG = Catalog(catalog_path(DATA_DIR))
+        return _CATALOG
+
 
 def sanitize_name(name: str, fallback: str) -> str:
     candidate = INVALID_FS_CHARS.sub("_", name).strip()
@@ -58,161 +83,137 @@ def load_artist_names(csv_path: Path) -> Dict[str, str]:
     return mapping
 
 
-def load_work_name_map(artist_dir: Path) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    for file_name in ("all_huia_of_artist.json", "all_sufa_of_artist.json"):
-        json_path = artist_dir / file_name
-        if not json_path.exists():
-            continue
-        try:
-            payload = json.loads(json_path.read_text(encoding="utf-8"))
-        except json.JSONDecodeError as exc:
-            logger.warning("解析 %s 失败: %s", json_path, exc)
-            continue
-        for item in payload.get("data", []):
-            if not isinstance(item, dict):
-                continue
-            work_id = item.get("Id")
-            work_name = item.get("name") or item.get("title") or work_id
-            if work_id:
-                mapping[work_id] = work_name or work_id
-    return mapping
-
-
-def _collect_named_entries(container: Iterable) -> List[Tuple[str, str]]:
-    results: List[Tuple[str, str]] = []
-    for entry in container:
-        if isinstance(entry, dict):
-            candidate_id = entry.get("Id") or entry.get("id") or entry.get("resourceId")
-            candidate_name = entry.get("name") or entry.get("title") or entry.get("resourceName")
-            if candidate_id:
-                results.append((candidate_id, candidate_name or candidate_id))
-            for key in ("suha", "sufa", "hdp", "hdpic", "resource", "pic"):
-                nested = entry.get(key)
-                if isinstance(nested, dict):
-                    nested_id = nested.get("Id") or nested.get("id") or nested.get("resourceId")
-                    nested_name = nested.get("name") or nested.get("title") or nested.get("resourceName")
-                    if nested_id:
-                        results.append((nested_id, nested_name or nested_id))
-                elif isinstance(nested, list):
-                    results.extend(_collect_named_entries(nested))
-        elif isinstance(entry, list):
-            results.extend(_collect_named_entries(entry))
-    return results
-
-
-def load_resource_name_map(sub_list_path: Path) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    if not sub_list_path.exists():
-        return mapping
-    try:
-        payload = json.loads(sub_list_path.read_text(encoding="utf-8"))
-    except json.JSONDecodeError as exc:
-        logger.warning("解析 %s 失败: %s", sub_list_path, exc)
-        return mapping
-
-    data_section = payload.get("data", [])
-    collected = _collect_named_entries(data_section if isinstance(data_section, list) else [])
-
-    parent_data = payload.get("parentData")
-    if isinstance(parent_data, dict):
-        collected.extend(_collect_named_entries([parent_data]))
-
-    for resource_id, resource_name in collected:
-        mapping.setdefault(resource_id, resource_name)
-    return mapping
+def refresh_catalog(artist_id: str) -> None:
+    """增量刷新该艺术家在目录中的记录，只有变化过的元数据才会重新解析。"""
+    with PROFILER.stage("json_parse"):
+        open_catalog().index_artist(STORAGE, artist_id)
 
 
-def extract_variant_name_map(resource_json_path: Path) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    if not resource_json_path.exists():
-        return mapping
-    try:
-        payload = json.loads(resource_json_path.read_text(encoding="utf-8"))
-    except json.JSONDecodeError as exc:
-        logger.warning("解析 %s 失败: %s", resource_json_path, exc)
-        return mapping
-
-    data = payload.get("data")
-    if not isinstance(data, dict):
-        return mapping
-
-    for key in ("suha", "sufa"):
-        info = data.get(key)
-        if not isinstance(info, dict):
-            continue
-        hdp_info = info.get("hdp")
-        other_hdps = info.get("otherHdps") or []
-        mapping.update(_extract_from_hdp(hdp_info))
-        mapping.update(_extract_from_hdp_collection(other_hdps))
-    return mapping
+def copy_file(src_key: str, dst_key: str) -> None:
+    with PROFILER.stage("copy"):
+        STORAGE.copy(src_key, dst_key)
 
 
-def _extract_from_hdp(hdp_info: Optional[dict]) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    if not isinstance(hdp_info, dict):
-        return mapping
-    hdpic = hdp_info.get("hdpic")
-    if isinstance(hdpic, dict):
-        rid = hdpic.get("resourceId")
-        name = hdpic.get("name") or hdpic.get("title")
-        if rid:
-            mapping[rid] = name or rid
-    hdpcoll = hdp_info.get("hdpcoll")
-    if isinstance(hdpcoll, dict):
-        for item in hdpcoll.get("hdps", []):
-            if not isinstance(item, dict):
-                continue
-            rid = item.get("resourceId")
-            name = item.get("name") or item.get("title")
-            if rid:
-                mapping[rid] = name or rid
-    return mapping
+def copy_metadata(src_key: str, dst_dir_key: str) -> None:
+    """复制元数据文件，保留实际落盘的压缩后缀。"""
+    actual = metadata_store.find(STORAGE, src_key)
+    if actual is not None:
+        copy_file(actual, join(dst_dir_key, actual.rsplit("/", 1)[-1]))
 
 
-def _extract_from_hdp_collection(items: Iterable) -> Dict[str, str]:
-    mapping: Dict[str, str] = {}
-    for item in items or []:
-        if not isinstance(item, dict):
-            continue
-        rid = item.get("resourceId")
-        name = item.get("name") or item.get("title")
-        if rid:
-            mapping[rid] = name or rid
-    return mapping
+def ensure_dir(key: str) -> None:
+    """本地存储上照旧建出目标目录(即使最终为空)；对象存储没有目录概念，不做处理。"""
+    local_path = STORAGE.local_path(key)
+    if local_path is not None:
+        local_path.mkdir(parents=True, exist_ok=True)
 
 
-def copy_file(src: Path, dst: Path) -> None:
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    shutil.copy2(src, dst)
+def open_tile(key: str, storage: Optional[StorageBackend] = None) -> Image.Image:
+    storage = storage or STORAGE
+    local_path = storage.local_path(key)
+    if local_path is not None:
+        return Image.open(local_path)
+    return Image.open(io.BytesIO(storage.read_bytes(key)))
 
 
-def merge_tiles(tile_dir: Path, output_path: Path) -> None:
-    tile_files = [p for p in tile_dir.iterdir() if p.is_file() and TILE_PATTERN.match(p.name)]
-    if not tile_files:
-        logger.info("目录 %s 中没有可合并的瓦片", tile_dir)
+def _save_image(image: Image.Image, output_key: str) -> None:
+    local_path = STORAGE.local_path(output_key)
+    if local_path is not None:
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        image.save(local_path, quality=95)
         return
-
-    coords = []
-    for tile in tile_files:
-        match = TILE_PATTERN.match(tile.name)
-        if not match:
-            continue
-        x = int(match.group("x"))
-        y = int(match.group("y"))
-        coords.append((x, y, tile))
-
-    if not coords:
-        logger.info("目录 %s 中未匹配到有效瓦片命名", tile_dir)
+    # 对象存储：先写本地临时文件，再分段上传
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = Path(tmp_dir) / output_key.rsplit("/", 1)[-1]
+        image.save(tmp_path, quality=95)
+        STORAGE.upload_file(tmp_path, output_key)
+
+
+class TileGrid:
+    """一个 tile 目录的瓦片网格：(x, y) -> 瓦片键，以及标准瓦片尺寸与整幅图像尺寸。
+
+    最右一列、最下一行的瓦片可能小于标准瓦片，整幅尺寸按实际边缘瓦片计算。
+    """
+
+    def __init__(
+        self,
+        tile_dir: str,
+        tiles: Dict[Tuple[int, int], str],
+        tile_width: int,
+        tile_height: int,
+        width: int,
+        height: int,
+    ):
+        self.tile_dir = tile_dir
+        self.tiles = tiles
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.width = width
+        self.height = height
+
+    @property
+    def columns(self) -> int:
+        return -(-self.width // self.tile_width)
+
+    @property
+    def rows(self) -> int:
+        return -(-self.height // self.tile_height)
+
+
+def parse_tile_name(name: str) -> Optional[Tuple[int, int]]:
+    match = TILE_PATTERN.match(name)
+    if not match:
+        return None
+    return int(match.group("x")), int(match.group("y"))
+
+
+def _tile_size(key: str, storage: Optional[StorageBackend]) -> Optional[Tuple[int, int]]:
+    try:
+        with open_tile(key, storage) as img:  # 只读文件头，不解码像素
+            return img.size
+    except OSError as exc:
+        logger.warning("读取瓦片 %s 尺寸失败: %s", key, exc)
+        return None
+
+
+def scan_tiles(tile_dir: str, storage: Optional[StorageBackend] = None) -> Optional[TileGrid]:
+    """扫描 tile 目录并确定网格几何，目录中没有有效瓦片时返回 None；storage 默认为 STORAGE。"""
+    with PROFILER.stage("fs_scan"):
+        _, file_names = (storage or STORAGE).list_dir(tile_dir)
+    tiles: Dict[Tuple[int, int], str] = {}
+    for name in file_names:
+        coord = parse_tile_name(name)
+        if coord is not None:
+            tiles[coord] = join(tile_dir, name)
+    if not tiles:
+        return None
+
+    first = tiles[min(tiles)]
+    size = _tile_size(first, storage)
+    if size is None:
+        return None
+    tile_w, tile_h = size
+    max_x = max(x for x, _ in tiles)
+    max_y = max(y for _, y in tiles)
+    # 边缘瓦片缺失时按标准尺寸估算
+    last_column = next((key for (x, _), key in tiles.items() if x == max_x), None)
+    last_row = next((key for (_, y), key in tiles.items() if y == max_y), None)
+    edge_w = (_tile_size(last_column, storage) or size)[0] if last_column else tile_w
+    edge_h = (_tile_size(last_row, storage) or size)[1] if last_row else tile_h
+    return TileGrid(tile_dir, tiles, tile_w, tile_h, max_x * tile_w + edge_w, max_y * tile_h + edge_h)
+
+
+def merge_tiles(tile_dir: str, output_key: str) -> None:
+    grid = scan_tiles(tile_dir)
+    if grid is None:
+        logger.info("目录 %s 中没有可合并的瓦片", tile_dir)
         return
 
-    coords.sort()
-    with Image.open(coords[0][2]) as first_tile:
-        tile_w, tile_h = first_tile.size
-    max_x = max(x for x, _, _ in coords)
-    max_y = max(y for _, y, _ in coords)
-    final_width = (max_x + 1) * tile_w
-    final_height = (max_y + 1) * tile_h
+    coords = sorted((x, y, key) for (x, y), key in grid.tiles.items())
+    tile_w, tile_h = grid.tile_width, grid.tile_height
+    # 合并图保持原有几何：画布按整块瓦片计算，不按边缘瓦片的实际尺寸裁剪
+    final_width = (max(x for x, _, _ in coords) + 1) * tile_w
+    final_height = (max(y for _, y, _ in coords) + 1) * tile_h
     total_pixels = final_width * final_height
 
     if total_pixels > MAX_PIXELS_WARNING:
@@ -223,92 +224,132 @@ def merge_tiles(tile_dir: Path, output_path: Path) -> None:
             total_pixels / 1_000_000,
         )
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
     canvas = Image.new("RGB", (final_width, final_height), color=(255, 255, 255))
     for x, y, tile_file in coords:
         try:
-            with Image.open(tile_file) as img:
+            with PROFILER.stage("tile_decode"), open_tile(tile_file) as img:
                 canvas.paste(img.convert("RGB"), (x * tile_w, y * tile_h))
         except OSError as exc:
             logger.warning("读取瓦片 %s 失败: %s", tile_file, exc)
-    canvas.save(output_path, quality=95)
-    logger.info("已生成合并图像: %s", output_path)
-
-
-def process_artist(artist_dir: Path, artist_name_map: Dict[str, str], used_artist_names: Dict[str, int]) -> None:
-    artist_id = artist_dir.name
+    with PROFILER.stage("merge_save"):
+        _save_image(canvas, output_key)
+    logger.info("已生成合并图像: %s", output_key)
+
+
+def iter_variants(artist_ids: List[str], artist_name_map: Dict[str, str]) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """遍历 rawdata 中所有带 tile 子目录的子资源，返回 (tile 目录键, 元数据)。"""
+    for artist_id in artist_ids:
+        artist_key = join(RAW_PREFIX, artist_id)
+        refresh_catalog(artist_id)
+        catalog = open_catalog()
+        work_name_map = catalog.work_names(artist_id)
+        work_ids, _ = STORAGE.list_dir(artist_key)
+        for work_id in work_ids:
+            work_key = join(artist_key, work_id)
+            resource_name_map = catalog.resource_names(artist_id, work_id)
+            resource_ids, _ = STORAGE.list_dir(work_key)
+            for resource_id in resource_ids:
+                resource_key = join(work_key, resource_id)
+                variant_name_map = catalog.variant_names(artist_id, work_id, resource_id)
+                variant_ids, _ = STORAGE.list_dir(resource_key)
+                for variant_id in variant_ids:
+                    child_key = join(resource_key, variant_id)
+                    child_dirs, _ = STORAGE.list_dir(child_key)
+                    if "tile" not in child_dirs:
+                        continue
+                    yield join(child_key, "tile"), {
+                        "artist_id": artist_id,
+                        "artist_name": artist_name_map.get(artist_id, artist_id),
+                        "work_id": work_id,
+                        "work_name": work_name_map.get(work_id, work_id),
+                        "resource_id": resource_id,
+                        "resource_name": resource_name_map.get(resource_id, resource_id),
+                        "variant_id": variant_id,
+                        "variant_name": variant_name_map.get(variant_id, variant_id),
+                    }
+
+
+def process_artist(artist_id: str, artist_name_map: Dict[str, str], used_artist_names: Dict[str, int]) -> None:
+    artist_key = join(RAW_PREFIX, artist_id)
     artist_display = artist_name_map.get(artist_id, artist_id)
     sanitized_artist = sanitize_name(artist_display, artist_id)
     artist_folder_name = ensure_unique(sanitized_artist, used_artist_names)
-    target_artist_dir = CLEANED_DATA_DIR / artist_folder_name
-    target_artist_dir.mkdir(parents=True, exist_ok=True)
+    target_artist_dir = join(CLEANED_PREFIX, artist_folder_name)
+    ensure_dir(target_artist_dir)
 
     for meta_name in ("all_huia_of_artist.json", "all_sufa_of_artist.json"):
-        src_meta = artist_dir / meta_name
-        if src_meta.exists():
-            copy_file(src_meta, target_artist_dir / meta_name)
+        copy_metadata(join(artist_key, meta_name), target_artist_dir)
 
-    work_name_map = load_work_name_map(artist_dir)
+    refresh_catalog(artist_id)
+    catalog = open_catalog()
+    work_name_map = catalog.work_names(artist_id)
     used_work_names: Dict[str, int] = defaultdict(int)
 
-    for work_dir in sorted(p for p in artist_dir.iterdir() if p.is_dir()):
-        work_id = work_dir.name
+    work_ids, _ = STORAGE.list_dir(artist_key)
+    for work_id in work_ids:
+        work_key = join(artist_key, work_id)
         work_display = work_name_map.get(work_id, work_id)
         work_name = ensure_unique(sanitize_name(work_display, work_id), used_work_names)
-        target_work_dir = target_artist_dir / work_name
-        target_work_dir.mkdir(parents=True, exist_ok=True)
+        target_work_dir = join(target_artist_dir, work_name)
+        ensure_dir(target_work_dir)
 
-        sub_list_path = work_dir / "sub_list.json"
-        if sub_list_path.exists():
-            copy_file(sub_list_path, target_work_dir / "sub_list.json")
-        resource_name_map = load_resource_name_map(sub_list_path)
+        sub_list_key = join(work_key, "sub_list.json")
+        copy_metadata(sub_list_key, target_work_dir)
+        resource_name_map = catalog.resource_names(artist_id, work_id)
         used_resource_names: Dict[str, int] = defaultdict(int)
 
-        for resource_dir in sorted(p for p in work_dir.iterdir() if p.is_dir()):
-            resource_id = resource_dir.name
+        resource_ids, _ = STORAGE.list_dir(work_key)
+        for resource_id in resource_ids:
+            resource_key = join(work_key, resource_id)
             resource_display = resource_name_map.get(resource_id, resource_id)
             resource_name = ensure_unique(sanitize_name(resource_display, resource_id), used_resource_names)
-            target_resource_dir = target_work_dir / resource_name
-            target_resource_dir.mkdir(parents=True, exist_ok=True)
+            target_resource_dir = join(target_work_dir, resource_name)
+            ensure_dir(target_resource_dir)
 
-            resource_json_path = resource_dir / "resource.json"
-            if resource_json_path.exists():
-                copy_file(resource_json_path, target_resource_dir / "resource.json")
-            variant_name_map = extract_variant_name_map(resource_json_path)
+            resource_json_key = join(resource_key, "resource.json")
+            copy_metadata(resource_json_key, target_resource_dir)
+            variant_name_map = catalog.variant_names(artist_id, work_id, resource_id)
             used_variant_names: Dict[str, int] = defaultdict(int)
 
-            for child_dir in sorted(p for p in resource_dir.iterdir() if p.is_dir()):
-                variant_id = child_dir.name
+            variant_ids, _ = STORAGE.list_dir(resource_key)
+            for variant_id in variant_ids:
                 variant_display = variant_name_map.get(variant_id, variant_id)
                 variant_name = ensure_unique(sanitize_name(variant_display, variant_id), used_variant_names)
-                target_variant_dir = target_resource_dir / variant_name
-                target_variant_dir.mkdir(parents=True, exist_ok=True)
+                target_variant_dir = join(target_resource_dir, variant_name)
+                ensure_dir(target_variant_dir)
 
-                tile_dir = child_dir / "tile"
-                if tile_dir.is_dir():
+                child_key = join(resource_key, variant_id)
+                child_dirs, _ = STORAGE.list_dir(child_key)
+                if "tile" in child_dirs:
+                    tile_dir = join(child_key, "tile")
                     try:
-                        merge_tiles(tile_dir, target_variant_dir / MERGED_TILE_NAME)
+                        merge_tiles(tile_dir, join(target_variant_dir, MERGED_TILE_NAME))
                     except Exception as exc:  # pragma: no cover - 捕获合并运行异常
                         logger.warning("合并 %s 瓦片失败: %s", tile_dir, exc)
                 else:
-                    logger.info("目录 %s 缺少 tile 子目录，跳过合并", child_dir)
+                    logger.info("目录 %s 缺少 tile 子目录，跳过合并", child_key)
 
 
 def main() -> None:
-    if not RAW_DATA_DIR.exists():
-        raise SystemExit(f"未找到原始数据目录: {RAW_DATA_DIR}")
+    artist_ids, _ = STORAGE.list_dir(RAW_PREFIX)
+    # 本地存储上只有目录不存在才报错，空的 rawdata 照常处理；对象存储无法区分两者
+    raw_local = STORAGE.local_path(RAW_PREFIX)
+    if not (raw_local.is_dir() if raw_local is not None else artist_ids):
+        raise SystemExit(f"未找到原始数据目录: {RAW_PREFIX}")
     if not ARTIST_CSV.exists():
         raise SystemExit(f"未找到艺术家 CSV: {ARTIST_CSV}")
+    ensure_dir(CLEANED_PREFIX)
 
+    start_profiling(PROFILE_DIR / f"data_rename-{int(time.time())}")
     artist_name_map = load_artist_names(ARTIST_CSV)
-    CLEANED_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    open_catalog().import_artists(ARTIST_CSV)
 
     used_artist_names: Dict[str, int] = defaultdict(int)
-    for artist_dir in sorted(p for p in RAW_DATA_DIR.iterdir() if p.is_dir()):
-        logger.info("处理艺术家: %s", artist_dir.name)
-        process_artist(artist_dir, artist_name_map, used_artist_names)
+    for artist_id in artist_ids:
+        logger.info("处理艺术家: %s", artist_id)
+        process_artist(artist_id, artist_name_map, used_artist_names)
 
-    logger.info("处理完成，输出目录: %s", CLEANED_DATA_DIR.resolve())
+    logger.info("处理完成，输出位置: %s", CLEANED_PREFIX)
 
 
 if __name__ == "__main__":
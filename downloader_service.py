@@ -0,0 +1,317 @@
+"""常驻下载服务。
+
+进程启动时建好的会话池与 token 池在整个生命周期内复用，通过本地 HTTP/JSON 接口接收
+临时下载任务，省去每次冷启动重建代理池与 token 的开销。
+
+接口::
+
+    POST   /jobs        提交任务，返回 {"id": ...}
+    GET    /jobs        列出任务概要
+    GET    /jobs/<id>   查询单个任务的进度与预计剩余时间
+    DELETE /jobs/<id>   取消尚未开始的单元
+    GET    /health      会话池与 token 池状态
+
+任务体示例::
+
+    {
+        "artists": ["5df8a8c15e3be25e694d7134"],
+        "works": [{"artist_id": "...", "work_id": "...", "src": "SUHA"}],
+        "resources": [{"artist_id": "...", "work_id": "...", "resource_id": "...", "child_resource_id": "...", "src": "SUHA"}],
+        "regions": [{"artist_id": "...", "work_id": "...", "resource_id": "...", "child_resource_id": "...",
+                     "src": "SUHA", "x0": 0, "y0": 0, "x1": 8, "y1": 8}]
+    }
+"""
+
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from retry_policy import RetryLater
+
+logger = logging.getLogger(__name__)
+
+MAX_FINISHED_JOBS = 200
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class ServiceJob:
+    def __init__(self, spec: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = spec
+        self.status = QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.units_total = 0
+        self.units_done = 0
+        self.units_failed = 0
+        self.tiles_saved = 0
+        self.errors: List[str] = []
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def add_units(self, count: int) -> None:
+        with self._lock:
+            self.units_total += count
+
+    def finish_unit(self, *, failed: bool = False, error: Optional[str] = None, tiles: int = 0) -> bool:
+        """记录一个单元结束，返回整个任务是否已经全部结束。"""
+        with self._lock:
+            self.units_done += 1
+            self.tiles_saved += tiles
+            if failed:
+                self.units_failed += 1
+                if error and len(self.errors) < 20:
+                    self.errors.append(error)
+            if self.units_done < self.units_total:
+                return False
+            self.finished = time.time()
+            if self.cancelled:
+                self.status = CANCELLED
+            else:
+                self.status = FAILED if self.units_failed == self.units_total else DONE
+            return True
+
+    def to_dict(self, *, detail: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            now = self.finished or time.time()
+            elapsed = now - self.started if self.started else 0.0
+            eta = None
+            if self.status == RUNNING and self.units_done:
+                eta = round(elapsed / self.units_done * (self.units_total - self.units_done), 1)
+            result: Dict[str, Any] = {
+                "id": self.id,
+                "status": self.status,
+                "progress": round(self.units_done / self.units_total, 4) if self.units_total else 0.0,
+                "units_total": self.units_total,
+                "units_done": self.units_done,
+                "units_failed": self.units_failed,
+                "tiles_saved": self.tiles_saved,
+                "elapsed_seconds": round(elapsed, 1),
+                "eta_seconds": eta,
+            }
+            if detail:
+                result.update(spec=self.spec, errors=list(self.errors), created=self.created)
+            return result
+
+
+class DownloaderService:
+    """把任务拆成艺术家/作品/资源/区域单元，在共享线程池上执行。"""
+
+    def __init__(self, downloader, *, workers: Optional[int] = None):
+        self.downloader = downloader
+        self.executor = ThreadPoolExecutor(max_workers=workers or downloader.num, thread_name_prefix="service")
+        self.jobs: Dict[str, ServiceJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._bundle_counter = itertools.count()
+
+    def _bundle(self):
+        return self.downloader.pick_primary_bundle(next(self._bundle_counter))
+
+    def submit(self, spec: Dict[str, Any]) -> ServiceJob:
+        units: List[Callable[[ServiceJob], int]] = []
+        for artist_id in spec.get("artists", []) or []:
+            units.append(lambda job, a=str(artist_id): self._run_artist(job, a))
+        for work in spec.get("works", []) or []:
+            units.append(lambda job, w=dict(work): self._run_work(job, w))
+        for resource in spec.get("resources", []) or []:
+            units.append(lambda job, r=dict(resource): self._run_resource(job, r))
+        for region in spec.get("regions", []) or []:
+            units.append(lambda job, r=dict(region): self._run_region(job, r))
+        if not units:
+            raise ValueError("任务为空：需要 artists / works / resources / regions 之一")
+
+        job = ServiceJob(spec)
+        job.add_units(len(units))
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+            self._prune_finished()
+        job.status = RUNNING
+        job.started = time.time()
+        for unit in units:
+            self._schedule(job, unit)
+        logger.info("接收任务 %s: %s 个单元", job.id, len(units))
+        return job
+
+    def _prune_finished(self) -> None:
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda j: j.finished or 0)[:-MAX_FINISHED_JOBS]:
+            self.jobs.pop(job.id, None)
+
+    def _schedule(self, job: ServiceJob, unit: Callable[[ServiceJob], int]) -> None:
+        def _run() -> None:
+            if job.cancelled:
+                self._finish(job, failed=False)
+                return
+            try:
+                tiles = unit(job)
+            except RetryLater as retry:
+                # 仍有瓦片在冷却，到期后重新提交，不占用工作线程等待
+                timer = threading.Timer(retry.delay, self._schedule, (job, unit))
+                timer.daemon = True
+                timer.start()
+                return
+            except Exception as exc:
+                logger.exception("任务 %s 的单元执行失败: %s", job.id, exc)
+                self._finish(job, failed=True, error=str(exc))
+                return
+            self._finish(job, tiles=tiles)
+
+        self.executor.submit(_run)
+
+    def _finish(self, job: ServiceJob, **kwargs: Any) -> None:
+        if job.finish_unit(**kwargs):
+            logger.info("任务 %s 结束: %s", job.id, job.to_dict())
+
+    def _schedule_tasks(self, job: ServiceJob, tasks: List[Any]) -> None:
+        # 先登记新单元再调度，避免任务在展开过程中被误判为已完成
+        job.add_units(len(tasks))
+        for task in tasks:
+            self._schedule(job, lambda _job, t=task: self.downloader.fetch_resource_tiles(t))
+
+    def _run_artist(self, job: ServiceJob, artist_id: str) -> int:
+        status = self.downloader.process_artist(artist_id, *self._bundle())
+        if status not in ("completed", "empty"):
+            raise RuntimeError(f"艺术家 {artist_id} 未完成: {status}")
+        return 0
+
+    def _run_work(self, job: ServiceJob, spec: Dict[str, Any]) -> int:
+        artist_id = spec["artist_id"]
+        work = {"Id": spec["work_id"], "name": spec.get("work_name") or spec["work_id"]}
+        bundle, bundle_index = self._bundle()
+        tasks, _, _, _ = self.downloader.resolve_work(
+            artist_id,
+            self.downloader.artist_name(artist_id),
+            work,
+            spec.get("src", "SUHA"),
+            bundle,
+            bundle_index,
+        )
+        self._schedule_tasks(job, tasks)
+        return 0
+
+    def _run_resource(self, job: ServiceJob, spec: Dict[str, Any]) -> int:
+        bundle, bundle_index = self._bundle()
+        tasks = self.downloader.resource_tasks(
+            spec["artist_id"],
+            spec["work_id"],
+            spec["resource_id"],
+            spec.get("src", "SUHA"),
+            bundle,
+            bundle_index,
+            child_resource_id=spec.get("child_resource_id"),
+        )
+        self._schedule_tasks(job, tasks)
+        return 0
+
+    def _run_region(self, job: ServiceJob, spec: Dict[str, Any]) -> int:
+        bundle, bundle_index = self._bundle()
+        tasks = self.downloader.resource_tasks(
+            spec["artist_id"],
+            spec["work_id"],
+            spec["resource_id"],
+            spec.get("src", "SUHA"),
+            bundle,
+            bundle_index,
+            child_resource_id=spec.get("child_resource_id") or spec["resource_id"],
+        )
+        saved, failed = self.downloader.fetch_region(
+            tasks[0], int(spec.get("x0", 0)), int(spec.get("y0", 0)), int(spec["x1"]), int(spec["y1"])
+        )
+        if failed and not saved:
+            raise RuntimeError(f"区域内 {failed} 个瓦片全部下载失败")
+        return saved
+
+    def cancel(self, job_id: str) -> Optional[ServiceJob]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancelled = True
+        return job
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "primary_sessions": len(self.downloader.primary_sessions),
+            "secondary_sessions": len(self.downloader.secondary_sessions),
+            "token_pool": len(self.downloader.token_pool),
+            "jobs_running": sum(1 for job in self.jobs.values() if job.status == RUNNING),
+        }
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    server: "_ServiceServer"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - 覆盖基类签名
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _job_id(self) -> Optional[str]:
+        parts = [part for part in self.path.split("?", 1)[0].split("/") if part]
+        return parts[1] if len(parts) == 2 and parts[0] == "jobs" else None
+
+    def do_GET(self) -> None:
+        service = self.server.service
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/health":
+            self._send(200, service.health())
+        elif path == "/jobs":
+            self._send(200, [job.to_dict() for job in list(service.jobs.values())])
+        elif self._job_id():
+            job = service.jobs.get(self._job_id() or "")
+            self._send(200, job.to_dict(detail=True)) if job else self._send(404, {"error": "任务不存在"})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path.split("?", 1)[0].rstrip("/") != "/jobs":
+            self._send(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(spec, dict):
+                raise ValueError("任务体必须是 JSON 对象")
+            job = self.server.service.submit(spec)
+        except (ValueError, KeyError) as exc:
+            self._send(400, {"error": str(exc)})
+            return
+        self._send(202, job.to_dict())
+
+    def do_DELETE(self) -> None:
+        job = self.server.service.cancel(self._job_id() or "")
+        self._send(200, job.to_dict()) if job else self._send(404, {"error": "任务不存在"})
+
+
+class _ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    service: DownloaderService
+
+
+def serve(downloader, *, host: str = "127.0.0.1", port: int = 8765) -> None:
+    service = DownloaderService(downloader)
+    server = _ServiceServer((host, port), _ServiceHandler)
+    server.service = service
+    logger.info("下载服务已启动: http://%s:%s/jobs", host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,41 +1,106 @@
+import argparse
 import hashlib
-import json
+import itertools
 import logging
 import math
 import subprocess
 import os
 import re
+import threading
 import time
 import urllib.parse
-from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED
-from dataclasses import dataclass
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, TypeVar
 
 import coloredlogs
-import pandas as pd
 import requests
-from faker import Faker
 from tqdm import tqdm
 
+from artist_index import ArtistIndex
+from catalog import Catalog, catalog_path, named_variants, resource_names, resource_variants, work_names
+from concurrency import ConcurrencyController
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, OUTCOME_ERROR, OUTCOME_OK, OUTCOME_RATE_LIMITED, RateLimitCoordinator
+from hedging import HEDGE_WON, NOT_HEDGED, Hedger, LatencyTracker
+import metadata_store
+from job_queue import FAILED, Job, JobQueue, QueueWorker, open_job_queue
+from metrics import REGISTRY, SnapshotWriter, start_http_server
+from profiling import PROFILER, start_from_env as start_profiling
+from proxy_leases import ProxyLeaseManager
+from session_cache import SessionCache, parse_deadline
+from sharding import ShardManifest, manifest_name, merge_manifests, parse_shard, select_shard
+from retry_policy import DeferredQueue, RetryBudget, RetryEngine, RetryLater, RetryPolicy
+from storage import LocalStorage, StorageBackend, open_storage
+from tile_writer import TileWriter
+from trace_log import ProgressSummary, TraceWriter, install_async_logging
+from traffic_limits import TrafficLimiter, parse_host_map, parse_size
+
 USE_PROXY = True
 ONE_IMAGE_PER_WORK = False
 
-ua = Faker()
+# faker 导入与初始化较慢，首次建会话时才生成一批 UA，之后轮流取用
+USER_AGENT_POOL_SIZE = 64
+_USER_AGENTS: List[str] = []
+_USER_AGENT_COUNTER = itertools.count()
+_USER_AGENT_LOCK = threading.Lock()
 
+API_HOST = "api.quanku.art"
 ACCESS_TOKEN_URL = "https://api.quanku.art/cag2.TouristService/getAccessToken"
 ALL_HUIA_OF_ARTIST_URL = "https://api.quanku.art/cag2.ArtistService/listHuiaOfArtist"
 ALL_SUFA_OF_ARTIST_URL = "https://api.quanku.art/cag2.ArtistService/listSufaOfArtist"
 SUB_LIST_URL = "https://api.quanku.art/cag2.ResourceService/getSubList"
 RESOURCE_ID_URL = "https://api.quanku.art/cag2.ResourceService/getResource"
 BASE_TILE_URL = "https://cag.ltfc.net/cagstore/{resource_id}/17/{x}_{y}.jpg"
+# 可指向 utils/proxy_simulator.py 启动的本地模拟器，用于压测代理轮换
+PROXY_ALLOCATE_URL = os.getenv("QINGGOU_ALLOCATE_URL", "https://proxy.qg.net/allocate")
 
 OUTPUT_DIR = Path(__file__).resolve().parent / "data"
 RAWDATA_DIR = OUTPUT_DIR / "rawdata"
+MANIFEST_DIR = OUTPUT_DIR / "manifests"
+ARTIST_CSV = OUTPUT_DIR / "artists.csv"
+# 瓦片、完成标记与元数据的落盘位置，默认即 OUTPUT_DIR；可设为 s3://bucket/prefix 直接写入对象存储
+STORAGE_URL = os.getenv("LTFC_STORAGE")
 
 DEFAULT_TIMEOUT = 20
-JSON_RETRY_DELAYS = (1.0, 2.0, 4.0)
-TILE_RETRY_DELAYS = (1.0, 2.5, 4.5)
+
+METRICS_PORT = int(os.getenv("LTFC_METRICS_PORT", "0"))  # 0 表示不启动 HTTP 指标端点
+METRICS_SNAPSHOT_PATH = OUTPUT_DIR / "metrics.json"
+METRICS_SNAPSHOT_INTERVAL = 30
+
+TRACE_LOG_PATH = os.getenv("LTFC_TRACE_LOG")  # 设置后把每个 HTTP 请求追加写入该 JSONL 文件
+ASYNC_LOGGING = True
+TILE_LOG_SUMMARY_INTERVAL = 30
+
+# 瓦片落盘交给独立写线程，网络线程不再被磁盘延迟拖住；TILE_WRITER_THREADS=0 时在网络线程同步写
+TILE_WRITER_THREADS = int(os.getenv("LTFC_TILE_WRITERS", "2"))
+TILE_WRITER_QUEUE = 256
+TILE_WRITER_BATCH = 32
+
+PROFILE_DIR = OUTPUT_DIR / "profile"
+
+# 跨重启复用 token 与未到期的代理租约，避免每次启动都集中调用 getAccessToken
+SESSION_CACHE_ENABLED = os.getenv("LTFC_SESSION_CACHE", "1") != "0"
+SESSION_CACHE_PATH = OUTPUT_DIR / "session_cache.json"
+TOKEN_DEFAULT_TTL = 1800.0
+PROXY_LEASE_MARGIN = 30.0
+PROXY_VALIDATE_TIMEOUT = 5
+
+# 代理按分配次数计费：健康且未到期的 IP 在主/备会话池之间复用，不足时才批量分配
+PROXY_ALLOCATE_BATCH = 3
+PROXY_DEFAULT_LEASE = 60.0
+PROXY_MAX_FAILURES = 3
+
+# 瓦片调度：affinity 让连续的一段瓦片固定走同一会话以复用 keep-alive 连接；round_robin 为逐瓦片轮换
+TILE_SCHEDULING = os.getenv("LTFC_TILE_SCHEDULING", "affinity")
+TILE_AFFINITY_BLOCK = 16
+
+# 瓦片对冲请求：耗时超过近期 p95 后经另一备用会话重发，对冲量不超过瓦片请求的 TILE_HEDGE_RATIO
+TILE_HEDGING = os.getenv("LTFC_TILE_HEDGE", "0") == "1"
+TILE_HEDGE_PERCENTILE = 0.95
+TILE_HEDGE_MIN_DELAY = 0.5
+TILE_HEDGE_RATIO = 0.05
 
 _CAG_HOST = "b49b4d8a45b8f098ba881d98abbb5c892f8b5c98"
 _RT_PATTERN = re.compile(r"^(http.*//[^/]*)(/.*\.(jpg|jpeg))\?*(.*)$", re.IGNORECASE)
@@ -45,6 +110,36 @@ _BUCKET_MS = 31_536_000_000  # 对应 31536e6
 _MULTIPLIER = 31_536_000  # 对应 31536e3
 MAX_PROXY_RETRIES = 5
 
+# 指数退避 + 抖动，取代固定的重试间隔；重试总量受 RETRY_BUDGET_RATIO 约束
+JSON_RETRY_POLICY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0)
+TILE_RETRY_POLICY = RetryPolicy(max_attempts=3 if USE_PROXY else 1, base_delay=1.0, max_delay=8.0)
+TILE_NOT_IMAGE_POLICY = RetryPolicy(max_attempts=3 if USE_PROXY else 1, base_delay=0.5, max_delay=2.0)
+RATE_LIMIT_POLICY = RetryPolicy(max_attempts=MAX_PROXY_RETRIES, base_delay=0.0, max_delay=0.0, jitter="none")
+PROXY_AUTH_POLICY = RetryPolicy(max_attempts=MAX_PROXY_RETRIES, base_delay=0.0, max_delay=0.0, jitter="none")
+RETRY_BUDGET_RATIO = 0.2
+TILE_MAX_UNRESOLVED_RUN = 3  # 一列中连续这么多个瓦片都未能确定结果时，按列尾处理
+
+# 全局限流熔断：窗口内 -11 达到次数与比例阈值后，所有元数据请求一起暂停，冷却后半开探测
+RATE_LIMIT_WINDOW = 30.0
+RATE_LIMIT_TRIP_COUNT = 5
+RATE_LIMIT_TRIP_RATIO = 0.3
+RATE_LIMIT_BASE_COOLDOWN = 5.0
+RATE_LIMIT_MAX_COOLDOWN = 120.0
+
+# 自适应并发(--autoscale)：在 [AUTOSCALE_MIN, AUTOSCALE_MAX] 内按吞吐、错误率与限流信号调整在途请求数
+AUTOSCALE_MIN = 2
+AUTOSCALE_MAX = 40
+AUTOSCALE_INTERVAL = 10.0
+AUTOSCALE_STEP = 2
+
+# 全局/按主机的在途请求数与带宽(字节/秒)上限，0 或留空表示不限制。
+# 主机名同时匹配其子域名，"ltfc.net=32" 同时限制 cag.ltfc.net(绘画)与 cag-ac.ltfc.net(书法)瓦片。
+# 例: LTFC_HOST_IN_FLIGHT="ltfc.net=32,api.quanku.art=8" LTFC_BANDWIDTH=20M
+MAX_IN_FLIGHT = int(os.getenv("LTFC_MAX_IN_FLIGHT", "0"))
+HOST_IN_FLIGHT = {host: int(value) for host, value in parse_host_map(os.getenv("LTFC_HOST_IN_FLIGHT", "")).items()}
+BANDWIDTH_LIMIT = parse_size(os.getenv("LTFC_BANDWIDTH", "0"))
+HOST_BANDWIDTH = {host: parse_size(value) for host, value in parse_host_map(os.getenv("LTFC_HOST_BANDWIDTH", "")).items()}
+
 T = TypeVar("T")
 KEY = "YOUR_TOKEN_HERE"
 
@@ -56,6 +151,45 @@ class RateLimitError(RuntimeError):
     """请求过于频繁，需要更换 token。"""
 
 
+class TileNotImage(RuntimeError):
+    """瓦片接口返回了非图片响应，通常意味着坐标越界。"""
+
+
+class TileServerError(RuntimeError):
+    """瓦片接口返回 5xx/429，属于暂时性失败。"""
+
+
+class TileGaveUp(RuntimeError):
+    """瓦片重试次数或重试预算用尽后放弃；与越界(返回 None)不同，该瓦片应视为缺失。"""
+
+
+API_RETRY = RetryEngine(
+    {
+        requests.RequestException: JSON_RETRY_POLICY,
+        ValueError: JSON_RETRY_POLICY,
+    },
+    default=JSON_RETRY_POLICY,
+    budget=RetryBudget(RETRY_BUDGET_RATIO),
+)
+TILE_RETRY = RetryEngine(
+    {
+        requests.RequestException: TILE_RETRY_POLICY,
+        TileServerError: TILE_RETRY_POLICY,
+        TileNotImage: TILE_NOT_IMAGE_POLICY,
+    },
+    default=TILE_RETRY_POLICY,
+    budget=RetryBudget(RETRY_BUDGET_RATIO),
+)
+# 轮换 token、更换认证失败的代理只受次数限制，不等待也不消耗重试预算，预算耗尽时仍能换 IP
+REPLACEMENT_RETRY = RetryEngine(
+    {
+        RateLimitError: RATE_LIMIT_POLICY,
+        ProxyAuthError: PROXY_AUTH_POLICY,
+    },
+    default=PROXY_AUTH_POLICY,
+)
+
+
 def _is_proxy_auth_error(exc: BaseException) -> bool:
     current: Optional[BaseException] = exc  # type: ignore[assignment]
     while current:
@@ -71,7 +205,157 @@ def _is_proxy_auth_error(exc: BaseException) -> bool:
     return False
 
 logger = logging.getLogger(__name__)
-coloredlogs.install(level="INFO", logger=logger)
+# 装在根 logger 上，circuit_breaker、metrics 等模块的日志才会经同一个 handler 输出
+coloredlogs.install(level="INFO")
+
+API_CALLS = REGISTRY.counter("ltfc_api_calls_total", "按接口与结果统计的 API 调用次数")
+API_LATENCY = REGISTRY.histogram("ltfc_api_latency_seconds", "API 调用耗时")
+RETRIES = REGISTRY.counter("ltfc_retries_total", "重试次数")
+RATE_LIMIT_ERRORS = REGISTRY.counter("ltfc_rate_limit_errors_total", "接口返回 Code=-11 的次数")
+PROXY_AUTH_ERRORS = REGISTRY.counter("ltfc_proxy_auth_errors_total", "代理认证失败次数")
+TOKEN_ROTATIONS = REGISTRY.counter("ltfc_token_rotations_total", "因频率限制轮换 token 的次数")
+PROXY_REPLACEMENTS = REGISTRY.counter("ltfc_proxy_replacements_total", "因认证失败更换代理会话的次数")
+TILE_REQUESTS = REGISTRY.counter("ltfc_tile_requests_total", "按结果统计的瓦片请求次数")
+TILES_DOWNLOADED = REGISTRY.counter("ltfc_tiles_downloaded_total", "已保存的瓦片数")
+TILE_BYTES = REGISTRY.counter("ltfc_tile_bytes_total", "已保存的瓦片字节数")
+TILE_HEDGES = REGISTRY.counter("ltfc_tile_hedges_total", "按结果统计的瓦片对冲请求次数")
+TILE_LATENCY = REGISTRY.histogram("ltfc_tile_latency_seconds", "按代理统计的瓦片请求耗时")
+ARTISTS_PROCESSED = REGISTRY.counter("ltfc_artists_processed_total", "已处理完毕的艺术家数")
+TOKEN_POOL_SIZE = REGISTRY.gauge("ltfc_token_pool_size", "token 池当前大小")
+PROXY_IPS_ALLOCATED = REGISTRY.gauge("ltfc_proxy_ips_allocated", "本次运行累计分配的代理 IP 数")
+PROXY_IPS_PER_GB = REGISTRY.gauge("ltfc_proxy_ips_per_gb", "每 GB 瓦片流量消耗的代理 IP 数")
+SESSION_POOL_SIZE = REGISTRY.gauge("ltfc_session_pool_size", "会话池当前大小")
+QUEUE_DEPTH = REGISTRY.gauge("ltfc_queue_depth", "等待执行的任务数")
+CONCURRENCY_LIMIT = REGISTRY.gauge("ltfc_concurrency_limit", "自适应并发控制器当前的在途请求上限")
+STARTUP_SECONDS = REGISTRY.gauge("ltfc_startup_seconds", "从进入 main 到会话池就绪的耗时")
+BREAKER_STATE = REGISTRY.gauge("ltfc_rate_limit_breaker_state", "限流熔断状态(0=closed,1=half_open,2=open)")
+BREAKER_TRANSITIONS = REGISTRY.counter("ltfc_rate_limit_breaker_transitions_total", "限流熔断状态切换次数")
+
+_BREAKER_OUTCOMES = {"ok": OUTCOME_OK, "rate_limited": OUTCOME_RATE_LIMITED}
+
+API_BREAKER = RateLimitCoordinator(
+    window=RATE_LIMIT_WINDOW,
+    trip_count=RATE_LIMIT_TRIP_COUNT,
+    trip_ratio=RATE_LIMIT_TRIP_RATIO,
+    base_cooldown=RATE_LIMIT_BASE_COOLDOWN,
+    max_cooldown=RATE_LIMIT_MAX_COOLDOWN,
+    on_state_change=lambda previous, state: BREAKER_TRANSITIONS.inc(to=state),
+)
+BREAKER_STATE.set_function(lambda: {HALF_OPEN: 1, OPEN: 2}.get(API_BREAKER.state, 0))
+
+
+def _endpoint_label(url: str) -> str:
+    return urllib.parse.urlsplit(url).path.rsplit("/", 1)[-1] or url
+
+
+def _proxy_label(session: requests.Session) -> str:
+    proxy = session.proxies.get("https") or session.proxies.get("http")
+    if not proxy:
+        return "direct"
+    return urllib.parse.urlsplit(proxy).netloc or proxy
+
+
+_TRACER: Optional[TraceWriter] = None
+_CONTROLLER: Optional[ConcurrencyController] = None
+TRAFFIC = TrafficLimiter(
+    max_in_flight=MAX_IN_FLIGHT,
+    host_in_flight=HOST_IN_FLIGHT,
+    bandwidth=BANDWIDTH_LIMIT,
+    host_bandwidth=HOST_BANDWIDTH,
+)
+TILE_SUMMARY = ProgressSummary(logger, "瓦片", TILE_LOG_SUMMARY_INTERVAL)
+
+
+def _trace(kind: str, **fields: object) -> None:
+    if _TRACER is not None:
+        _TRACER.emit(kind, **fields)
+
+
+def _token_id(token: Optional[str]) -> Optional[str]:
+    # 只记录 token 摘要，追踪文件里不落明文
+    if not token:
+        return None
+    return hashlib.sha1(token.encode("utf-8")).hexdigest()[:10]
+
+
+def _payload_token(payload: object) -> Optional[str]:
+    context = payload.get("context") if isinstance(payload, dict) else None
+    return context.get("tourToken") if isinstance(context, dict) else None
+
+
+def start_tracing() -> Optional[TraceWriter]:
+    global _TRACER
+    if TRACE_LOG_PATH:
+        _TRACER = TraceWriter(Path(TRACE_LOG_PATH)).start()
+        logger.info("请求追踪写入 %s", TRACE_LOG_PATH)
+    return _TRACER
+
+
+def _user_agent() -> str:
+    with _USER_AGENT_LOCK:
+        if not _USER_AGENTS:
+            from faker import Faker
+
+            faker = Faker()
+            _USER_AGENTS.extend(faker.user_agent() for _ in range(USER_AGENT_POOL_SIZE))
+    return _USER_AGENTS[next(_USER_AGENT_COUNTER) % len(_USER_AGENTS)]
+
+
+@contextmanager
+def _request_slot(host: str):
+    # 先占自适应并发槽，再占全局/主机槽，顺序固定
+    with _CONTROLLER.slot() if _CONTROLLER is not None else nullcontext(), TRAFFIC.slot(host):
+        yield
+
+
+def _request_host(url: str) -> str:
+    """限流按请求实际访问的主机计：SUFA 瓦片签名后指向 cag-ac.ltfc.net，而不是 cag.ltfc.net。"""
+    parts = urllib.parse.urlsplit(url)
+    return parts.hostname or parts.netloc
+
+
+def _limited_get(session: requests.Session, url: str) -> requests.Response:
+    host = _request_host(url)
+    with _request_slot(host):
+        response = session.get(url, timeout=DEFAULT_TIMEOUT)
+        TRAFFIC.consume(host, len(response.content))
+    return response
+
+
+def _hedge_executor(limit: int) -> ThreadPoolExecutor:
+    # 在途的首发请求不超过并发上限，每个至多再带一个对冲请求
+    return ThreadPoolExecutor(max_workers=limit * 2 + 4, thread_name_prefix="tile-hedge")
+
+
+def _record_outcome(outcome: str) -> None:
+    if _CONTROLLER is not None:
+        _CONTROLLER.record(outcome)
+
+
+def start_autoscaling(downloader: "LTFCDownload") -> ConcurrencyController:
+    global _CONTROLLER
+    _CONTROLLER = ConcurrencyController(
+        initial=downloader.num,
+        minimum=AUTOSCALE_MIN,
+        maximum=AUTOSCALE_MAX,
+        interval=AUTOSCALE_INTERVAL,
+        step=AUTOSCALE_STEP,
+        on_resize=downloader.resize_concurrency,
+        under_pressure=lambda: API_BREAKER.state != CLOSED,
+    ).start()
+    # 线程数取上限，实际在途请求数由控制器的并发槽约束
+    downloader.worker_threads = AUTOSCALE_MAX
+    CONCURRENCY_LIMIT.set_function(lambda: _CONTROLLER.limit if _CONTROLLER else 0)
+    logger.info("自适应并发已开启: 初始 %s，范围 [%s, %s]", downloader.num, AUTOSCALE_MIN, AUTOSCALE_MAX)
+    return _CONTROLLER
+
+
+def start_metrics() -> SnapshotWriter:
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    writer = SnapshotWriter(METRICS_SNAPSHOT_PATH, METRICS_SNAPSHOT_INTERVAL)
+    writer.start()
+    return writer
 
 
 def _normalize_proxy(proxy: Dict[str, str] | str) -> Dict[str, str]:
@@ -102,36 +386,93 @@ def _request_json(
     **kwargs,
 ) -> Dict:
     last_error: Optional[Exception] = None
-    for attempt, delay in enumerate(JSON_RETRY_DELAYS, start=1):
+    endpoint = _endpoint_label(url)
+    trace_base = {
+        "endpoint": endpoint,
+        "method": method.upper(),
+        "proxy": _proxy_label(session) if session else "direct",
+        "token": _token_id(_payload_token(kwargs.get("json"))),
+    }
+    # 只有元数据接口参与全局限流协调，代理分配等其他主机不受影响
+    host = _request_host(url)
+    breaker = API_BREAKER if host == API_HOST else None
+    API_RETRY.record_request()
+    attempt = 0
+    while True:
+        attempt += 1
+        if attempt > 1:
+            RETRIES.inc(kind="api", endpoint=endpoint)
+        trace = dict(trace_base, attempt=attempt)
+        outcome = "error"
+        probe = breaker.acquire() if breaker is not None else False
+        started = time.perf_counter()
         try:
             requester = session.request if session else requests.request
-            response = requester(method, url, timeout=timeout, **kwargs)
+            with _request_slot(host), PROFILER.stage("network_api"):
+                response = requester(method, url, timeout=timeout, **kwargs)
+                TRAFFIC.consume(host, len(response.content))
+            API_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+            trace.update(
+                status=response.status_code,
+                bytes=len(response.content),
+                ttfb_ms=round(response.elapsed.total_seconds() * 1000, 1),
+            )
             response.raise_for_status()
-            payload = response.json()
+            with PROFILER.stage("json_parse"):
+                payload = metadata_store.loads(response.content)
             if isinstance(payload, dict) and payload.get("Code") == -11:
+                outcome = "rate_limited"
+                RATE_LIMIT_ERRORS.inc(endpoint=endpoint)
                 raise RateLimitError("请求过于频繁")
+            outcome = "ok"
             return payload
         except requests.RequestException as exc:
             last_error = exc
+            trace["error"] = str(exc)
             if _is_proxy_auth_error(exc):
+                outcome = "proxy_auth"
+                PROXY_AUTH_ERRORS.inc(source="api")
                 raise ProxyAuthError("代理认证失败") from exc
-            logger.warning("%s %s 失败(%s/%s): %s", method.upper(), url, attempt, len(JSON_RETRY_DELAYS), exc)
-            time.sleep(delay)
+            logger.warning("%s %s 失败(%s/%s): %s", method.upper(), url, attempt, API_RETRY.policy_for(exc).max_attempts, exc)
         except RateLimitError:
             raise
         except ValueError as exc:
             last_error = exc
-            logger.warning("%s %s 返回非 JSON(%s/%s): %s", method.upper(), url, attempt, len(JSON_RETRY_DELAYS), exc)
-            time.sleep(delay)
+            outcome = "invalid_json"
+            trace["error"] = str(exc)
+            logger.warning("%s %s 返回非 JSON(%s/%s): %s", method.upper(), url, attempt, API_RETRY.policy_for(exc).max_attempts, exc)
+        finally:
+            if breaker is not None:
+                breaker.release(probe, _BREAKER_OUTCOMES.get(outcome, OUTCOME_ERROR))
+            _record_outcome(_BREAKER_OUTCOMES.get(outcome, OUTCOME_ERROR))
+            API_CALLS.inc(endpoint=endpoint, outcome=outcome)
+            _trace("api", outcome=outcome, total_ms=round((time.perf_counter() - started) * 1000, 1), **trace)
+        delay = API_RETRY.next_delay(last_error, attempt)
+        if delay is None:
+            break
+        time.sleep(delay)
     raise RuntimeError(f"{method.upper()} {url} 请求异常: {last_error}") from last_error
 
 
+STORAGE: StorageBackend = open_storage(STORAGE_URL) if STORAGE_URL else LocalStorage(OUTPUT_DIR)
+
+
+def _storage_key(path: Path) -> str:
+    return path.relative_to(OUTPUT_DIR).as_posix()
+
+
+def _update_catalog(action: Callable[..., None], *args: object) -> None:
+    try:
+        action(*args)
+    except Exception as exc:
+        logger.warning("更新目录失败 (%s): %s", getattr(action, "__name__", action), exc)
+
+
 def _safe_write_json(path: Path, payload: Dict) -> None:
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("w", encoding="utf-8") as fp:
-            json.dump(payload, fp, ensure_ascii=False, indent=2)
-    except OSError as exc:
+        with PROFILER.stage("json_write"):
+            metadata_store.write_to(STORAGE, _storage_key(path), payload)
+    except Exception as exc:
         logger.error("写入文件失败 %s: %s", path, exc)
 
 
@@ -141,13 +482,66 @@ class SessionBundle:
     tour_token: str
 
 
+@dataclass
+class ResourceTask:
+    artist_id: str
+    artist_name: str
+    work_id: str
+    work_name: str
+    parent_resource_id: str
+    child_resource_id: str
+    work_src: str
+
+
+@dataclass
+class _TileScan:
+    """子资源扫描结束后尚未到期的延后瓦片；资源任务重新排期后从这里继续，不再重扫网格。"""
+
+    deferred: "DeferredQueue[Tuple[int, int, int]]"
+    abandoned: List[Tuple[int, int]] = field(default_factory=list)
+    downloaded: bool = False
+    truncated: bool = False  # 有列因连续失败提前结束，网格可能没扫全
+    saved: int = 0  # 新写入的瓦片数，跨重新排期累计
+
+
+@dataclass
+class _ArtistProgress:
+    """艺术家的作品都已处理、只剩冷却中的资源时保存的状态；重新排期后只重试这些资源。"""
+
+    deferred: "DeferredQueue[ResourceTask]"
+    downloaded: bool = False
+
+
 class LTFCDownload:
-    def __init__(self, artist_csv: str, num: int = 75):
+    def __init__(self, artist_csv: str, num: int = 75, *, shard: Optional[Tuple[int, int]] = None):
         self.artist_csv = artist_csv
-        self.artists_info = pd.read_csv(self.artist_csv)
-        self.artists_id = self.artists_info["Id"].tolist()
+        started = time.perf_counter()
+        self.artists = ArtistIndex.load(self.artist_csv)
+        logger.info("载入 %s 位艺术家索引，耗时 %.3fs", len(self.artists), time.perf_counter() - started)
+        # 元数据与瓦片统计同步写入统一目录，data_rename 等下游直接查询，不再逐个解析 JSON
+        self.catalog = Catalog(catalog_path(OUTPUT_DIR))
+        _update_catalog(self.catalog.import_artists, Path(self.artist_csv))
+        self.artists_id = list(self.artists.ids)
+        shard_index, shard_total = shard if shard else (None, None)
+        if shard:
+            self.artists_id = select_shard(self.artists_id, self.artists.weights, *shard)
+            logger.info("分片 %s/%s 分配到 %s 位艺术家", shard_index, shard_total, len(self.artists_id))
+        self.manifest = ShardManifest(
+            MANIFEST_DIR / manifest_name(shard_index, shard_total),
+            index=shard_index,
+            total=shard_total,
+            artist_ids=self.artists_id,
+        )
         self.num = max(1, min(num, 200))
+        self.worker_threads = self.num
         self.secondary_usage = 0
+        self.session_cache: Optional[SessionCache] = None
+        if USE_PROXY and SESSION_CACHE_ENABLED:
+            self.session_cache = SessionCache(
+                SESSION_CACHE_PATH,
+                default_token_ttl=TOKEN_DEFAULT_TTL,
+                lease_margin=PROXY_LEASE_MARGIN,
+            )
 
         if USE_PROXY:
             self.key = KEY
@@ -158,7 +552,22 @@ class LTFCDownload:
                     raise ValueError("Proxy key 未配置，请设置环境变量 QINGGOU_KEY")
             self.token_pool_capacity = max(3, min(self.num * 2, 20))
             self.token_pool: List[str] = []
-            self.primary_sessions = self._build_session_pool(self.key, self.num)
+            self.proxy_leases = ProxyLeaseManager(
+                lambda count: self._fetch_proxy_hosts(self.key, count),
+                min_batch=PROXY_ALLOCATE_BATCH,
+                default_lease=PROXY_DEFAULT_LEASE,
+                margin=PROXY_LEASE_MARGIN,
+                max_failures=PROXY_MAX_FAILURES,
+                on_allocate=self.session_cache.record_lease if self.session_cache else None,
+                on_discard=self.session_cache.drop_lease if self.session_cache else None,
+            )
+            cached_token = None
+            if self.session_cache is not None:
+                self.token_pool.extend(self.session_cache.valid_tokens()[-self.token_pool_capacity :])
+                logger.info("从缓存恢复 %s 个 token", len(self.token_pool))
+                cached_token = self.token_pool[-1] if self.token_pool else None
+                self._adopt_cached_leases()
+            self.primary_sessions = self._build_session_pool(self.key, self.num, shared_token=cached_token)
             shared_token = self.primary_sessions[0].tour_token if self.primary_sessions else None
             self.secondary_sessions = self._build_session_pool(self.key, min(self.num * 3, 200), shared_token=shared_token)
         else:
@@ -168,6 +577,41 @@ class LTFCDownload:
             self.secondary_sessions = [bundle]
             self.token_pool_capacity = 0
             self.token_pool = []
+            self.proxy_leases = None
+
+        if self.proxy_leases is not None:
+            PROXY_IPS_ALLOCATED.set_function(lambda: self.proxy_leases.allocated_ips)
+            PROXY_IPS_PER_GB.set_function(self.proxy_leases.ips_per_gb)
+        self.tile_writer: Optional[TileWriter] = None
+        if TILE_WRITER_THREADS > 0:
+            self.tile_writer = TileWriter(
+                lambda path, data: STORAGE.write_bytes(_storage_key(path), data),
+                workers=TILE_WRITER_THREADS,
+                max_pending=TILE_WRITER_QUEUE,
+                batch_size=TILE_WRITER_BATCH,
+            )
+        self._pending_scans: Dict[str, _TileScan] = {}
+        self._pending_scans_lock = threading.Lock()
+        # 瓦片线程与对冲执行器线程都会轮转备用会话
+        self._secondary_lock = threading.Lock()
+        # 艺术家线程正在使用的主会话；整池重建时仍被持有的旧会话等持有者结束后再归还租约
+        self._primary_lock = threading.Lock()
+        self._primary_holders: Dict[int, int] = {}
+        self._retired_primary: Dict[int, SessionBundle] = {}
+        self._pending_artists: Dict[str, _ArtistProgress] = {}
+        self.hedger: Optional[Hedger] = None
+        if TILE_HEDGING and len(self.secondary_sessions) > 1:
+            self.hedger = Hedger(
+                _hedge_executor(self.num),
+                LatencyTracker(percentile=TILE_HEDGE_PERCENTILE, floor=TILE_HEDGE_MIN_DELAY),
+                RetryBudget(TILE_HEDGE_RATIO, min_per_second=0.0, max_balance=20.0),
+            )
+        TOKEN_POOL_SIZE.set_function(lambda: len(self.token_pool))
+        SESSION_POOL_SIZE.set_function(lambda: len(self.primary_sessions), pool="primary")
+        SESSION_POOL_SIZE.set_function(lambda: len(self.secondary_sessions), pool="secondary")
+
+    def artist_name(self, artist_id: str) -> str:
+        return self.artists.name(artist_id)
 
     def _resource_root(self, artist_id: str, work_id: str, parent_resource_id: str, child_resource_id: Optional[str] = None) -> Path:
         base = RAWDATA_DIR / artist_id / work_id / parent_resource_id
@@ -182,45 +626,72 @@ class LTFCDownload:
         return self._resource_root(artist_id, work_id, parent_resource_id, child_resource_id) / "tile"
 
     def _is_resource_completed(self, artist_id: str, work_id: str, parent_resource_id: str, child_resource_id: str) -> bool:
-        return self._resource_flag_path(artist_id, work_id, parent_resource_id, child_resource_id).exists()
+        return STORAGE.exists(_storage_key(self._resource_flag_path(artist_id, work_id, parent_resource_id, child_resource_id)))
 
     def _artist_flag_path(self, artist_id: str) -> Path:
         return RAWDATA_DIR / artist_id / ".completed"
 
     def _is_artist_completed(self, artist_id: str) -> bool:
-        return self._artist_flag_path(artist_id).exists()
+        return STORAGE.exists(_storage_key(self._artist_flag_path(artist_id)))
+
+    def _has_completed_resource(self, artist_id: str) -> bool:
+        """艺术家下是否至少有一个子资源写入了完成标记(只有下载到瓦片的子资源才会写)。"""
+        artist_key = _storage_key(RAWDATA_DIR / artist_id)
+        for work_id in STORAGE.list_dir(artist_key)[0]:
+            for parent_id in STORAGE.list_dir(f"{artist_key}/{work_id}")[0]:
+                for child_id in STORAGE.list_dir(f"{artist_key}/{work_id}/{parent_id}")[0]:
+                    if self._is_resource_completed(artist_id, work_id, parent_id, child_id):
+                        return True
+        return False
 
     def _mark_artist_completed(self, artist_id: str) -> None:
         flag_path = self._artist_flag_path(artist_id)
         try:
-            flag_path.parent.mkdir(parents=True, exist_ok=True)
-            flag_path.write_text(str(int(time.time())), encoding="utf-8")
-        except OSError as exc:
+            STORAGE.write_bytes(_storage_key(flag_path), str(int(time.time())).encode("utf-8"))
+        except Exception as exc:
             logger.warning("写入艺术家完成标记失败 %s: %s", flag_path, exc)
 
     def _mark_resource_completed(self, artist_id: str, work_id: str, parent_resource_id: str, child_resource_id: str) -> None:
         flag_path = self._resource_flag_path(artist_id, work_id, parent_resource_id, child_resource_id)
         try:
-            flag_path.parent.mkdir(parents=True, exist_ok=True)
-            flag_path.write_text(str(int(time.time())), encoding="utf-8")
-        except OSError as exc:
+            STORAGE.write_bytes(_storage_key(flag_path), str(int(time.time())).encode("utf-8"))
+        except Exception as exc:
             logger.warning("写入完成标记失败 %s: %s", flag_path, exc)
+            return
+        tile_dir = self._tile_dir(artist_id, work_id, parent_resource_id, child_resource_id)
+        try:
+            sizes = STORAGE.file_sizes(_storage_key(tile_dir))
+        except Exception as exc:
+            logger.warning("统计瓦片失败 %s: %s", tile_dir, exc)
+            return
+        _update_catalog(
+            self.catalog.record_tiles,
+            artist_id,
+            work_id,
+            parent_resource_id,
+            child_resource_id,
+            len(sizes),
+            sum(sizes.values()),
+            time.time(),
+        )
 
-    def _fetch_proxy_hosts(self, key: str, num: int) -> List[Dict[str, str]]:
-        proxy_url = f"https://proxy.qg.net/allocate?Key={key}&Num={num}"
+    def _fetch_proxy_hosts(self, key: str, num: int) -> List[Tuple[Dict[str, str], Optional[float]]]:
+        proxy_url = f"{PROXY_ALLOCATE_URL}?Key={key}&Num={num}"
+        started = time.perf_counter()
         payload = _request_json("get", proxy_url, timeout=DEFAULT_TIMEOUT)
+        logger.debug("分配 %s 个代理耗时 %.3fs", num, time.perf_counter() - started)
         data = payload.get("Data") if isinstance(payload, dict) else None
         if not data:
             raise RuntimeError(f"代理服务未返回可用代理: {payload}")
 
-        proxies: List[Dict[str, str]] = []
+        proxies: List[Tuple[Dict[str, str], Optional[float]]] = []
         for entry in data:
             host = entry.get("host") if isinstance(entry, dict) else None
             try:
                 if isinstance(host, dict):
-                        proxies.append(_normalize_proxy(host))
+                        proxies.append((_normalize_proxy(host), parse_deadline(entry.get("deadline"))))
                 elif isinstance(host, str):
-                        proxies.append(_normalize_proxy({"http": host, "https": host}))
+                        proxies.append((_normalize_proxy({"http": host, "https": host}), parse_deadline(entry.get("deadline"))))
                 else:
                     logger.warning("跳过无法识别的代理条目: %s", entry)
             except Exception as exc:
@@ -234,6 +705,8 @@ class LTFCDownload:
         token = payload.get("token") if isinstance(payload, dict) else None
         if not token:
             raise RuntimeError(f"响应中缺少 token 字段: {payload}")
+        if self.session_cache is not None:
+            self.session_cache.record_token(token)
         return token
 
     def _create_session_bundle(
@@ -252,7 +725,7 @@ class LTFCDownload:
                 "content-type": "application/json;charset=UTF-8",
                 "origin": "https://g2.ltfc.net",
                 "referer": "https://g2.ltfc.net/",
-                "user-agent": ua.user_agent(),
+                "user-agent": _user_agent(),
             }
         )
         token = tour_token or self._fetch_tour_token(session)
@@ -267,24 +740,25 @@ class LTFCDownload:
     ) -> List[SessionBundle]:
         target_count = max(1, min(num, 200))
         bundles: List[SessionBundle] = []
+        token_cache = shared_token
         attempts = 0
 
         while attempts < MAX_PROXY_RETRIES and len(bundles) < target_count:
-            proxies = self._fetch_proxy_hosts(key, target_count)
-            token_cache = shared_token
+            proxies = self.proxy_leases.acquire(target_count - len(bundles))
             for proxy in proxies:
                 try:
                     bundle = self._create_session_bundle(proxy, tour_token=token_cache)
                     token_cache = bundle.tour_token
                     self._push_token(bundle.tour_token)
                     bundles.append(bundle)
-                    if len(bundles) >= target_count:
-                        break
                 except ProxyAuthError as exc:
                     logger.warning("代理 %s 认证失败，尝试更换 IP: %s", proxy, exc)
+                    self.proxy_leases.discard(proxy)
                     continue
                 except Exception as exc:
                     logger.warning("创建会话失败 %s: %s", proxy, exc)
+                    # 建会话失败的 IP 不再放回空闲池，否则重试会反复取到同一个 IP
+                    self.proxy_leases.discard(proxy)
             if bundles:
                 break
             attempts += 1
@@ -294,6 +768,63 @@ class LTFCDownload:
             raise RuntimeError("无法构建会话池，请检查代理服务是否正常")
         return bundles
 
+    def _proxy_alive(self, proxy: Dict[str, str]) -> bool:
+        try:
+            response = requests.head(f"https://{API_HOST}/", proxies=proxy, timeout=PROXY_VALIDATE_TIMEOUT)
+        except requests.RequestException:
+            return False
+        return response.status_code not in (407, 408)
+
+    def grow_pools(self, limit: int) -> None:
+        """并发上限提高时同步扩充主/备会话池；上限回落时保留已有会话。"""
+        if not USE_PROXY or not self.key or limit <= self.num:
+            return
+        shared_token = self.primary_sessions[0].tour_token if self.primary_sessions else None
+        try:
+            extra_primary = self._build_session_pool(self.key, limit - self.num, shared_token=shared_token)
+            secondary_target = min(limit * 3, 200)
+            extra_secondary: List[SessionBundle] = []
+            if secondary_target > len(self.secondary_sessions):
+                extra_secondary = self._build_session_pool(
+                    self.key,
+                    secondary_target - len(self.secondary_sessions),
+                    shared_token=shared_token,
+                )
+        except RuntimeError as exc:
+            logger.warning("扩充会话池失败: %s", exc)
+            return
+        # 整体替换列表引用，避免其他线程遍历时看到中间状态
+        self.primary_sessions = self.primary_sessions + extra_primary
+        self.secondary_sessions = self.secondary_sessions + extra_secondary
+        self.num = limit
+        logger.info("会话池扩充至 主 %s / 备 %s", len(self.primary_sessions), len(self.secondary_sessions))
+
+    def resize_concurrency(self, limit: int) -> None:
+        """自适应并发调整上限时调用：扩充会话池，并按新上限重建对冲执行器。"""
+        self.grow_pools(limit)
+        if self.hedger is not None:
+            self.hedger.replace_executor(_hedge_executor(limit))
+
+    def _adopt_cached_leases(self) -> None:
+        """把上次运行遗留的未到期租约交给租约管理器，连通性校验失败的直接丢弃。"""
+        leases = self.session_cache.take_carried_leases()
+        if not leases:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(leases), 16)) as executor:
+            alive = list(executor.map(lambda lease: self._proxy_alive(lease[0]), leases))
+        for (proxy, deadline), ok in zip(leases, alive):
+            if ok:
+                self.proxy_leases.adopt(proxy, deadline)
+            else:
+                self.session_cache.drop_lease(proxy)
+        logger.info("复用缓存代理租约 %s/%s 个", sum(alive), len(leases))
+
+    def _release_pool(self, bundles: List[SessionBundle]) -> None:
+        if self.proxy_leases is None:
+            return
+        for bundle in bundles:
+            self.proxy_leases.release(bundle.session.proxies)
+
     def _refresh_secondary_sessions(self, *, force_new_token: bool) -> SessionBundle:
         if not USE_PROXY:
             if not self.secondary_sessions:
@@ -303,6 +834,7 @@ class LTFCDownload:
             raise RuntimeError("代理 key 未配置，无法刷新备用会话")
         primary_token = self.primary_sessions[0].tour_token if self.primary_sessions else None
         shared_token = None if force_new_token else primary_token
+        self._release_pool(self.secondary_sessions)
         self.secondary_sessions = self._build_session_pool(self.key, min(self.num * 3, 200), shared_token=shared_token)
         self.secondary_usage = 0
         if not self.secondary_sessions:
@@ -320,7 +852,7 @@ class LTFCDownload:
         shared_token = None if force_new_token else primary_token
         attempts = 0
         while attempts < MAX_PROXY_RETRIES:
-            proxies = self._fetch_proxy_hosts(self.key, 1)
+            proxies = self.proxy_leases.acquire(1)
             token_cache = shared_token
             for proxy in proxies:
                 try:
@@ -329,9 +861,12 @@ class LTFCDownload:
                     return bundle
                 except ProxyAuthError as exc:
                     logger.warning("新备用会话代理 %s 认证失败: %s", proxy, exc)
+                    self.proxy_leases.discard(proxy)
                     continue
                 except Exception as exc:
                     logger.warning("新备用会话创建失败 %s: %s", proxy, exc)
+                    # 建会话失败的 IP 不再放回空闲池，否则重试会反复取到同一个 IP
+                    self.proxy_leases.discard(proxy)
             attempts += 1
             time.sleep(1)
         raise RuntimeError("无法获取新的备用会话，请检查代理服务")
@@ -339,10 +874,16 @@ class LTFCDownload:
     def _replace_secondary_session(self, index: int, *, force_new_token: bool) -> SessionBundle:
         if index < 0 or index >= len(self.secondary_sessions):
             raise RuntimeError(f"备用会话索引越界: {index}")
+        # 只在代理认证失败时调用，旧 IP 不再复用
+        self._discard_proxy(self.secondary_sessions[index])
         bundle = self._acquire_secondary_session(force_new_token=force_new_token)
         self.secondary_sessions[index] = bundle
         return bundle
 
+    def _discard_proxy(self, bundle: SessionBundle) -> None:
+        if self.proxy_leases is not None and bundle.session.proxies:
+            self.proxy_leases.discard(bundle.session.proxies)
+
     def _find_primary_index(self, bundle: SessionBundle) -> Optional[int]:
         for idx, candidate in enumerate(self.primary_sessions):
             if candidate is bundle:
@@ -358,7 +899,7 @@ class LTFCDownload:
             raise RuntimeError("代理 key 未配置，无法获取新的主会话")
         attempts = 0
         while attempts < MAX_PROXY_RETRIES:
-            proxies = self._fetch_proxy_hosts(self.key, 1)
+            proxies = self.proxy_leases.acquire(1)
             for proxy in proxies:
                 try:
                     bundle = self._create_session_bundle(proxy)
@@ -366,9 +907,12 @@ class LTFCDownload:
                     return bundle
                 except ProxyAuthError as exc:
                     logger.warning("新主会话代理 %s 认证失败: %s", proxy, exc)
+                    self.proxy_leases.discard(proxy)
                     continue
                 except Exception as exc:
                     logger.warning("新主会话创建失败 %s: %s", proxy, exc)
+                    # 建会话失败的 IP 不再放回空闲池，否则重试会反复取到同一个 IP
+                    self.proxy_leases.discard(proxy)
             attempts += 1
             time.sleep(1)
         raise RuntimeError("无法获取新的主会话，请检查代理服务")
@@ -388,6 +932,7 @@ class LTFCDownload:
         if actual_index is None:
             actual_index = 0
         actual_index %= len(self.primary_sessions)
+        self._discard_proxy(current_bundle)
         new_bundle = self._acquire_primary_session(force_new_token=force_new_token)
         self.primary_sessions[actual_index] = new_bundle
         return new_bundle, actual_index
@@ -455,6 +1000,8 @@ class LTFCDownload:
     def _discard_token(self, token: Optional[str]) -> None:
         if not token:
             return
+        if self.session_cache is not None:
+            self.session_cache.retire_token(token)
         try:
             self.token_pool.remove(token)
         except ValueError:
@@ -488,6 +1035,10 @@ class LTFCDownload:
         bundle_index: Optional[int] = None,
     ) -> Tuple[Dict, SessionBundle, Optional[int]]:
         def _task(active_bundle: SessionBundle) -> Dict:
+            # 轮换 token 后需要用新 token 重发
+            context = payload.get("context")
+            if isinstance(context, dict):
+                context["tourToken"] = active_bundle.tour_token
             return _request_json(
                 "post",
                 url,
@@ -506,8 +1057,9 @@ class LTFCDownload:
             return self.primary_sessions[bundle_index], bundle_index
         if not self.key:
             raise RuntimeError("代理 key 未配置，无法刷新主会话")
-        if index % max(1, self.num) == 0:
-            self.primary_sessions = self._build_session_pool(self.key, self.num)
+        # 重建间隔按线程数放大：--autoscale 时线程数远多于会话数，按会话数重建会过于频繁
+        if index % max(1, self.num, self.worker_threads) == 0:
+            self._swap_primary_pool(self._build_session_pool(self.key, self.num))
             if self.token_pool_capacity > 0:
                 self._warm_up_token_pool()
         if not self.primary_sessions:
@@ -515,6 +1067,44 @@ class LTFCDownload:
         bundle_index = index % len(self.primary_sessions)
         return self.primary_sessions[bundle_index], bundle_index
 
+    def _swap_primary_pool(self, fresh: List[SessionBundle]) -> None:
+        """换上新的主会话池；旧池中没人持有的会话立即归还租约，其余等 _hold_primary_bundle 结束时归还。"""
+        with self._primary_lock:
+            old, self.primary_sessions = self.primary_sessions, fresh
+            idle: List[SessionBundle] = []
+            for bundle in old:
+                if self._primary_holders.get(id(bundle)):
+                    self._retired_primary[id(bundle)] = bundle
+                else:
+                    idle.append(bundle)
+        self._release_pool(idle)
+
+    @contextmanager
+    def _hold_primary_bundle(self, index: int) -> Iterator[Tuple[SessionBundle, int]]:
+        """取第 index 个艺术家的主会话，并在处理期间持有它，整池重建不会归还仍在使用的会话。"""
+        bundle, bundle_index = self._get_primary_bundle(index)
+        with self._primary_lock:
+            self._primary_holders[id(bundle)] = self._primary_holders.get(id(bundle), 0) + 1
+        try:
+            yield bundle, bundle_index
+        finally:
+            retired: Optional[SessionBundle] = None
+            with self._primary_lock:
+                remaining = self._primary_holders.pop(id(bundle), 1) - 1
+                if remaining:
+                    self._primary_holders[id(bundle)] = remaining
+                else:
+                    retired = self._retired_primary.pop(id(bundle), None)
+            if retired is not None:
+                self._release_pool([retired])
+
+    def pick_primary_bundle(self, index: int) -> Tuple[SessionBundle, int]:
+        # 与 _get_primary_bundle 不同，这里不会触发整池重建，供高频的队列任务使用
+        if not self.primary_sessions:
+            raise RuntimeError("主会话列表为空，无法处理任务")
+        bundle_index = index % len(self.primary_sessions)
+        return self.primary_sessions[bundle_index], bundle_index
+
     def _with_proxy_retry(
         self,
         bundle: SessionBundle,
@@ -535,9 +1125,15 @@ class LTFCDownload:
                 return operation(current_bundle), current_bundle, current_index
             except RateLimitError as exc:
                 rate_limit_attempts += 1
-                if rate_limit_attempts >= MAX_PROXY_RETRIES:
+                if REPLACEMENT_RETRY.next_delay(exc, rate_limit_attempts) is None:
                     raise RuntimeError("请求过于频繁，多次刷新 token 仍失败") from exc
-                logger.info("检测到请求过于频繁(%s)，轮换 token 后重试(%s/%s)...", exc, rate_limit_attempts, MAX_PROXY_RETRIES)
+                logger.info(
+                    "检测到请求过于频繁(%s)，轮换 token 后重试(%s/%s)...",
+                    exc,
+                    rate_limit_attempts,
+                    RATE_LIMIT_POLICY.max_attempts,
+                )
+                TOKEN_ROTATIONS.inc(pool=pool)
                 previous_token = current_bundle.tour_token
                 current_bundle, current_index = self._rotate_token_for_bundle(
                     current_bundle,
@@ -548,8 +1144,9 @@ class LTFCDownload:
                 continue
             except ProxyAuthError as exc:
                 attempts += 1
-                if not self.key or attempts >= MAX_PROXY_RETRIES:
+                if not self.key or REPLACEMENT_RETRY.next_delay(exc, attempts) is None:
                     raise RuntimeError("代理认证多次失败，请检查代理服务") from exc
+                PROXY_REPLACEMENTS.inc(pool=pool)
                 if pool == "primary":
                     current_bundle, current_index = self._replace_primary_session(
                         current_bundle,
@@ -558,19 +1155,75 @@ class LTFCDownload:
                     )
                 else:
                     if current_index is None:
+                        self._discard_proxy(current_bundle)
                         current_bundle = self._refresh_secondary_sessions(force_new_token=True)
                         current_index = 0
                     else:
                         current_bundle = self._replace_secondary_session(current_index, force_new_token=True)
 
     def _next_secondary_bundle(self) -> Tuple[SessionBundle, int]:
-        if not self.secondary_sessions:
-            bundle = self._refresh_secondary_sessions(force_new_token=True)
-            return bundle, 0
-        index = self.secondary_usage % len(self.secondary_sessions)
-        bundle = self.secondary_sessions[index]
-        self.secondary_usage += 1
-        return bundle, index
+        with self._secondary_lock:
+            if self.secondary_sessions:
+                index = self.secondary_usage % len(self.secondary_sessions)
+                self.secondary_usage += 1
+                return self.secondary_sessions[index], index
+        bundle = self._refresh_secondary_sessions(force_new_token=True)
+        return bundle, 0
+
+    def _bind_secondary_bundle(self, binding: Dict[str, int]) -> Tuple[SessionBundle, int]:
+        """按 binding 记录的会话连续服务 TILE_AFFINITY_BLOCK 个瓦片，用满后再轮换到下一个会话。
+
+        每段瓦片仍按轮询分配会话，整体负载依旧均匀分布在备用会话池上。
+        """
+        if TILE_SCHEDULING != "affinity" or TILE_AFFINITY_BLOCK <= 1:
+            return self._next_secondary_bundle()
+        index = binding.get("index")
+        if index is None or binding["served"] >= TILE_AFFINITY_BLOCK or index >= len(self.secondary_sessions):
+            _, index = self._next_secondary_bundle()
+            binding["index"], binding["served"] = index, 0
+        binding["served"] += 1
+        # 按索引取会话，认证失败被替换后自动用上新会话
+        return self.secondary_sessions[index], index
+
+    def _get_tile(
+        self,
+        url: str,
+        bundle: SessionBundle,
+        bundle_index: int,
+    ) -> Tuple[requests.Response, SessionBundle, int, str]:
+        """请求瓦片；开启对冲时慢请求会经另一备用会话重发，返回实际胜出的会话与对冲状态。
+
+        一个瓦片只占一个并发槽：槽位由调用线程在整个调用期间占用，对冲请求计在首发的槽位上，
+        不再另占一个；首发与对冲仍按各自下载的字节扣减带宽，不会绕过 TrafficLimiter。
+        """
+        if self.hedger is None:
+            return _limited_get(bundle.session, url), bundle, bundle_index, NOT_HEDGED
+        host = _request_host(url)
+        hedged: List[Tuple[SessionBundle, int]] = []
+
+        def primary() -> requests.Response:
+            response = bundle.session.get(url, timeout=DEFAULT_TIMEOUT)
+            TRAFFIC.consume(host, len(response.content))
+            return response
+
+        def hedge() -> requests.Response:
+            # 只有真正发出对冲时才另取会话，不打乱瓦片与会话的绑定轮转
+            hedge_bundle, hedge_index = self._next_secondary_bundle()
+            if hedge_index == bundle_index:
+                hedge_bundle, hedge_index = self._next_secondary_bundle()
+            hedged.append((hedge_bundle, hedge_index))
+            response = hedge_bundle.session.get(url, timeout=DEFAULT_TIMEOUT)
+            TRAFFIC.consume(host, len(response.content))
+            return response
+
+        with _request_slot(host):
+            response, hedge_state = self.hedger.call(primary, hedge, discard=lambda loser: loser.close())
+        if hedge_state != NOT_HEDGED:
+            TILE_HEDGES.inc(outcome=hedge_state)
+        if hedge_state == HEDGE_WON:
+            hedge_bundle, hedge_index = hedged[0]
+            return response, hedge_bundle, hedge_index, hedge_state
+        return response, bundle, bundle_index, hedge_state
 
     def _fetch_artist_resources(
         self,
@@ -599,6 +1252,7 @@ class LTFCDownload:
             return {"data": []}, bundle, bundle_index
 
         _safe_write_json(write_file, payload)
+        _update_catalog(self.catalog.upsert_works, artist_id, "SUHA" if url == ALL_HUIA_OF_ARTIST_URL else "SUFA", work_names(payload))
         return (payload if isinstance(payload, dict) else {"data": []}, active_bundle, bundle_index)
 
     def get_all_of_artist(
@@ -620,8 +1274,7 @@ class LTFCDownload:
             logger.warning("艺术家 %s 书法列表数据异常: %s", artist_id, payload_calligraphy)
             sufa_data = []
 
-        artist_name_series = self.artists_info[self.artists_info["Id"] == artist_id]["name"]
-        artist_name = artist_name_series.values[0] if not artist_name_series.empty else artist_id
+        artist_name = self.artist_name(artist_id)
         return paint_data, sufa_data, artist_name, bundle, bundle_index
 
     def get_sub_list(
@@ -653,6 +1306,7 @@ class LTFCDownload:
             return [], None, work_src, bundle, bundle_index
 
         _safe_write_json(write_file, payload)
+        _update_catalog(self.catalog.upsert_resources, artist_id, work_id, resource_names(payload).items())
         data = payload.get("data") if isinstance(payload, dict) else None
         if not isinstance(data, list):
             logger.warning("作品 %s 的子资源列表数据异常: %s", work_id, payload)
@@ -664,55 +1318,6 @@ class LTFCDownload:
             parent_suha = parent_data.get(key) if isinstance(parent_data.get(key), dict) else None
         return data, parent_suha, work_src, active_bundle, bundle_index
 
-    def _extract_resource_variants(self, resource: Dict, work_src: str) -> List[tuple[str, str]]:
-        variants: List[tuple[str, str]] = []
-        if work_src == "SUHA":
-            key = "suha"
-        else:
-            key = "sufa"
-        info = resource.get(key) if isinstance(resource, dict) else {}
-        hdp_info = info.get("hdp") if isinstance(info, dict) else {}
-
-        # Direct hdpic entry
-        hdpic = hdp_info.get("hdpic") if isinstance(hdp_info, dict) else None
-        if isinstance(hdpic, dict):
-            rid = hdpic.get("resourceId")
-            if rid:
-                name = hdpic.get("name") or info.get("name") or rid
-                variants.append((rid, name, work_src))
-
-        # Collection with multiple hdps
-        hdpcoll = hdp_info.get("hdpcoll") if isinstance(hdp_info, dict) else None
-        if isinstance(hdpcoll, dict):
-            for item in hdpcoll.get("hdps", []) or []:
-                if not isinstance(item, dict):
-                    continue
-                rid = item.get("resourceId")
-                if not rid:
-                    continue
-                name = item.get("name") or item.get("title") or info.get("name") or rid
-                variants.append((rid, name, work_src))
-
-        # otherHdps array as fallback
-        for extra in info.get("otherHdps", []) or []:
-            if not isinstance(extra, dict):
-                continue
-            rid = extra.get("resourceId")
-            if not rid:
-                continue
-            name = extra.get("name") or extra.get("title") or info.get("name") or rid
-            variants.append((rid, name, work_src))
-
-        # Deduplicate while preserving order
-        seen: set[str] = set()
-        uniq: List[tuple[str, str]] = []
-        for rid, name, work_src in variants:
-            if rid in seen:
-                continue
-            seen.add(rid)
-            uniq.append((rid, name, work_src))
-        return uniq
-
     def get_resource(
         self,
         artist_id: str,
@@ -746,9 +1351,8 @@ class LTFCDownload:
             logger.warning("资源 %s 详情数据异常: %s", resource_id, payload)
             return {}, [], bundle, bundle_index
         _safe_write_json(parent_root / "resource.json", payload)
-        variants = self._extract_resource_variants(data, work_src)
-        if not variants:
-            variants = [(resource_id, resource_name, work_src)]
+        variants = resource_variants(data, work_src, resource_id, resource_name)
+        _update_catalog(self.catalog.upsert_variants, artist_id, work_id, resource_id, named_variants(data, variants))
         return data, variants, active_bundle, bundle_index
 
     def _current_bucket_hex(self) -> str:
@@ -788,32 +1392,71 @@ class LTFCDownload:
         bundle: SessionBundle,
         bundle_index: int,
         work_src: str,
+        *,
+        attempt: int = 0,
+        defer: bool = False,
+        existing: Optional[Set[str]] = None,
     ) -> Optional[Path]:
+        """下载单个瓦片。
+
+        existing 为调用方预先列出的 tile 目录文件名集合；给出时据此判断瓦片是否已下载，
+        不再逐个瓦片查询存储(S3 上每次都是一个 HEAD 请求)。
+
+        defer=True 时，网络异常与 5xx/429 这类暂时性失败不会在当前线程 sleep，
+        而是抛出 RetryLater 交给调用方重新排期；attempt 为此前已失败的次数。
+        返回 None 表示坐标越界(接口返回非图片)；重试次数或预算用尽时抛出 TileGaveUp。
+        """
         tile_dir = self._tile_dir(artist_id, work_id, parent_resource_id, child_resource_id)
-        tile_dir.mkdir(parents=True, exist_ok=True)
         tile_path = tile_dir / f"{x}_{y}.jpg"
-        if tile_path.exists():
+        if existing is not None:
+            tile_exists = tile_path.name in existing
+        else:
+            with PROFILER.stage("fs"):
+                tile_exists = STORAGE.exists(_storage_key(tile_path))
+        if tile_exists:
+            TILE_REQUESTS.inc(outcome="skipped_existing")
             return tile_path
 
         base = BASE_TILE_URL.format(resource_id=child_resource_id, x=x, y=y)
-        if work_src == "SUFA":
-            url = self.get_SUFA_detail_url(base)
-        else:
-            url = self.get_SUHA_detail_url(base)
+        sign_started = time.perf_counter()
+        with PROFILER.stage("sign"):
+            if work_src == "SUFA":
+                url = self.get_SUFA_detail_url(base)
+            else:
+                url = self.get_SUHA_detail_url(base)
+        sign_ms = round((time.perf_counter() - sign_started) * 1000, 1)
 
-        retry_schedule = TILE_RETRY_DELAYS if USE_PROXY else TILE_RETRY_DELAYS[:1]
-        attempt = 0
+        if attempt == 0:
+            TILE_RETRY.record_request()
         current_bundle = bundle
         current_index = bundle_index
         replacement_attempts = 0
-        while attempt < len(retry_schedule):
-            delay = retry_schedule[attempt]
+        while True:
+            if attempt or replacement_attempts:
+                RETRIES.inc(kind="tile", endpoint="tile")
+            proxy_label = _proxy_label(current_bundle.session)
+            trace = {
+                "resource": child_resource_id,
+                "x": x,
+                "y": y,
+                "proxy": proxy_label,
+                "token": _token_id(current_bundle.tour_token),
+                "attempt": attempt + 1,
+                "replacements": replacement_attempts,
+                "sign_ms": sign_ms,
+            }
+            started = time.perf_counter()
             try:
-                response = current_bundle.session.get(url, timeout=DEFAULT_TIMEOUT)
+                with PROFILER.stage("network_tile"):
+                    response, current_bundle, current_index, hedge_state = self._get_tile(url, current_bundle, current_index)
             except requests.RequestException as exc:
+                total_ms = round((time.perf_counter() - started) * 1000, 1)
                 if USE_PROXY and self.key and _is_proxy_auth_error(exc):
+                    _trace("tile", outcome="proxy_auth", error=str(exc), total_ms=total_ms, **trace)
+                    TILE_REQUESTS.inc(outcome="proxy_auth")
+                    PROXY_AUTH_ERRORS.inc(source="tile")
                     replacement_attempts += 1
-                    if replacement_attempts >= MAX_PROXY_RETRIES:
+                    if REPLACEMENT_RETRY.next_delay(ProxyAuthError(str(exc)), replacement_attempts) is None:
                         logger.error(
                             "备用会话多次认证失败 artist=%s work=%s resource=%s (%s,%s)",
                             artist_name,
@@ -822,9 +1465,16 @@ class LTFCDownload:
                             x,
                             y,
                         )
-                        break
+                        raise TileGaveUp(f"({x},{y}) 备用会话多次认证失败")
                     current_bundle = self._replace_secondary_session(current_index, force_new_token=True)
                     continue
+                _trace("tile", outcome="error", error=str(exc), total_ms=total_ms, **trace)
+                TILE_REQUESTS.inc(outcome="error")
+                _record_outcome(OUTCOME_ERROR)
+                if self.proxy_leases is not None:
+                    self.proxy_leases.record_result(current_bundle.session.proxies, False)
+                failure: Exception = exc
+                attempt += 1
                 logger.warning(
                     "下载瓦片失败 artist=%s(%s) work=%s(%s) resource=%s (%s,%s) attempt=%s/%s: %s",
                     artist_name,
@@ -834,62 +1484,129 @@ class LTFCDownload:
                     child_resource_id,
                     x,
                     y,
-                    attempt + 1,
-                    len(retry_schedule),
+                    attempt,
+                    TILE_RETRY.policy_for(failure).max_attempts,
                     exc,
                 )
-                time.sleep(delay)
-                attempt += 1
-                continue
+            else:
+                elapsed = time.perf_counter() - started
+                if hedge_state != NOT_HEDGED:
+                    proxy_label = _proxy_label(current_bundle.session)
+                    trace.update(hedge=hedge_state, proxy=proxy_label)
+                TILE_LATENCY.observe(elapsed, proxy=proxy_label)
+                trace.update(
+                    status=response.status_code,
+                    bytes=len(response.content),
+                    ttfb_ms=round(response.elapsed.total_seconds() * 1000, 1),
+                    total_ms=round(elapsed * 1000, 1),
+                )
+                if response.status_code in (407, 408) and USE_PROXY and self.key:
+                    _trace("tile", outcome="proxy_auth", **trace)
+                    TILE_REQUESTS.inc(outcome="proxy_auth")
+                    PROXY_AUTH_ERRORS.inc(source="tile")
+                    replacement_attempts += 1
+                    if REPLACEMENT_RETRY.next_delay(ProxyAuthError(str(response.status_code)), replacement_attempts) is None:
+                        logger.error(
+                            "备用会话多次返回 %s artist=%s work=%s resource=%s (%s,%s)",
+                            response.status_code,
+                            artist_name,
+                            work_name,
+                            child_resource_id,
+                            x,
+                            y,
+                        )
+                        raise TileGaveUp(f"({x},{y}) 备用会话多次返回 {response.status_code}")
+                    force_new_token = response.status_code == 407
+                    current_bundle = self._replace_secondary_session(current_index, force_new_token=force_new_token)
+                    continue
 
-            if response.status_code in (407, 408) and USE_PROXY and self.key:
-                replacement_attempts += 1
-                if replacement_attempts >= MAX_PROXY_RETRIES:
-                    logger.error(
-                        "备用会话多次返回 %s artist=%s work=%s resource=%s (%s,%s)",
-                        response.status_code,
-                        artist_name,
-                        work_name,
-                        child_resource_id,
-                        x,
-                        y,
-                    )
-                    break
-                force_new_token = response.status_code == 407
-                current_bundle = self._replace_secondary_session(current_index, force_new_token=force_new_token)
-                continue
+                if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("image"):
+                    try:
+                        if self.tile_writer is not None:
+                            # 队列满时在此阻塞，形成背压
+                            with PROFILER.stage("fs_enqueue"):
+                                self.tile_writer.submit(tile_path, response.content)
+                        else:
+                            with PROFILER.stage("fs"):
+                                STORAGE.write_bytes(_storage_key(tile_path), response.content)
+                    except Exception as exc:
+                        _trace("tile", outcome="write_error", error=str(exc), **trace)
+                        logger.error("写入瓦片文件失败 %s: %s", tile_path, exc)
+                        raise TileGaveUp(f"({x},{y}) 写入失败: {exc}") from exc
+                    _trace("tile", outcome="ok", **trace)
+                    TILE_REQUESTS.inc(outcome="ok")
+                    _record_outcome(OUTCOME_OK)
+                    if self.hedger is not None:
+                        self.hedger.tracker.observe(elapsed)
+                    TILES_DOWNLOADED.inc()
+                    TILE_BYTES.inc(len(response.content))
+                    if self.proxy_leases is not None:
+                        self.proxy_leases.record_result(current_bundle.session.proxies, True)
+                        self.proxy_leases.record_bytes(len(response.content))
+                    TILE_SUMMARY.record(len(response.content))
+                    logger.debug("saved tile %s", tile_path)
+                    return tile_path
 
-            if response.status_code == 200 and response.headers.get("Content-Type", "").startswith("image"):
                 try:
-                    tile_path.write_bytes(response.content)
-                except OSError as exc:
-                    logger.error("写入瓦片文件失败 %s: %s", tile_path, exc)
-                    return None
-                logger.info("saved tile %s", tile_path)
-                return tile_path
-
-            try:
-                data = response.json()
-                message = data.get("error", data)
-            except ValueError:
-                message = response.text
+                    data = response.json()
+                    message = data.get("error", data)
+                except ValueError:
+                    message = response.text
+
+                if response.status_code >= 500 or response.status_code == 429:
+                    failure = TileServerError(f"status={response.status_code}")
+                    outcome = "server_error"
+                    _record_outcome(OUTCOME_RATE_LIMITED if response.status_code == 429 else OUTCOME_ERROR)
+                else:
+                    # 越界探测属于正常流程，不计入错误率
+                    failure = TileNotImage(f"status={response.status_code}")
+                    outcome = "not_image"
+                    _record_outcome(OUTCOME_OK)
+                _trace("tile", outcome=outcome, **trace)
+                TILE_REQUESTS.inc(outcome=outcome)
+                attempt += 1
+                logger.warning(
+                    "下载瓦片失败 artist=%s work=%s resource=%s x=%s y=%s: status=%s message=%s (%s/%s)",
+                    artist_name,
+                    work_name,
+                    child_resource_id,
+                    x,
+                    y,
+                    response.status_code,
+                    message,
+                    attempt,
+                    TILE_RETRY.policy_for(failure).max_attempts,
+                )
 
-            logger.warning(
-                "下载瓦片失败 artist=%s work=%s resource=%s x=%s y=%s: status=%s message=%s (%s/%s)",
-                artist_name,
-                work_name,
-                child_resource_id,
-                x,
-                y,
-                response.status_code,
-                message,
-                attempt + 1,
-                len(retry_schedule),
-            )
+            delay = TILE_RETRY.next_delay(failure, attempt)
+            if delay is None:
+                if isinstance(failure, TileNotImage):
+                    return None
+                raise TileGaveUp(f"({x},{y}) 重试 {attempt} 次后放弃: {failure}") from failure
+            if defer and not isinstance(failure, TileNotImage):
+                raise RetryLater(delay, attempt, failure)
             time.sleep(delay)
-            attempt += 1
-        return None
 
+    def _retry_deferred_tiles(
+        self,
+        deferred: DeferredQueue[Tuple[int, int, int]],
+        fetch: Callable[[int, int, int], Optional[Path]],
+    ) -> Tuple[int, List[Tuple[int, int]]]:
+        """重试已到期的延后瓦片，未到期的留在队列中。返回 (成功数, 放弃的坐标)。"""
+        succeeded = 0
+        abandoned: List[Tuple[int, int]] = []
+        for x, y, attempt in deferred.pop_due():
+            try:
+                result = fetch(x, y, attempt)
+            except RetryLater as retry:
+                deferred.push((x, y, retry.attempt), retry.delay)
+                continue
+            except TileGaveUp:
+                abandoned.append((x, y))
+                continue
+            if result is not None:
+                succeeded += 1
+        return succeeded, abandoned
 
     def fetch_all_tile(
         self,
@@ -901,6 +1618,27 @@ class LTFCDownload:
         child_resource_id: str,
         work_src: str,
     ) -> bool:
+        """扫描并下载子资源的全部瓦片。
+
+        扫描结束时仍有未到期的延后瓦片，则保存扫描状态并抛出 RetryLater，
+        由调用方把资源任务重新排期，当前线程不在此等待；再次调用时只处理这些瓦片。
+        """
+        downloaded, _ = self._download_tiles(
+            artist_id, artist_name, work_id, work_name, parent_resource_id, child_resource_id, work_src
+        )
+        return downloaded
+
+    def _download_tiles(
+        self,
+        artist_id: str,
+        artist_name: str,
+        work_id: str,
+        work_name: str,
+        parent_resource_id: str,
+        child_resource_id: str,
+        work_src: str,
+    ) -> Tuple[bool, int]:
+        """fetch_all_tile 的实现，另外返回新写入的瓦片数。"""
         if self._is_resource_completed(artist_id, work_id, parent_resource_id, child_resource_id):
             logger.info(
                 "artist=%s work=%s resource=%s 已完成，跳过下载。",
@@ -908,46 +1646,152 @@ class LTFCDownload:
                 work_name,
                 child_resource_id,
             )
-            return True
+            return True, 0
         if not self.secondary_sessions:
             raise RuntimeError("备用会话列表为空，无法下载切片")
 
+        binding: Dict[str, int] = {}
+        tile_dir = self._tile_dir(artist_id, work_id, parent_resource_id, child_resource_id)
+        # 整个目录只列举一次，已下载的瓦片不再逐个查询存储
+        with PROFILER.stage("fs"):
+            existing = set(STORAGE.file_sizes(_storage_key(tile_dir)))
+
+        def _fetch(x: int, y: int, attempt: int) -> Optional[Path]:
+            # 重试的瓦片换一个会话，避免反复撞上同一个慢代理
+            if attempt:
+                bundle, bundle_index = self._next_secondary_bundle()
+            else:
+                bundle, bundle_index = self._bind_secondary_bundle(binding)
+            result = self.fetch_tile(
+                artist_id,
+                artist_name,
+                work_id,
+                work_name,
+                parent_resource_id,
+                child_resource_id,
+                x,
+                y,
+                bundle,
+                bundle_index,
+                work_src,
+                attempt=attempt,
+                defer=True,
+                existing=existing,
+            )
+            if result is not None and result.name not in existing:
+                scan.saved += 1
+            return result
+
+        with self._pending_scans_lock:
+            scan = self._pending_scans.pop(str(tile_dir), None)
+        if scan is None:
+            scan = _TileScan(DeferredQueue())
+            self._scan_tiles(scan, _fetch, artist_name, work_name, child_resource_id)
+
+        succeeded, dropped = self._retry_deferred_tiles(scan.deferred, _fetch)
+        scan.downloaded = scan.downloaded or succeeded > 0
+        scan.abandoned.extend(dropped)
+        if scan.deferred:
+            delay = scan.deferred.next_due_in()
+            with self._pending_scans_lock:
+                self._pending_scans[str(tile_dir)] = scan
+            logger.info(
+                "artist=%s work=%s resource=%s 还有 %s 个瓦片等待重试，%.1fs 后重新排期",
+                artist_name,
+                work_name,
+                child_resource_id,
+                len(scan.deferred),
+                delay,
+            )
+            raise RetryLater(delay, 0)
+
+        abandoned = scan.abandoned
+        if self.tile_writer is not None:
+            unwritten = self.tile_writer.drain(tile_dir)
+            scan.saved -= len(unwritten)
+            # 写盘失败的瓦片同样视为未完成，文件名即坐标 x_y.jpg
+            abandoned.extend((int(x), int(y)) for x, y in (path.stem.split("_") for path in unwritten))
+        if abandoned or scan.truncated:
+            logger.warning(
+                "artist=%s work=%s resource=%s 有 %s 个瓦片重试后仍失败%s，未写入完成标记: %s",
+                artist_name,
+                work_name,
+                child_resource_id,
+                len(abandoned),
+                "且有列未扫完" if scan.truncated else "",
+                abandoned[:10],
+            )
+        elif scan.downloaded:
+            self._mark_resource_completed(artist_id, work_id, parent_resource_id, child_resource_id)
+        else:
+            logger.warning(
+                "artist=%s work=%s resource=%s 未找到有效切片，未写入完成标记",
+                artist_name,
+                work_name,
+                child_resource_id,
+            )
+        return scan.downloaded, scan.saved
+
+    def _scan_tiles(
+        self,
+        scan: _TileScan,
+        fetch: Callable[[int, int, int], Optional[Path]],
+        artist_name: str,
+        work_name: str,
+        child_resource_id: str,
+    ) -> None:
+        """逐列向下扫描瓦片直至连续 3 列为空；暂时性失败的瓦片延后重试，扫描继续推进。
+
+        延后或放弃的瓦片不算作该列有效；一列中连续 TILE_MAX_UNRESOLVED_RUN 个瓦片都未确定结果
+        (故障、熔断或预算耗尽时每个瓦片都会失败)就结束该列，避免在故障期间无限向下扫描。
+        """
         x = 0
         max_y_limit: Optional[int] = None
         consecutive_empty_columns = 0
-        any_tile_downloaded = False
-        while True:
+        while consecutive_empty_columns < 3:
             y = 0
             column_success = False
-            current_column = x
-            while True:
-                if max_y_limit is not None and y >= max_y_limit:
-                    break
-
-                bundle, bundle_index = self._next_secondary_bundle()
-
-                result = self.fetch_tile(
-                    artist_id,
-                    artist_name,
-                    work_id,
-                    work_name,
-                    parent_resource_id,
-                    child_resource_id,
-                    x,
-                    y,
-                    bundle,
-                    bundle_index,
-                    work_src,
-                )
+            unresolved_run = 0
+            while max_y_limit is None or y < max_y_limit:
+                try:
+                    result = fetch(x, y, 0)
+                except RetryLater as retry:
+                    scan.deferred.push((x, y, retry.attempt), retry.delay)
+                    result = None
+                except TileGaveUp:
+                    # 放弃的瓦片不代表越界，阻止写入完成标记
+                    scan.abandoned.append((x, y))
+                    result = None
+                else:
+                    if result is None:
+                        if max_y_limit is None:
+                            max_y_limit = y
+                        break
                 if result is None:
-                    if max_y_limit is None:
-                        max_y_limit = y
-                    break
+                    unresolved_run += 1
+                    if unresolved_run >= TILE_MAX_UNRESOLVED_RUN:
+                        logger.warning(
+                            "artist=%s work=%s resource=%s 列 %s 连续 %s 个瓦片未能下载，结束该列",
+                            artist_name,
+                            work_name,
+                            child_resource_id,
+                            x,
+                            unresolved_run,
+                        )
+                        scan.truncated = True
+                        break
+                    y += 1
+                    continue
 
+                unresolved_run = 0
                 column_success = True
-                any_tile_downloaded = True
+                scan.downloaded = True
                 y += 1
 
+            succeeded, dropped = self._retry_deferred_tiles(scan.deferred, fetch)
+            scan.downloaded = scan.downloaded or succeeded > 0
+            scan.abandoned.extend(dropped)
+
             if column_success:
                 consecutive_empty_columns = 0
             else:
@@ -957,148 +1801,459 @@ class LTFCDownload:
                     artist_name,
                     work_name,
                     child_resource_id,
-                    current_column,
+                    x,
                     consecutive_empty_columns,
                 )
-                if consecutive_empty_columns >= 3:
-                    if any_tile_downloaded:
-                        self._mark_resource_completed(artist_id, work_id, parent_resource_id, child_resource_id)
-                    else:
-                        logger.warning(
-                            "artist=%s work=%s resource=%s 连续 %s 列无有效切片，未写入完成标记",
-                            artist_name,
-                            work_name,
-                            child_resource_id,
-                            consecutive_empty_columns,
-                        )
-                    return any_tile_downloaded
-
             x += 1
 
-        return any_tile_downloaded
+    def _list_artist_works(
+        self,
+        artist_id: str,
+        bundle: SessionBundle,
+        bundle_index: Optional[int],
+    ) -> Tuple[str, List[Tuple[Dict, str]], SessionBundle, Optional[int]]:
+        paintings, calligraphies, artist_name, bundle, bundle_index = self.get_all_of_artist(artist_id, bundle, bundle_index)
+        combined = [(work, "SUHA") for work in paintings] + [(work, "SUFA") for work in calligraphies]
+        return artist_name, combined, bundle, bundle_index
 
-    def for_each_artist(self, index: int, artist_id: str) -> None:
+    def resolve_work(
+        self,
+        artist_id: str,
+        artist_name: str,
+        work: Dict,
+        work_src: str,
+        bundle: SessionBundle,
+        bundle_index: Optional[int],
+    ) -> Tuple[List[ResourceTask], bool, SessionBundle, Optional[int]]:
+        """拉取作品的子资源与资源详情，返回待下载的资源任务以及是否找到了子资源。"""
+        work_id = work.get("Id") or ""
+        work_name = work.get("name") or work_id
+        sub_list, parent_suha, resolved_src, bundle, bundle_index = self.get_sub_list(
+            artist_id,
+            work,
+            work_src,
+            bundle,
+            bundle_index,
+        )
+        tasks: List[ResourceTask] = []
+        handled = False
+        for sub in sub_list:
+            suha = sub.get("suha") if isinstance(sub, dict) else None
+            if resolved_src == "SUFA" and not suha:
+                suha = sub.get("sufa") if isinstance(sub, dict) else None
+            resource_id = suha.get("Id") if isinstance(suha, dict) else None
+            if not resource_id:
+                logger.warning("作品 %s 的子资源缺少 Id: %s", work_id, sub)
+                continue
+
+            resource_name = suha.get("name") or resource_id
+            resource_data, variants, bundle, bundle_index = self.get_resource(
+                artist_id,
+                work_id,
+                work_src,
+                resource_id,
+                resource_name,
+                bundle,
+                bundle_index,
+            )
+            if not variants:
+                logger.warning(
+                    "资源 %s 缺少可用 resourceId，跳过。结构: %s",
+                    resource_id,
+                    resource_data,
+                )
+                continue
+
+            handled = True
+            if ONE_IMAGE_PER_WORK:
+                variants = variants[:1]
+            for child_id, _, variant_src in variants:
+                tasks.append(ResourceTask(artist_id, artist_name, work_id, work_name, resource_id, child_id, variant_src))
+
+        if not handled:
+            fallback_suha = parent_suha if isinstance(parent_suha, dict) else {}
+            resource_id = fallback_suha.get("Id") or work_id
+            resource_name = fallback_suha.get("name") or work_name
+            _, variants, bundle, bundle_index = self.get_resource(
+                artist_id,
+                work_id,
+                work_src,
+                resource_id,
+                resource_name,
+                bundle,
+                bundle_index,
+            )
+            for child_id, _, variant_src in variants or [(resource_id, resource_name, work_src)]:
+                tasks.append(ResourceTask(artist_id, artist_name, work_id, work_name, resource_id, child_id, variant_src))
+        return tasks, handled, bundle, bundle_index
+
+    def resource_tasks(
+        self,
+        artist_id: str,
+        work_id: str,
+        resource_id: str,
+        work_src: str,
+        bundle: SessionBundle,
+        bundle_index: Optional[int],
+        *,
+        child_resource_id: Optional[str] = None,
+        work_name: Optional[str] = None,
+    ) -> List[ResourceTask]:
+        """为单个资源构造下载任务；未指定子资源时通过 getResource 展开全部变体。"""
+        artist_name = self.artist_name(artist_id)
+        work_name = work_name or work_id
+        if child_resource_id:
+            return [ResourceTask(artist_id, artist_name, work_id, work_name, resource_id, child_resource_id, work_src)]
+        # 目录里已有该资源完整的子资源列表时直接使用，省去一次 getResource
+        known = self.catalog.listed_variants(artist_id, work_id, resource_id)
+        if known:
+            return [ResourceTask(artist_id, artist_name, work_id, work_name, resource_id, child_id, work_src) for child_id in known]
+        _, variants, _, _ = self.get_resource(artist_id, work_id, work_src, resource_id, resource_id, bundle, bundle_index)
+        return [
+            ResourceTask(artist_id, artist_name, work_id, work_name, resource_id, child_id, variant_src)
+            for child_id, _, variant_src in variants or [(resource_id, resource_id, work_src)]
+        ]
+
+    def fetch_region(self, task: ResourceTask, x0: int, y0: int, x1: int, y1: int) -> Tuple[int, int]:
+        """下载 [x0, x1) × [y0, y1) 范围内的瓦片，返回 (新写入数, 失败数)；已存在的瓦片两者都不计。"""
+        saved = failed = 0
+        binding: Dict[str, int] = {}
+        tile_dir = self._tile_dir(task.artist_id, task.work_id, task.parent_resource_id, task.child_resource_id)
+        existing = set(STORAGE.file_sizes(_storage_key(tile_dir)))
+        for x in range(x0, x1):
+            for y in range(y0, y1):
+                bundle, bundle_index = self._bind_secondary_bundle(binding)
+                try:
+                    result = self.fetch_tile(
+                        task.artist_id,
+                        task.artist_name,
+                        task.work_id,
+                        task.work_name,
+                        task.parent_resource_id,
+                        task.child_resource_id,
+                        x,
+                        y,
+                        bundle,
+                        bundle_index,
+                        task.work_src,
+                        existing=existing,
+                    )
+                except TileGaveUp:
+                    result = None
+                if result is None:
+                    failed += 1
+                elif result.name not in existing:
+                    saved += 1
+        return saved, failed
+
+    def fetch_resource(self, task: ResourceTask) -> bool:
+        """下载一个资源任务；仍有瓦片等待重试时抛出 RetryLater，调用方应延后再次调用。"""
+        return self.fetch_all_tile(
+            task.artist_id,
+            task.artist_name,
+            task.work_id,
+            task.work_name,
+            task.parent_resource_id,
+            task.child_resource_id,
+            task.work_src,
+        )
+
+    def fetch_resource_tiles(self, task: ResourceTask) -> int:
+        """同 fetch_resource，返回本任务新写入的瓦片数(已存在的瓦片不计)。"""
+        _, saved = self._download_tiles(
+            task.artist_id,
+            task.artist_name,
+            task.work_id,
+            task.work_name,
+            task.parent_resource_id,
+            task.child_resource_id,
+            task.work_src,
+        )
+        return saved
+
+    def for_each_artist(self, index: int, artist_id: str) -> str:
         if self._is_artist_completed(artist_id):
             logger.info("艺术家 %s 已完成，跳过。", artist_id)
-            return
+            return "skipped"
+
+        with self._pending_scans_lock:
+            resuming = artist_id in self._pending_artists
+        if resuming:
+            # 重新排期的艺术家只重试冷却中的资源，不应触发主会话整池重建
+            return self.process_artist(artist_id, *self.pick_primary_bundle(index))
+        with self._hold_primary_bundle(index) as (bundle, bundle_index):
+            return self.process_artist(artist_id, bundle, bundle_index)
+
+    def process_artist(self, artist_id: str, bundle: SessionBundle, bundle_index: Optional[int]) -> str:
+        """下载艺术家的全部作品。
+
+        作品都处理完后若仍有资源在冷却，保存进度并抛出 RetryLater，由调用方延后再次调用，
+        再次调用时只重试这些资源，当前线程不在此等待。
+        """
+        with self._pending_scans_lock:
+            progress = self._pending_artists.pop(artist_id, None)
+        if progress is None:
+            progress = self._process_works(artist_id, bundle, bundle_index)
+            if progress is None:
+                return "empty"
+        else:
+            progress.downloaded = self._retry_deferred_resources(progress.deferred) or progress.downloaded
 
-        bundle, bundle_index = self._get_primary_bundle(index)
+        if progress.deferred:
+            delay = progress.deferred.next_due_in()
+            with self._pending_scans_lock:
+                self._pending_artists[artist_id] = progress
+            logger.info("艺术家 %s 还有 %s 个资源在冷却，%.1fs 后重新排期", artist_id, len(progress.deferred), delay)
+            raise RetryLater(delay, 0)
 
-        paintings, calligraphies, artist_name, bundle, bundle_index = self.get_all_of_artist(artist_id, bundle, bundle_index)
-        combined = [(work, "SUHA") for work in paintings] + [(work, "SUFA") for work in calligraphies]
+        if progress.downloaded:
+            self._mark_artist_completed(artist_id)
+            return "completed"
+        return "incomplete"
+
+    def _process_works(self, artist_id: str, bundle: SessionBundle, bundle_index: Optional[int]) -> Optional[_ArtistProgress]:
+        """逐个作品下载资源，遇到冷却中的资源先处理后面的作品；艺术家无作品时返回 None。"""
+        artist_name, combined, bundle, bundle_index = self._list_artist_works(artist_id, bundle, bundle_index)
         if not combined:
             logger.info("艺术家 %s 无可下载作品", artist_name)
-            return
+            return None
 
         work_iter = tqdm(combined, desc=f"{artist_name}", unit="work")
         artist_completed = False
+        deferred: DeferredQueue[ResourceTask] = DeferredQueue()
         for work, work_src in work_iter:
-            work_downloaded = False
-            work_id = work.get("Id")
-            if not work_id:
+            if not work.get("Id"):
                 logger.warning("艺术家 %s 的作品条目缺少 Id: %s", artist_id, work)
                 continue
-            work_name = work.get("name") or work_id
 
-            sub_list, parent_suha, resolved_src, bundle, bundle_index = self.get_sub_list(
+            tasks, handled, bundle, bundle_index = self.resolve_work(
                 artist_id,
+                artist_name,
                 work,
                 work_src,
                 bundle,
                 bundle_index,
             )
-            handled = False
-            for sub in sub_list:
-                suha = sub.get("suha") if isinstance(sub, dict) else None
-                if resolved_src == "SUFA" and not suha:
-                    suha = sub.get("sufa") if isinstance(sub, dict) else None
-                resource_id = suha.get("Id") if isinstance(suha, dict) else None
-                if not resource_id:
-                    logger.warning("作品 %s 的子资源缺少 Id: %s", work_id, sub)
-                    continue
+            work_downloaded = handled
+            for task in tasks:
+                try:
+                    if self.fetch_resource(task):
+                        work_downloaded = True
+                except RetryLater as retry:
+                    # 有瓦片在冷却，先处理后面的作品，到期后再回来
+                    deferred.push(task, retry.delay)
+            artist_completed = artist_completed or work_downloaded
+            artist_completed = self._retry_deferred_resources(deferred) or artist_completed
+            if not handled and ONE_IMAGE_PER_WORK:
+                break
 
-                resource_name = suha.get("name") or resource_id
-                resource_data, variants, bundle, bundle_index = self.get_resource(
-                    artist_id,
-                    work_id,
-                    work_src,
-                    resource_id,
-                    resource_name,
-                    bundle,
-                    bundle_index,
-                )
-                if not variants:
-                    logger.warning(
-                        "资源 %s 缺少可用 resourceId，跳过。结构: %s",
-                        resource_id,
-                        resource_data,
-                    )
-                    continue
+        return _ArtistProgress(deferred, artist_completed)
 
-                handled = True
-                for child_id, resource_variant_name, work_src in variants:
-                    success = self.fetch_all_tile(
-                        artist_id,
-                        artist_name,
-                        work_id,
-                        work_name,
-                        resource_id,
-                        child_id,
-                        work_src,
-                    )
-                    if success:
-                        work_downloaded = True
-                    if ONE_IMAGE_PER_WORK:
-                        break
+    def _retry_deferred_resources(self, deferred: DeferredQueue[ResourceTask]) -> bool:
+        """重试已到期的资源任务，返回是否有资源下载到了瓦片。"""
+        downloaded = False
+        for task in deferred.pop_due():
+            try:
+                downloaded = self.fetch_resource(task) or downloaded
+            except RetryLater as retry:
+                deferred.push(task, retry.delay)
+        return downloaded
+
+    def _run_artist(self, index: int, artist_id: str) -> Optional[float]:
+        """处理一个艺术家；只剩冷却中的资源时返回建议的等待秒数，由 download 重新排期。"""
+        started = time.time()
+        try:
+            status = self.for_each_artist(index, artist_id)
+        except RetryLater as retry:
+            return retry.delay
+        except Exception as exc:
+            logger.exception("处理艺术家 %s 失败: %s", artist_id, exc)
+            self.manifest.record(artist_id, "failed", error=str(exc), seconds=round(time.time() - started, 1))
+            ARTISTS_PROCESSED.inc()
+            return None
+        self.manifest.record(artist_id, status, seconds=round(time.time() - started, 1))
+        ARTISTS_PROCESSED.inc()
+        return None
 
-            if not handled:
-                fallback_suha = parent_suha if isinstance(parent_suha, dict) else {}
-                resource_id = fallback_suha.get("Id") or work_id
-                resource_name = fallback_suha.get("name") or work_name
-                _, variants, bundle, bundle_index = self.get_resource(
-                    artist_id,
-                    work_id,
-                    work_src,
-                    resource_id,
-                    resource_name,
-                    bundle,
-                    bundle_index,
+    def seed_queue(self, queue: JobQueue) -> int:
+        added = 0
+        for index, artist_id in enumerate(self.artists_id):
+            payload = {"artist_id": artist_id, "index": index}
+            if queue.enqueue("artist", f"artist:{artist_id}", payload, group=artist_id):
+                added += 1
+        return added
+
+    def run_queue_worker(self, queue: JobQueue) -> None:
+        def handle_artist(job: Job) -> None:
+            artist_id = job.payload["artist_id"]
+            if self._is_artist_completed(artist_id):
+                logger.info("艺术家 %s 已完成，跳过。", artist_id)
+                self.manifest.record(artist_id, "skipped")
+                return
+            with self._hold_primary_bundle(int(job.payload.get("index", 0))) as (bundle, bundle_index):
+                artist_name, combined, _, _ = self._list_artist_works(artist_id, bundle, bundle_index)
+            if not combined:
+                logger.info("艺术家 %s 无可下载作品", artist_name)
+                self.manifest.record(artist_id, "empty")
+                return
+            for work, work_src in combined:
+                work_id = work.get("Id")
+                if not work_id:
+                    logger.warning("艺术家 %s 的作品条目缺少 Id: %s", artist_id, work)
+                    continue
+                queue.enqueue(
+                    "work",
+                    f"work:{artist_id}:{work_src}:{work_id}",
+                    {
+                        "artist_id": artist_id,
+                        "artist_name": artist_name,
+                        "work": {"Id": work_id, "name": work.get("name")},
+                        "work_src": work_src,
+                    },
+                    group=artist_id,
                 )
-                for child_id, variant_name, work_src in variants or [(resource_id, resource_name, work_src)]:
-                    success = self.fetch_all_tile(
-                        artist_id,
-                        artist_name,
-                        work_id,
-                        work_name,
-                        resource_id,
-                        child_id,
-                        work_src,
-                    )
-                    if success:
-                        work_downloaded = True
-                if ONE_IMAGE_PER_WORK:
-                    break
-
-            if handled:
-                work_downloaded = True
 
-            if work_downloaded:
-                artist_completed = True
+        def handle_work(job: Job) -> None:
+            payload = job.payload
+            bundle, bundle_index = self.pick_primary_bundle(int(job.id))
+            tasks, _, _, _ = self.resolve_work(
+                payload["artist_id"],
+                payload["artist_name"],
+                payload["work"],
+                payload["work_src"],
+                bundle,
+                bundle_index,
+            )
+            for task in tasks:
+                queue.enqueue(
+                    "resource",
+                    f"resource:{task.artist_id}:{task.work_id}:{task.parent_resource_id}:{task.child_resource_id}",
+                    asdict(task),
+                    group=task.artist_id,
+                )
 
-        if artist_completed:
+        def handle_resource(job: Job) -> None:
+            task = ResourceTask(**job.payload)
+            downloaded = self.fetch_resource(task)
+            # 未完成的资源抛异常交给队列重试，重试用尽后标记 FAILED，艺术家不会被误标为完成
+            if not downloaded or not self._is_resource_completed(
+                task.artist_id, task.work_id, task.parent_resource_id, task.child_resource_id
+            ):
+                raise RuntimeError(f"资源 {task.child_resource_id} 未完成下载")
+
+        def on_artist_done(artist_id: str, status: Dict[str, int]) -> None:
+            if status.get(FAILED):
+                logger.warning("艺术家 %s 有 %s 个任务最终失败，未写入完成标记", artist_id, status[FAILED])
+                self.manifest.record(artist_id, "failed", jobs=status)
+                return
+            if self._is_artist_completed(artist_id):
+                return
+            # 资源任务可能由其他节点完成，以共享存储上的完成标记为准；一个瓦片都没下到的艺术家不标记
+            if not self._has_completed_resource(artist_id):
+                logger.warning("艺术家 %s 的任务均已结束但没有下载到任何瓦片，未写入完成标记", artist_id)
+                self.manifest.record(artist_id, "incomplete", jobs=status)
+                return
             self._mark_artist_completed(artist_id)
+            self.manifest.record(artist_id, "completed", jobs=status)
+
+        worker = QueueWorker(
+            queue,
+            {"artist": handle_artist, "work": handle_work, "resource": handle_resource},
+            threads=self.worker_threads,
+            on_group_done=on_artist_done,
+        )
+        QUEUE_DEPTH.set_function(lambda: sum(v for k, v in queue.stats().items() if k.endswith(".pending")), queue="jobs")
+        logger.info("以队列工作节点 %s 运行，线程数 %s", worker.owner, self.worker_threads)
+        worker.run()
+        self.manifest.save()
 
     def download(self) -> None:
-        pool = ThreadPoolExecutor(max_workers=self.num)
-        tasks = [pool.submit(self.for_each_artist, idx, artist_id) for idx, artist_id in enumerate(self.artists_id)]
-        wait(tasks, return_when=ALL_COMPLETED)
+        pool = ThreadPoolExecutor(max_workers=self.worker_threads)
+        # _work_queue 为 ThreadPoolExecutor 内部队列，仅用于观测排队深度
+        QUEUE_DEPTH.set_function(lambda: pool._work_queue.qsize(), queue="artists")
+        pending = {pool.submit(self._run_artist, idx, artist_id): (idx, artist_id) for idx, artist_id in enumerate(self.artists_id)}
+        # 只剩冷却资源的艺术家由主线程排期，到期后重新提交，工作线程不等待
+        deferred: DeferredQueue[Tuple[int, str]] = DeferredQueue()
+        while pending or deferred:
+            for item in deferred.pop_due():
+                pending[pool.submit(self._run_artist, *item)] = item
+            done, _ = wait(pending, timeout=deferred.next_due_in() if deferred else None, return_when=FIRST_COMPLETED)
+            for task in done:
+                item = pending.pop(task)
+                delay = task.result()
+                if delay is not None:
+                    deferred.push(item, delay)
+        self.manifest.save()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="中华珍宝馆数据下载")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="i/N", help="只处理第 i 个分片(从 0 开始，共 N 片)")
+    parser.add_argument("--merge-manifests", action="store_true", help="合并各分片清单为全局完成报告后退出")
+    parser.add_argument("--queue", default=None, metavar="URL", help="以共享任务队列工作节点运行，如 sqlite:///data/jobs.db 或 redis://host:6379/0")
+    parser.add_argument("--seed", action="store_true", help="配合 --queue，先把(当前分片的)艺术家写入队列")
+    parser.add_argument("--autoscale", action="store_true", help="运行时按吞吐、错误率与限流信号自动调整并发")
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT", help="以常驻服务运行，在本地端口接收下载任务")
+    return parser.parse_args(argv)
+
+
+def merge_shard_reports() -> None:
+    if not any(MANIFEST_DIR.glob("shard-*.json")):
+        raise SystemExit(f"{MANIFEST_DIR} 下没有分片清单，请先用 --shard i/N 运行至少一个分片")
+    artist_ids = ArtistIndex.load(ARTIST_CSV).ids
+    report = merge_manifests(MANIFEST_DIR, artist_ids)
+    logger.info(
+        "已合并 %s 个分片清单: 共 %s 位艺术家，已记录 %s 位，状态 %s，未处理 %s 位",
+        len(report["shards"]),
+        report["artists_total"],
+        report["artists_recorded"],
+        report["statuses"],
+        len(report["missing"]),
+    )
 
 
 def main() -> None:
+    started = time.perf_counter()
+    args = parse_args()
+    if args.merge_manifests:
+        merge_shard_reports()
+        return
     # num = 1 if not USE_PROXY else 5
     num = 1 if not USE_PROXY else 10
-    downloader = LTFCDownload(artist_csv=r"data/artists.csv", num=num)
-    downloader.download()
+    log_listener = install_async_logging(logging.getLogger()) if ASYNC_LOGGING else None
+    start_profiling(PROFILE_DIR / f"get_together-{int(time.time())}")
+    tracer = start_tracing()
+    metrics_writer = start_metrics()
+    downloader = LTFCDownload(artist_csv=r"data/artists.csv", num=num, shard=args.shard)
+    controller = start_autoscaling(downloader) if args.autoscale else None
+    STARTUP_SECONDS.set(time.perf_counter() - started)
+    logger.info("启动完成，耗时 %.2fs", time.perf_counter() - started)
+    try:
+        if args.serve is not None:
+            from downloader_service import serve
+
+            serve(downloader, port=args.serve)
+        elif args.queue:
+            queue = open_job_queue(args.queue)
+            if args.seed:
+                logger.info("已向队列新增 %s 个艺术家任务", downloader.seed_queue(queue))
+            downloader.run_queue_worker(queue)
+        else:
+            downloader.download()
+    finally:
+        if controller is not None:
+            controller.stop()
+        if downloader.tile_writer is not None:
+            downloader.tile_writer.close()
+        if downloader.proxy_leases is not None:
+            logger.info("代理租约统计: %s，每 GB 消耗 %.1f 个 IP", downloader.proxy_leases.snapshot(), downloader.proxy_leases.ips_per_gb())
+        if downloader.session_cache is not None:
+            downloader.session_cache.save()
+        metrics_writer.stop()
+        if tracer is not None:
+            tracer.close()
+        if log_listener is not None:
+            log_listener.stop()
     # downloader.for_each_artist(0, "5df8a8c15e3be25e694d7134")
 
 
@@ -0,0 +1,107 @@
+"""对冲请求：慢请求超过动态阈值后，换一条链路再发一份，取先返回的结果。
+
+阈值取最近成功请求耗时的高分位数，对冲次数受 `RetryBudget` 约束(按首发请求的固定比例)，
+避免在整体变慢时把代理流量翻倍。requests 无法中途中断请求，落败的一方在返回后直接关闭。
+"""
+
+import math
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Callable, Deque, Optional, Tuple, TypeVar
+
+from retry_policy import RetryBudget
+
+T = TypeVar("T")
+
+NOT_HEDGED = "not_hedged"
+HEDGE_LOST = "lost"
+HEDGE_WON = "won"
+
+
+class LatencyTracker:
+    def __init__(self, *, window: int = 500, percentile: float = 0.95, min_samples: int = 50, floor: float = 0.5):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.floor = floor
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> Optional[float]:
+        """样本不足时返回 None，表示暂不对冲。"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return max(self.floor, ordered[index])
+
+
+class Hedger:
+    def __init__(self, executor: Executor, tracker: LatencyTracker, budget: RetryBudget):
+        self.executor = executor
+        self.tracker = tracker
+        self.budget = budget
+        self.launched = 0
+        self.won = 0
+
+    def call(
+        self,
+        primary: Callable[[], T],
+        hedge: Callable[[], T],
+        *,
+        discard: Optional[Callable[[T], None]] = None,
+    ) -> Tuple[T, str]:
+        """执行 primary，超过阈值后并发执行 hedge。返回结果及对冲状态(NOT_HEDGED/HEDGE_LOST/HEDGE_WON)。"""
+        self.budget.record_request()
+        first = self.executor.submit(primary)
+        delay = self.tracker.threshold()
+        if delay is None or wait([first], timeout=delay).done or not self.budget.try_acquire():
+            return first.result(), NOT_HEDGED
+
+        self.launched += 1
+        second = self.executor.submit(hedge)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in (first, second):
+                if future not in done:
+                    continue
+                exc = future.exception()
+                if exc is not None:
+                    # 两边都失败时以首发请求的异常为准
+                    if error is None or future is first:
+                        error = exc
+                    continue
+                for loser in pending:
+                    self._discard_later(loser, discard)
+                if future is second:
+                    self.won += 1
+                    return future.result(), HEDGE_WON
+                return future.result(), HEDGE_LOST
+        assert error is not None
+        raise error
+
+    def replace_executor(self, executor: Executor) -> None:
+        """换用新的执行器(例如并发上限变化后)。
+
+        旧执行器不主动 shutdown：正在 call() 中的线程可能仍持有它的引用并提交对冲请求，
+        等引用全部释放后其空闲线程会自行退出。
+        """
+        self.executor = executor
+
+    @staticmethod
+    def _discard_later(future: "Future[T]", discard: Optional[Callable[[T], None]]) -> None:
+        if future.cancel() or discard is None:
+            return
+
+        def _on_done(done: "Future[T]") -> None:
+            if done.exception() is None:
+                discard(done.result())
+
+        future.add_done_callback(_on_done)
@@ -0,0 +1,427 @@
+"""多节点抓取协调用的共享任务队列。
+
+任务分为 artist / work / resource 三类，由各节点上的 `QueueWorker` 租约式领取：
+领取时写入租约到期时间，处理期间后台线程持续心跳续约；节点宕机后租约过期，
+任务会被其他节点重新领取。同一艺术家的任务共享一个 group，group 内所有任务结束
+(且无失败)时回调 `on_group_done`，用于写入艺术家的 .completed 标记。
+
+后端：
+- `sqlite:///path/to/queue.db`: 本地或共享目录上的 SQLite 文件(使用回滚日志而非 WAL，
+  以兼容网络文件系统)。
+- `redis://host:port/db`: 需要安装 redis 库。
+"""
+
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from retry_policy import DeferredQueue, RetryLater
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 5
+IDLE_POLL_SECONDS = 5.0
+# 优先领取更深层的任务，让已开始的艺术家尽快收尾
+KIND_PRIORITY = ("resource", "work", "artist")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    key: str
+    payload: Dict
+    group: Optional[str]
+    attempts: int
+
+
+class JobQueue(ABC):
+    @abstractmethod
+    def enqueue(self, kind: str, key: str, payload: Dict, *, group: Optional[str] = None) -> bool:
+        """按 key 去重入队，返回是否为新任务。"""
+
+    @abstractmethod
+    def lease(self, owner: str, kinds: Sequence[str] = KIND_PRIORITY) -> Optional[Job]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, job: Job, owner: str) -> bool:
+        ...
+
+    @abstractmethod
+    def complete(self, job: Job, owner: str) -> None:
+        ...
+
+    @abstractmethod
+    def fail(self, job: Job, owner: str, error: str) -> None:
+        ...
+
+    @abstractmethod
+    def group_status(self, group: str) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        key TEXT NOT NULL UNIQUE,
+        payload TEXT NOT NULL,
+        grp TEXT,
+        state TEXT NOT NULL DEFAULT 'pending',
+        owner TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        updated REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_state_kind ON jobs(state, kind, id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_grp ON jobs(grp, state);
+    """
+
+    def __init__(self, path: Path, *, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, key: str, payload: Dict, *, group: Optional[str] = None) -> bool:
+        cursor = self._conn().execute(
+            "INSERT OR IGNORE INTO jobs(kind, key, payload, grp, updated) VALUES (?, ?, ?, ?, ?)",
+            (kind, key, json.dumps(payload, ensure_ascii=False), group, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def lease(self, owner: str, kinds: Sequence[str] = KIND_PRIORITY) -> Optional[Job]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET state = 'pending', owner = NULL, updated = ? WHERE state = 'leased' AND lease_expires < ?",
+                (now, now),
+            )
+            row = None
+            for kind in kinds:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state = 'pending' AND kind = ? ORDER BY id LIMIT 1",
+                    (kind,),
+                ).fetchone()
+                if row is not None:
+                    break
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (owner, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return Job(
+            id=str(row["id"]),
+            kind=row["kind"],
+            key=row["key"],
+            payload=json.loads(row["payload"]),
+            group=row["grp"],
+            attempts=row["attempts"] + 1,
+        )
+
+    def heartbeat(self, job: Job, owner: str) -> bool:
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+            (time.time() + self.lease_seconds, time.time(), int(job.id), owner),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, owner: str) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET state = 'done', owner = NULL, error = NULL, updated = ? WHERE id = ? AND owner = ?",
+            (time.time(), int(job.id), owner),
+        )
+
+    def fail(self, job: Job, owner: str, error: str) -> None:
+        state = FAILED if job.attempts >= self.max_attempts else PENDING
+        self._conn().execute(
+            "UPDATE jobs SET state = ?, owner = NULL, error = ?, updated = ? WHERE id = ? AND owner = ?",
+            (state, error, time.time(), int(job.id), owner),
+        )
+
+    def group_status(self, group: str) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT state, COUNT(*) AS n FROM jobs WHERE grp = ? GROUP BY state", (group,))
+        return {row["state"]: row["n"] for row in rows}
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT kind, state, COUNT(*) AS n FROM jobs GROUP BY kind, state")
+        return {f"{row['kind']}.{row['state']}": row["n"] for row in rows}
+
+
+_REDIS_LEASE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], id)
+    local kind = redis.call('HGET', ARGV[4] .. id, 'kind')
+    redis.call('HSET', ARGV[4] .. id, 'state', 'pending', 'owner', '')
+    redis.call('RPUSH', ARGV[5] .. kind, id)
+end
+local id = redis.call('LPOP', KEYS[2])
+if not id then
+    return false
+end
+redis.call('ZADD', KEYS[1], ARGV[2], id)
+redis.call('HSET', ARGV[4] .. id, 'state', 'leased', 'owner', ARGV[3])
+redis.call('HINCRBY', ARGV[4] .. id, 'attempts', 1)
+return id
+"""
+
+
+class RedisJobQueue(JobQueue):
+    def __init__(
+        self,
+        url: str,
+        *,
+        prefix: str = "ltfc",
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        try:
+            import redis
+        except ImportError as exc:  # pragma: no cover - 运行前检查依赖
+            raise SystemExit("使用 Redis 任务队列需要安装 redis 库 (pip install redis)") from exc
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lease_script = self.client.register_script(_REDIS_LEASE_SCRIPT)
+
+    def _k(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def enqueue(self, kind: str, key: str, payload: Dict, *, group: Optional[str] = None) -> bool:
+        if not self.client.sadd(self._k("keys"), key):
+            return False
+        job_id = str(self.client.incr(self._k("seq")))
+        pipe = self.client.pipeline()
+        pipe.hset(
+            self._k("job", job_id),
+            mapping={
+                "kind": kind,
+                "key": key,
+                "payload": json.dumps(payload, ensure_ascii=False),
+                "group": group or "",
+                "state": PENDING,
+                "owner": "",
+                "attempts": 0,
+            },
+        )
+        if group:
+            pipe.hincrby(self._k("group", group), PENDING, 1)
+        pipe.rpush(self._k("pending", kind), job_id)
+        pipe.execute()
+        return True
+
+    def lease(self, owner: str, kinds: Sequence[str] = KIND_PRIORITY) -> Optional[Job]:
+        now = time.time()
+        for kind in kinds:
+            job_id = self._lease_script(
+                keys=[self._k("leases"), self._k("pending", kind)],
+                args=[now, now + self.lease_seconds, owner, self._k("job", ""), self._k("pending", "")],
+            )
+            if job_id:
+                data = self.client.hgetall(self._k("job", job_id))
+                return Job(
+                    id=job_id,
+                    kind=data["kind"],
+                    key=data["key"],
+                    payload=json.loads(data["payload"]),
+                    group=data.get("group") or None,
+                    attempts=int(data.get("attempts", 1)),
+                )
+        return None
+
+    def heartbeat(self, job: Job, owner: str) -> bool:
+        if self.client.hget(self._k("job", job.id), "owner") != owner:
+            return False
+        return bool(self.client.zadd(self._k("leases"), {job.id: time.time() + self.lease_seconds}, xx=True, ch=True))
+
+    def _finish(self, job: Job, owner: str, state: str, error: str = "") -> bool:
+        if self.client.hget(self._k("job", job.id), "owner") != owner:
+            return False
+        if not self.client.zrem(self._k("leases"), job.id):
+            return False
+        pipe = self.client.pipeline()
+        pipe.hset(self._k("job", job.id), mapping={"state": state, "owner": "", "error": error})
+        if state == PENDING:
+            pipe.rpush(self._k("pending", job.kind), job.id)
+        elif job.group:
+            pipe.hincrby(self._k("group", job.group), PENDING, -1)
+            pipe.hincrby(self._k("group", job.group), state, 1)
+        pipe.execute()
+        return True
+
+    def complete(self, job: Job, owner: str) -> None:
+        self._finish(job, owner, DONE)
+
+    def fail(self, job: Job, owner: str, error: str) -> None:
+        self._finish(job, owner, FAILED if job.attempts >= self.max_attempts else PENDING, error)
+
+    def group_status(self, group: str) -> Dict[str, int]:
+        # pending 计数包含已租出但未结束的任务
+        return {k: int(v) for k, v in self.client.hgetall(self._k("group", group)).items() if int(v)}
+
+    def stats(self) -> Dict[str, int]:
+        result: Dict[str, int] = {"leased": int(self.client.zcard(self._k("leases")))}
+        for kind in KIND_PRIORITY:
+            result[f"{kind}.pending"] = int(self.client.llen(self._k("pending", kind)))
+        return result
+
+
+def open_job_queue(url: str) -> JobQueue:
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative.db 或 sqlite:////abs/path.db
+        return SQLiteJobQueue(Path(url[len("sqlite:///"):]))
+    if parsed.scheme in ("redis", "rediss"):
+        return RedisJobQueue(url)
+    raise ValueError(f"不支持的任务队列地址: {url}")
+
+
+def _group_finished(status: Dict[str, int]) -> bool:
+    return not status.get(PENDING) and not status.get(LEASED)
+
+
+class QueueWorker:
+    """在本节点上并发领取并处理任务，负责心跳续约、失败重排与 group 收尾。"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[[Job], None]],
+        *,
+        threads: int,
+        on_group_done: Optional[Callable[[str, Dict[str, int]], None]] = None,
+        heartbeat_interval: float = DEFAULT_LEASE_SECONDS / 3,
+        exit_when_idle: bool = True,
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.threads = max(1, threads)
+        self.on_group_done = on_group_done
+        self.heartbeat_interval = heartbeat_interval
+        self.exit_when_idle = exit_when_idle
+        self.owner = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self._active: Dict[str, Job] = {}
+        self._active_lock = threading.Lock()
+        # 处理函数抛出 RetryLater 的任务保持租约(心跳继续)，到期后由本节点再次执行
+        self._deferred: DeferredQueue[Job] = DeferredQueue()
+        self._stop = threading.Event()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._active_lock:
+                jobs = list(self._active.values())
+            for job in jobs:
+                try:
+                    if not self.queue.heartbeat(job, self.owner):
+                        logger.warning("任务 %s 的租约已丢失，可能被其他节点接管", job.key)
+                except Exception as exc:
+                    logger.warning("任务 %s 心跳失败: %s", job.key, exc)
+
+    def _run_job(self, job: Job) -> None:
+        handler = self.handlers.get(job.kind)
+        with self._active_lock:
+            self._active[job.id] = job
+        deferred = False
+        try:
+            if handler is None:
+                raise RuntimeError(f"未知任务类型: {job.kind}")
+            handler(job)
+        except RetryLater as retry:
+            # 延后的任务留在 _active 中，心跳线程继续为它续约，避免被其他节点接管
+            deferred = True
+            with self._active_lock:
+                self._deferred.push(job, retry.delay)
+            logger.debug("任务 %s 延后 %.1fs 重试", job.key, retry.delay)
+            return
+        except Exception as exc:
+            logger.exception("任务 %s 失败(第 %s 次): %s", job.key, job.attempts, exc)
+            self.queue.fail(job, self.owner, str(exc))
+        else:
+            self.queue.complete(job, self.owner)
+        finally:
+            if not deferred:
+                with self._active_lock:
+                    self._active.pop(job.id, None)
+        if job.group and self.on_group_done is not None:
+            status = self.queue.group_status(job.group)
+            if _group_finished(status):
+                self.on_group_done(job.group, status)
+
+    def _take_deferred(self) -> Optional[Job]:
+        with self._active_lock:
+            due = self._deferred.pop_due()
+            for extra in due[1:]:
+                self._deferred.push(extra, 0.0)
+        return due[0] if due else None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            job = self._take_deferred() or self.queue.lease(self.owner)
+            if job is None:
+                if self.exit_when_idle and not self._active and self._queue_idle():
+                    return
+                with self._active_lock:
+                    wait = min(IDLE_POLL_SECONDS, self._deferred.next_due_in()) if self._deferred else IDLE_POLL_SECONDS
+                self._stop.wait(wait)
+                continue
+            self._run_job(job)
+
+    def _queue_idle(self) -> bool:
+        stats = self.queue.stats()
+        return not any(count for name, count in stats.items() if name.endswith((PENDING, LEASED)))
+
+    def run(self) -> None:
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        workers: List[threading.Thread] = [
+            threading.Thread(target=self._loop, name=f"queue-worker-{i}", daemon=True) for i in range(self.threads)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        finally:
+            self._stop.set()
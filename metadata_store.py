@@ -0,0 +1,167 @@
+"""元数据(接口响应 JSON)的读写层。
+
+- 编解码优先使用 orjson，未安装时退回标准库 json；写入一律紧凑编码，不再缩进。
+- 可选 gzip / zstd 压缩(`LTFC_METADATA_COMPRESSION`)，压缩文件在原文件名后追加 `.gz` / `.zst`。
+- 读取时按 原文件 -> .zst -> .gz 依次查找，对调用方透明；`MetadataReader` 缓存解析结果，
+  同一文件在一次处理中只读取、解析一次。
+- `read_from` / `write_to` 面向 `storage` 中的存储后端，本地目录与对象存储用法一致。
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Tuple
+
+from storage import LocalStorage, StorageBackend
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = os.getenv("LTFC_METADATA_COMPRESSION", "none").lower()  # none | gzip | zstd
+SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _effective_compression(compression: Optional[str]) -> str:
+    mode = (compression or COMPRESSION).lower()
+    if mode not in SUFFIXES:
+        raise ValueError(f"未知的元数据压缩方式: {mode}")
+    if mode == "zstd" and zstandard is None:
+        logger.warning("未安装 zstandard，元数据改用 gzip 压缩")
+        return "gzip"
+    return mode
+
+
+def resolve(path: Path) -> Optional[Path]:
+    """返回 path 实际落盘的文件(可能带压缩后缀)，不存在时返回 None。"""
+    for suffix in ("", ".zst", ".gz"):
+        candidate = path.with_name(path.name + suffix) if suffix else path
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def exists(path: Path) -> bool:
+    return resolve(path) is not None
+
+
+def encode(payload: Any, *, compression: Optional[str] = None) -> Tuple[str, bytes]:
+    """编码(并按需压缩)元数据，返回 (文件名后缀, 数据)。"""
+    mode = _effective_compression(compression)
+    data = dumps(payload)
+    if mode == "gzip":
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    elif mode == "zstd":
+        data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return SUFFIXES[mode], data
+
+
+def decode(name: str, data: bytes) -> Any:
+    if name.endswith(".gz"):
+        data = gzip.decompress(data)
+    elif name.endswith(".zst"):
+        if zstandard is None:
+            raise ValueError(f"读取 {name} 需要安装 zstandard")
+        data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return loads(data)
+
+
+def write(path: Path, payload: Any, *, compression: Optional[str] = None) -> Path:
+    """写入元数据并返回实际文件路径；同名的其他压缩格式旧文件会被清理。"""
+    suffix, data = encode(payload, compression=compression)
+    target = path.with_name(path.name + suffix)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, target)
+    for suffix in SUFFIXES.values():
+        stale = path.with_name(path.name + suffix)
+        if stale != target and stale.exists():
+            stale.unlink()
+    return target
+
+
+def read(path: Path) -> Any:
+    """读取并解析元数据，文件不存在时抛出 FileNotFoundError，内容损坏时抛出 ValueError。"""
+    actual = resolve(path)
+    if actual is None:
+        raise FileNotFoundError(path)
+    return decode(actual.name, actual.read_bytes())
+
+
+def find(storage: StorageBackend, key: str) -> Optional[str]:
+    """在存储后端中查找 key 实际对应的键(可能带压缩后缀)。"""
+    for suffix in ("", ".zst", ".gz"):
+        if storage.exists(key + suffix):
+            return key + suffix
+    return None
+
+
+def read_from(storage: StorageBackend, key: str) -> Any:
+    actual = find(storage, key)
+    if actual is None:
+        raise FileNotFoundError(key)
+    return decode(actual, storage.read_bytes(actual))
+
+
+def write_to(storage: StorageBackend, key: str, payload: Any, *, compression: Optional[str] = None) -> str:
+    if isinstance(storage, LocalStorage):
+        # 本地沿用原子写入与旧格式清理
+        return write(storage.local_path(key), payload, compression=compression).relative_to(storage.root).as_posix()
+    suffix, data = encode(payload, compression=compression)
+    storage.write_bytes(key + suffix, data)
+    return key + suffix
+
+
+class MetadataReader:
+    """带 LRU 缓存的元数据读取器；解析失败的文件缓存为 None，不会反复重试。"""
+
+    def __init__(self, maxsize: int = 256, loader: Callable[[Any], Any] = read):
+        self.maxsize = maxsize
+        self.loader = loader
+        self._cache: "OrderedDict[Any, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: Any) -> Any:
+        with self._lock:
+            if path in self._cache:
+                self._cache.move_to_end(path)
+                return self._cache[path]
+        try:
+            payload = self.loader(path)
+        except FileNotFoundError:
+            payload = None
+        except (OSError, ValueError) as exc:
+            logger.warning("解析 %s 失败: %s", path, exc)
+            payload = None
+        with self._lock:
+            self._cache[path] = payload
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+        return payload
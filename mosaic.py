@@ -0,0 +1,217 @@
+"""把 tile 目录当作一张虚拟大图按需读取，不必先 merge_tiles 也不必把整幅画布放进内存。
+
+    with VirtualMosaic.open("rawdata/<artist>/<work>/<resource>/<variant>/tile") as mosaic:
+        height, width, _ = mosaic.shape
+        thumb = mosaic.read_region(0, 0, width, height, scale=1 / 16)
+        patch = mosaic.read_region(4096, 2048, 4608, 2560)
+
+`read_region` 只解码区域覆盖到的瓦片；解码结果放在 LRU 缓存中，相邻区域反复读取时不再重复解码。
+缩小读取(scale <= 1/2)时利用 JPEG 的 DCT 降采样直接以 1/2、1/4、1/8 分辨率解码，省去大半解码开销。
+开启 `prefetch_workers` 后，区域中缺失的瓦片由线程池并行解码，也可以用 `prefetch` 提前加载下一块区域。
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+import data_rename
+from data_rename import TileGrid
+from storage import LocalStorage, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TILES = 256
+FILL_COLOR = (255, 255, 255)  # 缺失瓦片按白色填充，与 merge_tiles 一致
+DRAFT_FACTORS = (8, 4, 2)
+
+TileKey = Tuple[int, int, int]  # (x, y, 降采样倍数)
+
+
+class VirtualMosaic:
+    def __init__(
+        self,
+        grid: TileGrid,
+        storage: Optional[StorageBackend] = None,
+        *,
+        cache_tiles: int = DEFAULT_CACHE_TILES,
+        prefetch_workers: int = 0,
+    ):
+        self.grid = grid
+        self.storage = storage
+        self.cache_tiles = cache_tiles
+        self._cache: "OrderedDict[TileKey, Image.Image]" = OrderedDict()
+        self._inflight: Dict[TileKey, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="mosaic") if prefetch_workers > 0 else None
+        )
+
+    @classmethod
+    def open(
+        cls,
+        tile_dir: Union[str, Path],
+        storage: Optional[StorageBackend] = None,
+        **kwargs,
+    ) -> "VirtualMosaic":
+        """打开 tile 目录。字符串按存储后端中的键解析(默认 data_rename.STORAGE)，Path 按本地目录解析。"""
+        if isinstance(tile_dir, Path):
+            storage = LocalStorage(tile_dir)
+            tile_dir = ""
+        grid = data_rename.scan_tiles(tile_dir, storage)
+        if grid is None:
+            raise FileNotFoundError(f"目录 {tile_dir} 中没有有效瓦片")
+        return cls(grid, storage, **kwargs)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.grid.height, self.grid.width, 3
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """PIL 习惯的 (宽, 高)。"""
+        return self.grid.width, self.grid.height
+
+    def read_region(self, x0: int, y0: int, x1: int, y1: int, scale: float = 1.0) -> Image.Image:
+        """读取原图坐标 [x0, x1) x [y0, y1) 的区域，按 scale 缩放后返回 RGB 图像；超出图像范围的部分填白。"""
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"区域为空: ({x0}, {y0}, {x1}, {y1})")
+        if scale <= 0:
+            raise ValueError(f"scale 必须为正数: {scale}")
+        out_size = (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale)))
+        factor = _draft_factor(scale)
+        coords = self._tiles_in(x0, y0, x1, y1)
+        tiles = self._load(coords, factor)
+
+        # 在降采样后的分辨率上拼出区域，再缩放到目标尺寸
+        canvas = Image.new("RGB", (-(-(x1 - x0) // factor), -(-(y1 - y0) // factor)), FILL_COLOR)
+        for (tx, ty), tile in zip(coords, tiles):
+            if tile is not None:
+                left = (tx * self.grid.tile_width - x0) // factor
+                top = (ty * self.grid.tile_height - y0) // factor
+                canvas.paste(tile, (left, top))
+        if canvas.size != out_size:
+            canvas = canvas.resize(out_size, Image.BILINEAR if scale >= 1 else Image.LANCZOS)
+        return canvas
+
+    def thumbnail(self, scale: float) -> Image.Image:
+        """整幅图按 scale 缩小的预览。
+
+        与 read_region(0, 0, 宽, 高, scale) 不同，不会先在 1/8 分辨率上拼出整幅画布：
+        每个瓦片解码后立即缩到目标尺寸贴入小画布，内存只与输出尺寸相关；解码结果不进缓存。
+        """
+        if scale <= 0:
+            raise ValueError(f"scale 必须为正数: {scale}")
+        grid = self.grid
+        factor = _draft_factor(scale)
+        canvas = Image.new("RGB", (max(1, round(grid.width * scale)), max(1, round(grid.height * scale))), FILL_COLOR)
+        for (tx, ty), tile_key in grid.tiles.items():
+            left = round(tx * grid.tile_width * scale)
+            top = round(ty * grid.tile_height * scale)
+            right = max(left + 1, round(min(grid.width, (tx + 1) * grid.tile_width) * scale))
+            bottom = max(top + 1, round(min(grid.height, (ty + 1) * grid.tile_height) * scale))
+            tile = self._decode(tile_key, factor)
+            if tile is not None:
+                canvas.paste(tile.resize((right - left, bottom - top), Image.BOX), (left, top))
+        return canvas
+
+    def prefetch(self, x0: int, y0: int, x1: int, y1: int, scale: float = 1.0) -> None:
+        """在后台解码区域所需的瓦片；未开启 prefetch_workers 时不做任何事。"""
+        if self._executor is None:
+            return
+        factor = _draft_factor(scale)
+        for tx, ty in self._tiles_in(x0, y0, x1, y1):
+            self._submit((tx, ty, factor))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            self._cache.clear()
+
+    def __enter__(self) -> "VirtualMosaic":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _tiles_in(self, x0: int, y0: int, x1: int, y1: int) -> List[Tuple[int, int]]:
+        grid = self.grid
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(grid.width, x1), min(grid.height, y1)
+        if x1 <= x0 or y1 <= y0:
+            return []
+        return [
+            (tx, ty)
+            for ty in range(y0 // grid.tile_height, -(-y1 // grid.tile_height))
+            for tx in range(x0 // grid.tile_width, -(-x1 // grid.tile_width))
+            if (tx, ty) in grid.tiles
+        ]
+
+    def _load(self, coords: List[Tuple[int, int]], factor: int) -> List[Optional[Image.Image]]:
+        if self._executor is None:
+            return [self._get((tx, ty, factor)) for tx, ty in coords]
+        futures = [self._submit((tx, ty, factor)) for tx, ty in coords]
+        return [future.result() for future in futures]
+
+    def _get(self, key: TileKey) -> Optional[Image.Image]:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return self._decode_and_cache(key)
+
+    def _submit(self, key: TileKey) -> "Future[Optional[Image.Image]]":
+        # 同一瓦片同时只解码一次，并发的读取与预取共用同一个 Future
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                future: "Future[Optional[Image.Image]]" = Future()
+                future.set_result(self._cache[key])
+                return future
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._decode_and_cache, key)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _, key=key: self._forget(key))
+            return future
+
+    def _forget(self, key: TileKey) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _decode(self, tile_key: str, factor: int) -> Optional[Image.Image]:
+        try:
+            with data_rename.open_tile(tile_key, self.storage) as img:
+                target = (-(-img.width // factor), -(-img.height // factor))
+                if factor > 1:
+                    img.draft("RGB", target)
+                tile = img.convert("RGB")
+            if tile.size != target:
+                # 非 JPEG 瓦片 draft 不生效，手动缩小，保证缓存中的瓦片分辨率一致
+                tile = tile.resize(target, Image.LANCZOS)
+        except OSError as exc:
+            logger.warning("读取瓦片 %s 失败: %s", tile_key, exc)
+            return None
+        return tile
+
+    def _decode_and_cache(self, key: TileKey) -> Optional[Image.Image]:
+        tx, ty, factor = key
+        tile = self._decode(self.grid.tiles[(tx, ty)], factor)
+        with self._lock:
+            self._cache[key] = tile
+            while len(self._cache) > self.cache_tiles:
+                self._cache.popitem(last=False)
+        return tile
+
+
+def _draft_factor(scale: float) -> int:
+    """scale 不大于 1/f 时可直接以 1/f 分辨率解码 JPEG。"""
+    for factor in DRAFT_FACTORS:
+        if scale * factor <= 1:
+            return factor
+    return 1
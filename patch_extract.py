@@ -0,0 +1,260 @@
+"""直接从瓦片网格流式切取训练用图块(patch)，写成 tar 分片。
+
+不再解码整幅 merged.jpg：每个子资源用 `mosaic.VirtualMosaic` 打开，按滑窗或随机采样逐块读取，
+只解码覆盖到的瓦片。空白判断在一张 1/32 缩略图上做(瓦片以 1/8 分辨率解码后逐个缩小贴入，
+不会拼出整幅 1/8 画布)，判为空白的窗口不会触发全分辨率解码。每个子资源是进程池中的一个任务，各自写出分片::
+
+    <output>/<artist_id>_<work_id>_<resource_id>_<variant_id>-00000.tar
+    <output>/<artist_id>_<work_id>_<resource_id>_<variant_id>.json     分片清单，同时作为完成标记
+
+分片内同名的 `<key>.jpg` 与 `<key>.json` 构成一个样本(WebDataset 约定)，json 中记录来源与坐标。
+已有清单的子资源会被跳过，中断后重跑只补做未完成的部分。
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import tarfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageStat
+
+import data_rename
+from data_rename import RAW_PREFIX, STORAGE
+from mosaic import VirtualMosaic
+
+logger = logging.getLogger("patch_extract")
+
+PATCH_DIR = Path(os.getenv("LTFC_PATCH_DIR", "data/patches"))
+PATCH_SIZE = 512
+PATCH_QUALITY = 95
+SHARD_MAX_SAMPLES = 5000
+SHARD_MAX_BYTES = 1 << 30
+THUMBNAIL_SCALE = 1 / 32
+BLANK_STD = 6.0  # 缩略图区域各通道标准差都低于该值视为空白
+BLANK_MEAN = 235.0  # 且亮度均值高于该值(绢本、纸本的留白)
+
+
+class PatchOptions:
+    """传给工作进程的切块参数，需可 pickle。"""
+
+    def __init__(
+        self,
+        output: Path,
+        size: int = PATCH_SIZE,
+        stride: Optional[int] = None,
+        scale: float = 1.0,
+        mode: str = "sliding",
+        samples: int = 100,
+        seed: int = 0,
+        skip_blank: bool = True,
+        quality: int = PATCH_QUALITY,
+    ):
+        self.output = output
+        self.size = size
+        self.stride = stride or size
+        self.scale = scale
+        self.mode = mode
+        self.samples = samples
+        self.seed = seed
+        self.skip_blank = skip_blank
+        self.quality = quality
+
+
+class ShardWriter:
+    """按样本数与字节数滚动的 tar 分片写入器；分片先写 .tmp，写满后改名。"""
+
+    def __init__(self, output: Path, prefix: str, max_samples: int = SHARD_MAX_SAMPLES, max_bytes: int = SHARD_MAX_BYTES):
+        self.output = output
+        self.prefix = prefix
+        self.max_samples = max_samples
+        self.max_bytes = max_bytes
+        self.shards: List[str] = []
+        self.samples = 0
+        self._tar: Optional[tarfile.TarFile] = None
+        self._tmp_path: Optional[Path] = None
+        self._shard_samples = 0
+        self._shard_bytes = 0
+
+    def write(self, key: str, files: Dict[str, bytes]) -> None:
+        if self._tar is None or self._shard_samples >= self.max_samples or self._shard_bytes >= self.max_bytes:
+            self._roll()
+        for ext, data in files.items():
+            info = tarfile.TarInfo(f"{key}.{ext}")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self._tar.addfile(info, io.BytesIO(data))
+            self._shard_bytes += len(data)
+        self._shard_samples += 1
+        self.samples += 1
+
+    def _roll(self) -> None:
+        self._finish()
+        name = f"{self.prefix}-{len(self.shards):05d}.tar"
+        self._tmp_path = self.output / (name + ".tmp")
+        self._tar = tarfile.open(self._tmp_path, "w")
+        self.shards.append(name)
+        self._shard_samples = 0
+        self._shard_bytes = 0
+
+    def _finish(self) -> None:
+        if self._tar is None:
+            return
+        self._tar.close()
+        os.replace(self._tmp_path, self._tmp_path.with_suffix(""))
+        self._tar = None
+
+    def close(self) -> None:
+        self._finish()
+
+
+def _is_blank(thumbnail: Image.Image, box: Tuple[int, int, int, int]) -> bool:
+    region = thumbnail.crop(box)
+    if region.width == 0 or region.height == 0:
+        return True
+    stat = ImageStat.Stat(region)
+    return max(stat.stddev) < BLANK_STD and min(stat.mean) > BLANK_MEAN
+
+
+def _windows(width: int, height: int, window: int, stride: int, options: PatchOptions, seed_key: str) -> Iterator[Tuple[int, int]]:
+    """返回窗口左上角的原图坐标。滑窗按行优先，便于复用瓦片缓存。"""
+    if width < window or height < window:
+        return
+    if options.mode == "random":
+        # 以子资源为种子，同样的参数重跑得到同样的样本
+        digest = hashlib.sha1(f"{options.seed}:{seed_key}".encode("utf-8")).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+        for _ in range(options.samples):
+            yield rng.randint(0, width - window), rng.randint(0, height - window)
+        return
+    for y in range(0, height - window + 1, stride):
+        for x in range(0, width - window + 1, stride):
+            yield x, y
+
+
+def _variant_prefix(attrs: Dict[str, str]) -> str:
+    return "_".join(attrs[key] for key in ("artist_id", "work_id", "resource_id", "variant_id"))
+
+
+def extract_variant(tile_dir: str, attrs: Dict[str, str], options: PatchOptions) -> Tuple[int, int]:
+    """切取一个子资源的全部图块，返回 (写出数, 空白跳过数)。在工作进程中执行。"""
+    prefix = _variant_prefix(attrs)
+    manifest_path = options.output / f"{prefix}.json"
+    window = max(1, round(options.size / options.scale))
+    stride = max(1, round(options.stride / options.scale))
+    written = skipped = 0
+
+    with VirtualMosaic.open(tile_dir) as mosaic:
+        height, width, _ = mosaic.shape
+        if options.mode == "sliding":
+            # 缓存能容纳一整条窗口高度的瓦片带，换行前每个瓦片只解码一次
+            grid = mosaic.grid
+            mosaic.cache_tiles = max(mosaic.cache_tiles, (window // grid.tile_height + 2) * grid.columns)
+        thumbnail = mosaic.thumbnail(THUMBNAIL_SCALE) if options.skip_blank else None
+        writer = ShardWriter(options.output, prefix)
+        try:
+            for x, y in _windows(width, height, window, stride, options, prefix):
+                if thumbnail is not None:
+                    box = (
+                        int(x * THUMBNAIL_SCALE),
+                        int(y * THUMBNAIL_SCALE),
+                        max(int(x * THUMBNAIL_SCALE) + 1, int((x + window) * THUMBNAIL_SCALE)),
+                        max(int(y * THUMBNAIL_SCALE) + 1, int((y + window) * THUMBNAIL_SCALE)),
+                    )
+                    if _is_blank(thumbnail, box):
+                        skipped += 1
+                        continue
+                patch = mosaic.read_region(x, y, x + window, y + window, scale=options.scale)
+                buffer = io.BytesIO()
+                patch.save(buffer, format="JPEG", quality=options.quality)
+                sample = dict(attrs, x=x, y=y, window=window, scale=options.scale, size=options.size)
+                writer.write(
+                    f"{prefix}_{x}_{y}",
+                    {"jpg": buffer.getvalue(), "json": json.dumps(sample, ensure_ascii=False).encode("utf-8")},
+                )
+                written += 1
+        finally:
+            writer.close()
+
+    manifest = dict(attrs, width=width, height=height, shards=writer.shards, samples=written, blank_skipped=skipped)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+    return written, skipped
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="从瓦片网格切取训练图块并写成 tar 分片")
+    parser.add_argument("--output", type=Path, default=PATCH_DIR, help="输出目录")
+    parser.add_argument("--size", type=int, default=PATCH_SIZE, help="输出图块边长(像素)")
+    parser.add_argument("--stride", type=int, default=None, help="滑窗步长(输出像素)，默认等于 --size")
+    parser.add_argument("--scale", type=float, default=1.0, help="相对第 17 级瓦片的缩放比例，如 0.25")
+    parser.add_argument("--mode", choices=("sliding", "random"), default="sliding", help="滑窗或随机采样")
+    parser.add_argument("--samples", type=int, default=100, help="随机采样时每个子资源的图块数")
+    parser.add_argument("--seed", type=int, default=0, help="随机采样种子")
+    parser.add_argument("--keep-blank", action="store_true", help="不跳过空白图块")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--artist", action="append", default=None, metavar="ID", help="只处理指定艺术家，可重复")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if args.scale <= 0 or args.scale > 1:
+        raise SystemExit("--scale 需在 (0, 1] 之间")
+    artist_ids = args.artist or STORAGE.list_dir(RAW_PREFIX)[0]
+    if not artist_ids:
+        raise SystemExit(f"未找到原始数据目录: {RAW_PREFIX}")
+    artist_name_map = data_rename.load_artist_names(data_rename.ARTIST_CSV) if data_rename.ARTIST_CSV.exists() else {}
+    args.output.mkdir(parents=True, exist_ok=True)
+    options = PatchOptions(
+        args.output,
+        size=args.size,
+        stride=args.stride,
+        scale=args.scale,
+        mode=args.mode,
+        samples=args.samples,
+        seed=args.seed,
+        skip_blank=not args.keep_blank,
+    )
+
+    started = time.monotonic()
+    total_written = total_skipped = done = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures: Dict[Any, str] = {}
+        for tile_dir, attrs in data_rename.iter_variants(artist_ids, artist_name_map):
+            if (args.output / f"{_variant_prefix(attrs)}.json").exists():
+                continue
+            futures[executor.submit(extract_variant, tile_dir, attrs, options)] = tile_dir
+        for future in as_completed(futures):
+            tile_dir = futures[future]
+            try:
+                written, skipped = future.result()
+            except Exception as exc:  # pragma: no cover - 单个子资源失败不影响其余任务
+                logger.warning("切取 %s 失败: %s", tile_dir, exc)
+                continue
+            done += 1
+            total_written += written
+            total_skipped += skipped
+            logger.info("%s: 写出 %s 个图块，跳过空白 %s 个 (%s/%s)", tile_dir, written, skipped, done, len(futures))
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    logger.info(
+        "切块完成：%s 个子资源，写出 %s 个图块(%.1f 个/秒)，跳过空白 %s 个，输出位置: %s",
+        done,
+        total_written,
+        total_written / elapsed,
+        total_skipped,
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""按流水线阶段的性能剖析。
+
+`PROFILER.stage("name")` 记录每个阶段的墙钟时间与 CPU 时间(线程 CPU，嵌套阶段会重复计入)，
+未启用时为几乎零开销的空上下文。可选地启动基于 `sys._current_frames` 的采样剖析器，
+输出 flamegraph.pl / speedscope 可直接读取的 folded 栈文件，并可附加 tracemalloc 快照。
+
+通过环境变量开启::
+
+    LTFC_PROFILE=1              阶段耗时表
+    LTFC_PROFILE_SAMPLING=1     额外启用采样剖析，写出 <prefix>.folded
+    LTFC_PROFILE_TRACEMALLOC=1  额外记录内存分配，写出 <prefix>.tracemalloc
+"""
+
+import atexit
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 10
+TRACEMALLOC_TOP = 15
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _StageStats:
+    __slots__ = ("count", "wall", "cpu")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+
+
+class StageProfiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self._stats: Dict[str, _StageStats] = {}
+        self._lock = threading.Lock()
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    def stage(self, name: str) -> ContextManager[None]:
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._measure(name)
+
+    @contextlib.contextmanager
+    def _measure(self, name: str) -> Iterator[None]:
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            with self._lock:
+                stats = self._stats.get(name)
+                if stats is None:
+                    stats = self._stats[name] = _StageStats()
+                stats.count += 1
+                stats.wall += wall
+                stats.cpu += cpu
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = [(name, stats.count, stats.wall, stats.cpu) for name, stats in self._stats.items()]
+        return {
+            name: {"count": count, "wall_seconds": wall, "cpu_seconds": cpu}
+            for name, count, wall, cpu in sorted(items, key=lambda item: item[2], reverse=True)
+        }
+
+    def format_table(self) -> str:
+        summary = self.summary()
+        total_wall = time.perf_counter() - self._started_wall
+        total_cpu = time.process_time() - self._started_cpu
+        lines = [
+            f"{'stage':<20}{'count':>10}{'wall(s)':>12}{'cpu(s)':>12}{'avg(ms)':>12}",
+            "-" * 66,
+        ]
+        for name, row in summary.items():
+            avg_ms = row["wall_seconds"] / row["count"] * 1000 if row["count"] else 0.0
+            lines.append(f"{name:<20}{row['count']:>10}{row['wall_seconds']:>12.3f}{row['cpu_seconds']:>12.3f}{avg_ms:>12.2f}")
+        lines.append("-" * 66)
+        lines.append(f"进程墙钟 {total_wall:.3f}s，进程 CPU {total_cpu:.3f}s (各阶段为所有线程累计值)")
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """定时采样所有线程的调用栈，聚合为 folded 格式。"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(";", "_"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_folded(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as fp:
+            for stack, count in self.samples.most_common():
+                fp.write(f"{stack} {count}\n")
+
+
+PROFILER = StageProfiler()
+
+
+class ProfileSession:
+    def __init__(self, output_prefix: Path, *, sampling: bool, trace_memory: bool):
+        self.output_prefix = output_prefix
+        self.sampler = SamplingProfiler() if sampling else None
+        self.trace_memory = trace_memory
+        self._finished = False
+
+    def start(self) -> "ProfileSession":
+        PROFILER.reset()
+        PROFILER.enabled = True
+        if self.trace_memory:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        if self.sampler is not None:
+            self.sampler.start()
+        atexit.register(self.finish)
+        return self
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        PROFILER.enabled = False
+        self.output_prefix.parent.mkdir(parents=True, exist_ok=True)
+
+        print(PROFILER.format_table(), file=sys.stderr)
+        stage_path = self.output_prefix.with_suffix(".stages.json")
+        stage_path.write_text(json.dumps(PROFILER.summary(), ensure_ascii=False, indent=2), encoding="utf-8")
+
+        if self.sampler is not None:
+            self.sampler.stop()
+            folded_path = self.output_prefix.with_suffix(".folded")
+            self.sampler.write_folded(folded_path)
+            logger.info("采样栈已写入 %s (可用 flamegraph.pl 或 speedscope 打开)", folded_path)
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot_path = self.output_prefix.with_suffix(".tracemalloc")
+            snapshot.dump(str(snapshot_path))
+            lines = [f"内存: 当前 {current / 1_048_576:.1f} MB，峰值 {peak / 1_048_576:.1f} MB"]
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]:
+                lines.append(str(stat))
+            print("\n".join(lines), file=sys.stderr)
+
+
+def start_from_env(output_prefix: Path) -> Optional[ProfileSession]:
+    if os.getenv("LTFC_PROFILE") != "1":
+        return None
+    session = ProfileSession(
+        output_prefix,
+        sampling=os.getenv("LTFC_PROFILE_SAMPLING") == "1",
+        trace_memory=os.getenv("LTFC_PROFILE_TRACEMALLOC") == "1",
+    )
+    return session.start()
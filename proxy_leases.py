@@ -0,0 +1,155 @@
+"""代理租约管理：尽量复用已付费的 IP，减少分配次数。
+
+代理按分配次数计费，而不是按有效流量。`ProxyLeaseManager` 记录每个租约的到期时间与健康
+状况：会话池重建时旧会话的代理归还到空闲池，主/备两个会话池都先从空闲池取，只有不够时
+才向分配接口批量申请；同一时刻多个线程的申请会合并成一次调用，多出来的 IP 留给下一个
+调用方。认证失败或连续出错的代理直接丢弃。
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Proxy = Dict[str, str]
+Allocator = Callable[[int], List[Tuple[Proxy, Optional[float]]]]
+
+
+def lease_key(proxy: Proxy) -> str:
+    return proxy.get("https") or proxy.get("http") or ""
+
+
+@dataclass
+class Lease:
+    proxy: Proxy
+    deadline: float
+    failures: int = 0
+    in_use: int = 0
+    # 曾被会话用过后归还，或从上次运行接管；批量分配时多出来、还没人用过的 IP 不算复用
+    returned: bool = False
+
+
+class ProxyLeaseManager:
+    def __init__(
+        self,
+        allocator: Allocator,
+        *,
+        min_batch: int = 1,
+        default_lease: float = 60.0,
+        margin: float = 10.0,
+        max_failures: int = 3,
+        on_allocate: Optional[Callable[[Proxy, float], None]] = None,
+        on_discard: Optional[Callable[[Proxy], None]] = None,
+    ):
+        self.allocator = allocator
+        self.min_batch = max(1, min_batch)
+        self.default_lease = default_lease
+        self.margin = margin
+        self.max_failures = max_failures
+        self.on_allocate = on_allocate
+        self.on_discard = on_discard
+
+        self.leases: Dict[str, Lease] = {}
+        self.allocations = 0
+        self.allocated_ips = 0
+        self.reused_ips = 0
+        self.bytes_downloaded = 0
+        self._lock = threading.Lock()
+        # 单飞锁：同一时刻只有一个线程调用分配接口，其余线程等它回来后先看空闲池
+        self._allocate_lock = threading.Lock()
+
+    def _usable(self, lease: Lease, now: float) -> bool:
+        return lease.failures < self.max_failures and lease.deadline - now > self.margin
+
+    def _take_idle(self, count: int) -> List[Proxy]:
+        now = time.time()
+        taken: List[Proxy] = []
+        with self._lock:
+            for key, lease in list(self.leases.items()):
+                if not self._usable(lease, now):
+                    if not lease.in_use:
+                        del self.leases[key]
+                    continue
+                if len(taken) < count and not lease.in_use:
+                    lease.in_use += 1
+                    taken.append(lease.proxy)
+                    if lease.returned:
+                        self.reused_ips += 1
+        return taken
+
+    def adopt(self, proxy: Proxy, deadline: Optional[float]) -> None:
+        """登记一个已有的租约(例如上次运行缓存下来的)，放入空闲池。"""
+        with self._lock:
+            self.leases[lease_key(proxy)] = Lease(proxy, deadline or time.time() + self.default_lease, returned=True)
+
+    def acquire(self, count: int) -> List[Proxy]:
+        """取 count 个代理：先复用空闲租约，不足部分批量分配。"""
+        proxies = self._take_idle(count)
+        if len(proxies) >= count:
+            return proxies
+        with self._allocate_lock:
+            # 等锁期间其他线程可能已经分配了富余的 IP
+            proxies.extend(self._take_idle(count - len(proxies)))
+            shortfall = count - len(proxies)
+            if shortfall <= 0:
+                return proxies
+            allocated = self.allocator(max(shortfall, self.min_batch))
+            now = time.time()
+            with self._lock:
+                self.allocations += 1
+                self.allocated_ips += len(allocated)
+                for proxy, deadline in allocated:
+                    lease = Lease(proxy, deadline or now + self.default_lease)
+                    if len(proxies) < count:
+                        lease.in_use = 1
+                        proxies.append(proxy)
+                    self.leases[lease_key(proxy)] = lease
+            if self.on_allocate is not None:
+                for proxy, deadline in allocated:
+                    self.on_allocate(proxy, deadline or now + self.default_lease)
+        return proxies
+
+    def release(self, proxy: Proxy) -> None:
+        """会话不再使用该代理时归还；健康且未到期的租约可被其他会话池复用。"""
+        with self._lock:
+            lease = self.leases.get(lease_key(proxy))
+            if lease is not None:
+                lease.in_use = max(0, lease.in_use - 1)
+                lease.returned = True
+
+    def discard(self, proxy: Proxy) -> None:
+        with self._lock:
+            removed = self.leases.pop(lease_key(proxy), None)
+        if removed is not None and self.on_discard is not None:
+            self.on_discard(proxy)
+
+    def record_result(self, proxy: Proxy, ok: bool) -> None:
+        with self._lock:
+            lease = self.leases.get(lease_key(proxy))
+            if lease is None:
+                return
+            lease.failures = 0 if ok else lease.failures + 1
+
+    def record_bytes(self, size: int) -> None:
+        with self._lock:
+            self.bytes_downloaded += size
+
+    def ips_per_gb(self) -> float:
+        with self._lock:
+            gigabytes = self.bytes_downloaded / 1e9
+            return self.allocated_ips / gigabytes if gigabytes else 0.0
+
+    def snapshot(self) -> Dict[str, float]:
+        now = time.time()
+        with self._lock:
+            return {
+                "leases": len(self.leases),
+                "idle": sum(1 for lease in self.leases.values() if not lease.in_use and self._usable(lease, now)),
+                "allocations": self.allocations,
+                "allocated_ips": self.allocated_ips,
+                "reused_ips": self.reused_ips,
+                "bytes_downloaded": self.bytes_downloaded,
+            }
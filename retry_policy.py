@@ -0,0 +1,142 @@
+"""共享的重试策略组件。
+
+- `RetryPolicy`: 指数退避 + 抖动，按错误类别配置。
+- `RetryBudget`: 全局重试预算，重试量不超过正常流量的固定比例(外加每秒少量保底)。
+- `RetryEngine`: 按异常类型(沿 MRO)选择策略，并统一扣减预算。
+- `DeferredQueue` / `RetryLater`: 让可延后的工作重新排期，而不是在工作线程里 sleep。
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Generic, List, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+    multiplier: float = 2.0
+    jitter: str = "full"  # full | equal | none
+
+    def delay(self, attempt: int, rng: Optional[random.Random] = None) -> float:
+        """第 attempt 次尝试失败后的等待时间(attempt 从 1 开始)。"""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** max(0, attempt - 1)))
+        if ceiling <= 0 or self.jitter == "none":
+            return max(0.0, ceiling)
+        uniform = (rng or random).uniform
+        if self.jitter == "equal":
+            return ceiling / 2 + uniform(0, ceiling / 2)
+        return uniform(0, ceiling)
+
+
+class RetryBudget:
+    """令牌桶式重试预算：每个首发请求存入 ratio 个令牌，每次重试消耗 1 个。"""
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 2.0, max_balance: float = 200.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = min(max_balance, min_per_second * 10)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.denied = 0
+
+    def _refill(self, now: float) -> None:
+        self._balance = min(self.max_balance, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._balance >= 1.0:
+                self._balance -= 1.0
+                return True
+            self.denied += 1
+            return False
+
+    @property
+    def balance(self) -> float:
+        with self._lock:
+            return self._balance
+
+
+class RetryEngine:
+    def __init__(
+        self,
+        policies: Dict[Type[BaseException], RetryPolicy],
+        default: RetryPolicy,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.policies = policies
+        self.default = default
+        self.budget = budget
+
+    def policy_for(self, exc: Optional[BaseException]) -> RetryPolicy:
+        if exc is None:
+            return self.default
+        for klass in type(exc).__mro__:
+            policy = self.policies.get(klass)
+            if policy is not None:
+                return policy
+        return self.default
+
+    def record_request(self) -> None:
+        if self.budget is not None:
+            self.budget.record_request()
+
+    def next_delay(self, exc: Optional[BaseException], attempt: int) -> Optional[float]:
+        """返回下一次重试前的等待秒数；次数用尽或预算不足时返回 None。"""
+        policy = self.policy_for(exc)
+        if attempt >= policy.max_attempts:
+            return None
+        if self.budget is not None and not self.budget.try_acquire():
+            return None
+        return policy.delay(attempt)
+
+
+class RetryLater(Exception):
+    """调用方允许延后重试时抛出，携带建议的等待时间与已尝试次数。"""
+
+    def __init__(self, delay: float, attempt: int, cause: Optional[BaseException] = None):
+        super().__init__(f"retry in {delay:.2f}s (attempt {attempt})")
+        self.delay = delay
+        self.attempt = attempt
+        self.cause = cause
+
+
+class DeferredQueue(Generic[T]):
+    """按到期时间排序的延后任务队列。"""
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, T]] = []
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, item: T, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), item))
+
+    def pop_due(self) -> List[T]:
+        now = time.monotonic()
+        due: List[T] = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def next_due_in(self) -> float:
+        if not self._heap:
+            return 0.0
+        return max(0.0, self._heap[0][0] - time.monotonic())
@@ -0,0 +1,170 @@
+"""跨进程重启复用 tourToken 与代理租约的本地缓存。
+
+- token 记录签发时间；被服务端拒绝(轮换)时记下实际存活时长，取中位数作为有效期估计，
+  重启后只复用仍在有效期内的 token。
+- 代理租约记录分配接口返回的到期时间，重启后在到期前(留出余量)可继续使用，
+  使用前由调用方做一次连通性校验，校验失败的条目直接丢弃。
+- 缓存只是加速手段：读到格式不对的条目直接跳过，写盘失败只记日志，不影响 token 获取。
+"""
+
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SAVE_INTERVAL = 10.0
+MAX_LIFETIME_SAMPLES = 50
+# 签发后很快就被拒绝的 token 多半是撞上了频率限制而不是过期，不计入寿命统计
+MIN_LIFETIME_SAMPLE = 60.0
+
+
+def proxy_key(proxy: Dict[str, str]) -> str:
+    return proxy.get("https") or proxy.get("http") or ""
+
+
+def parse_deadline(value: object) -> Optional[float]:
+    """解析代理分配接口返回的到期时间(本地时间 `YYYY-MM-DD HH:MM:SS` 或时间戳)。"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        return time.mktime(time.strptime(value, "%Y-%m-%d %H:%M:%S"))
+    except ValueError:
+        return None
+
+
+class SessionCache:
+    def __init__(self, path: Path, *, default_token_ttl: float = 1800.0, lease_margin: float = 30.0):
+        self.path = path
+        self.default_token_ttl = default_token_ttl
+        self.lease_margin = lease_margin
+        self.tokens: Dict[str, float] = {}
+        self.leases: Dict[str, Dict[str, object]] = {}
+        self.lifetimes: Deque[float] = deque(maxlen=MAX_LIFETIME_SAMPLES)
+        # 上次运行留下、本进程尚未取用的租约，启动时一次性交给租约管理器
+        self._carried_leases: List[str] = []
+        self._lock = threading.Lock()
+        # 串行化整个落盘过程，多个线程同时保存时不会争用同一个临时文件
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        if not isinstance(payload, dict):
+            return
+        lifetimes = payload.get("token_lifetimes")
+        if isinstance(lifetimes, list):
+            self.lifetimes.extend(float(value) for value in lifetimes if _is_number(value) and value >= MIN_LIFETIME_SAMPLE)
+        now = time.time()
+        ttl = self.token_ttl()
+        tokens = payload.get("tokens")
+        if isinstance(tokens, dict):
+            for token, issued in tokens.items():
+                # 过期或签发时间在未来(时钟回拨、文件损坏)的 token 都不再复用
+                if token and _is_number(issued) and 0 <= now - issued < ttl:
+                    self.tokens[token] = float(issued)
+        leases = payload.get("leases")
+        if isinstance(leases, dict):
+            for key, lease in leases.items():
+                if not isinstance(lease, dict) or not isinstance(lease.get("proxy"), dict):
+                    continue
+                deadline = lease.get("deadline")
+                if _is_number(deadline) and deadline - now > self.lease_margin:
+                    self.leases[key] = lease
+                    self._carried_leases.append(key)
+
+    def token_ttl(self) -> float:
+        if not self.lifetimes:
+            return self.default_token_ttl
+        # 取观测中位数的八成，宁可早换也不要拿着快过期的 token 出去撞 -11
+        return statistics.median(self.lifetimes) * 0.8
+
+    def record_token(self, token: str) -> None:
+        with self._lock:
+            self.tokens.setdefault(token, time.time())
+        self._maybe_save()
+
+    def retire_token(self, token: str) -> None:
+        with self._lock:
+            issued = self.tokens.pop(token, None)
+            if issued is not None and time.time() - issued >= MIN_LIFETIME_SAMPLE:
+                self.lifetimes.append(time.time() - issued)
+        self._maybe_save()
+
+    def valid_tokens(self) -> List[str]:
+        """按签发时间从旧到新返回仍在有效期内的 token。"""
+        with self._lock:
+            cutoff = time.time() - self.token_ttl()
+            return [token for token, issued in sorted(self.tokens.items(), key=lambda item: item[1]) if issued > cutoff]
+
+    def record_lease(self, proxy: Dict[str, str], deadline: Optional[float]) -> None:
+        if deadline is None:
+            return
+        with self._lock:
+            self.leases[proxy_key(proxy)] = {"proxy": proxy, "deadline": deadline}
+        self._maybe_save()
+
+    def drop_lease(self, proxy: Dict[str, str]) -> None:
+        with self._lock:
+            self.leases.pop(proxy_key(proxy), None)
+        self._maybe_save()
+
+    def take_carried_leases(self) -> List[Tuple[Dict[str, str], float]]:
+        """取出上次运行遗留且仍未到期的租约及其到期时间。"""
+        deadline_floor = time.time() + self.lease_margin
+        taken: List[Tuple[Dict[str, str], float]] = []
+        with self._lock:
+            while self._carried_leases:
+                lease = self.leases.get(self._carried_leases.pop(0))
+                if lease and float(lease["deadline"]) > deadline_floor:  # type: ignore[arg-type]
+                    taken.append((dict(lease["proxy"]), float(lease["deadline"])))  # type: ignore[arg-type]
+        return taken
+
+    def _maybe_save(self) -> None:
+        with self._lock:
+            due = time.monotonic() - self._last_save >= SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        """落盘并顺带清理已过期的 token 与租约；写失败只记日志，下次保存时会再写一次完整内容。"""
+        with self._save_lock:
+            now = time.time()
+            with self._lock:
+                self._last_save = time.monotonic()
+                cutoff = now - self.token_ttl()
+                for token in [token for token, issued in self.tokens.items() if issued <= cutoff]:
+                    del self.tokens[token]
+                for key in [key for key, lease in self.leases.items() if float(lease["deadline"]) <= now]:  # type: ignore[arg-type]
+                    del self.leases[key]
+                payload = {
+                    "tokens": dict(self.tokens),
+                    "token_lifetimes": list(self.lifetimes),
+                    "leases": dict(self.leases),
+                    "updated": int(now),
+                }
+            tmp_path = self.path.with_suffix(".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp_path, self.path)
+            except OSError as exc:
+                logger.warning("写入会话缓存 %s 失败: %s", self.path, exc)
+
+
+def _is_number(value: object) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,149 @@
+"""按艺术家对抓取任务做确定性分片，并汇总各分片的完成清单。
+
+分片按 `worksCount` 加权：艺术家按作品数从大到小依次分给当前负载最小的分片(LPT 贪心)，
+同一份 CSV 在任何机器上得到的划分都相同。每个分片把处理结果写入自己的清单文件，
+`merge_manifests` 再把它们合并成一份全局完成报告。
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_SAVE_INTERVAL = 5.0
+REPORT_NAME = "completion_report.json"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """解析 `i/N` 形式的分片参数，i 从 0 开始；用作 argparse 的 type。"""
+    try:
+        index_text, total_text = spec.split("/", 1)
+        index, total = int(index_text), int(total_text)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"分片参数格式应为 i/N: {spec}") from exc
+    if total <= 0 or not 0 <= index < total:
+        raise argparse.ArgumentTypeError(f"分片参数越界: {spec}，要求 0 <= i < N")
+    return index, total
+
+
+def assign_shards(weighted_ids: Iterable[Tuple[str, int]], total: int) -> Dict[str, int]:
+    loads = [0] * total
+    assignment: Dict[str, int] = {}
+    # 权重相同按 Id 排序，保证结果与 CSV 行序无关
+    ordered = sorted(weighted_ids, key=lambda item: (-item[1], item[0]))
+    for artist_id, weight in ordered:
+        if artist_id in assignment:
+            continue
+        shard = min(range(total), key=lambda i: (loads[i], i))
+        assignment[artist_id] = shard
+        loads[shard] += max(1, weight)
+    return assignment
+
+
+def select_shard(artist_ids: Sequence[str], weights: Dict[str, int], index: int, total: int) -> List[str]:
+    assignment = assign_shards(((artist_id, weights.get(artist_id, 0)) for artist_id in artist_ids), total)
+    return [artist_id for artist_id in artist_ids if assignment.get(artist_id) == index]
+
+
+def manifest_name(index: Optional[int], total: Optional[int]) -> str:
+    if index is None or total is None:
+        return "shard-all.json"
+    return f"shard-{index}-of-{total}.json"
+
+
+class ShardManifest:
+    """单个分片的处理清单，线程安全，按时间间隔落盘。"""
+
+    def __init__(self, path: Path, *, index: Optional[int], total: Optional[int], artist_ids: Sequence[str]):
+        self.path = path
+        self.index = index
+        self.total = total
+        self.artist_ids = list(artist_ids)
+        self.artists: Dict[str, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+        # 串行化整个落盘过程，多个线程同时保存时不会争用同一个临时文件
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+        if path.exists():
+            try:
+                previous = json.loads(path.read_text(encoding="utf-8"))
+                self.artists.update(previous.get("artists", {}))
+            except (OSError, json.JSONDecodeError):
+                pass
+
+    def record(self, artist_id: str, status: str, **details: object) -> None:
+        with self._lock:
+            self.artists[artist_id] = {"status": status, "updated": int(time.time()), **details}
+            due = time.monotonic() - self._last_save >= MANIFEST_SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        with self._save_lock:
+            with self._lock:
+                payload = {
+                    "shard": {"index": self.index, "total": self.total},
+                    "assigned": self.artist_ids,
+                    "artists": dict(self.artists),
+                    "updated": int(time.time()),
+                }
+                self._last_save = time.monotonic()
+            tmp_path = self.path.with_suffix(".tmp")
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp_path, self.path)
+            except OSError as exc:
+                # 清单只是进度记录，写失败不应中断抓取，下次保存时会再写一次完整内容
+                logger.warning("写入分片清单 %s 失败: %s", self.path, exc)
+
+
+def merge_manifests(manifest_dir: Path, all_artist_ids: Sequence[str]) -> Dict[str, object]:
+    merged: Dict[str, Dict[str, object]] = {}
+    shards: List[Dict[str, object]] = []
+    for path in sorted(manifest_dir.glob("shard-*.json")):
+        try:
+            payload = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            continue
+        artists = payload.get("artists", {})
+        statuses: Dict[str, int] = {}
+        for artist_id, entry in artists.items():
+            status = str(entry.get("status"))
+            statuses[status] = statuses.get(status, 0) + 1
+            current = merged.get(artist_id)
+            if current is None or entry.get("updated", 0) >= current.get("updated", 0):
+                merged[artist_id] = dict(entry, manifest=path.name)
+        shards.append(
+            {
+                "manifest": path.name,
+                "shard": payload.get("shard"),
+                "assigned": len(payload.get("assigned", [])),
+                "recorded": len(artists),
+                "statuses": statuses,
+            }
+        )
+
+    totals: Dict[str, int] = {}
+    for entry in merged.values():
+        status = str(entry.get("status"))
+        totals[status] = totals.get(status, 0) + 1
+    missing = [artist_id for artist_id in all_artist_ids if artist_id not in merged]
+    report = {
+        "generated": int(time.time()),
+        "artists_total": len(all_artist_ids),
+        "artists_recorded": len(merged),
+        "statuses": totals,
+        "missing": missing,
+        "shards": shards,
+        "artists": merged,
+    }
+    manifest_dir.mkdir(parents=True, exist_ok=True)
+    (manifest_dir / REPORT_NAME).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return report
@@ -0,0 +1,225 @@
+"""数据落盘的存储后端。
+
+键统一使用相对根目录的 POSIX 路径(如 `rawdata/<artist>/<work>/...`)，后端负责映射到实际位置：
+
+- `LocalStorage`：本地目录，默认行为，与此前直接写文件完全一致。
+- `S3Storage`：S3 兼容对象存储(AWS S3 / MinIO 等)，连接池复用，大文件走分段上传。
+
+通过 URL 选择后端::
+
+    data                          本地目录
+    file:///mnt/ltfc              本地目录
+    s3://bucket/prefix            S3，端点由 LTFC_S3_ENDPOINT 指定(本地 MinIO 如 http://127.0.0.1:9000)
+"""
+
+import os
+import posixpath
+import shutil
+import threading
+import urllib.parse
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+S3_ENDPOINT = os.getenv("LTFC_S3_ENDPOINT")
+S3_MAX_POOL_CONNECTIONS = 64
+S3_MULTIPART_THRESHOLD = 16 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+
+def join(*parts: str) -> str:
+    return posixpath.join(*(part for part in parts if part))
+
+
+class StorageBackend(ABC):
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def write_bytes(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def upload_file(self, local_path: Path, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def copy(self, src_key: str, dst_key: str) -> None:
+        ...
+
+    @abstractmethod
+    def list_dir(self, prefix: str) -> Tuple[List[str], List[str]]:
+        """返回 prefix 下一层的 (子目录名, 文件名)，均已排序。"""
+
+    @abstractmethod
+    def file_sizes(self, prefix: str) -> Dict[str, int]:
+        """返回 prefix 下一层文件的 {文件名: 字节数}；一次列举即可判断一批键是否存在。"""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        """返回 (字节数, 修改时间戳)，不存在时返回 None。"""
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """键对应的本地文件路径；非本地后端返回 None。"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: Path):
+        self.root = root
+        self._created: Set[Path] = set()
+        self._lock = threading.Lock()
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def _ensure_parent(self, path: Path) -> None:
+        # 同一目录只 mkdir 一次，瓦片写入时省掉大量重复的系统调用
+        parent = path.parent
+        if parent in self._created:
+            return
+        parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self._created.add(parent)
+
+    def exists(self, key: str) -> bool:
+        return self.local_path(key).exists()
+
+    def read_bytes(self, key: str) -> bytes:
+        return self.local_path(key).read_bytes()
+
+    def write_bytes(self, key: str, data: bytes) -> None:
+        path = self.local_path(key)
+        self._ensure_parent(path)
+        path.write_bytes(data)
+
+    def upload_file(self, local_path: Path, key: str) -> None:
+        target = self.local_path(key)
+        if target.resolve() == local_path.resolve():
+            return
+        self._ensure_parent(target)
+        shutil.copy2(local_path, target)
+
+    def copy(self, src_key: str, dst_key: str) -> None:
+        self.upload_file(self.local_path(src_key), dst_key)
+
+    def list_dir(self, prefix: str) -> Tuple[List[str], List[str]]:
+        base = self.local_path(prefix)
+        if not base.is_dir():
+            return [], []
+        dirs: List[str] = []
+        files: List[str] = []
+        for entry in os.scandir(base):
+            (dirs if entry.is_dir() else files).append(entry.name)
+        return sorted(dirs), sorted(files)
+
+    def file_sizes(self, prefix: str) -> Dict[str, int]:
+        base = self.local_path(prefix)
+        if not base.is_dir():
+            return {}
+        return {entry.name: entry.stat().st_size for entry in os.scandir(base) if entry.is_file()}
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            result = self.local_path(key).stat()
+        except FileNotFoundError:
+            return None
+        return result.st_size, result.st_mtime
+
+
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, prefix: str = "", *, endpoint_url: Optional[str] = None):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as exc:  # pragma: no cover - 可选依赖
+            raise RuntimeError("S3 存储需要安装 boto3 (pip install boto3)") from exc
+        from botocore.exceptions import ClientError
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, retries={"max_attempts": 5, "mode": "adaptive"}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+        )
+
+    def _key(self, key: str) -> str:
+        return join(self.prefix, key)
+
+    def _head(self, key: str) -> Optional[Dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def stat(self, key: str) -> Optional[Tuple[int, float]]:
+        head = self._head(key)
+        if head is None:
+            return None
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def read_bytes(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"].read()
+
+    def write_bytes(self, key: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def upload_file(self, local_path: Path, key: str) -> None:
+        # 超过阈值自动分段并发上传
+        self.client.upload_file(str(local_path), self.bucket, self._key(key), Config=self.transfer_config)
+
+    def copy(self, src_key: str, dst_key: str) -> None:
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self._key(src_key)},
+            self.bucket,
+            self._key(dst_key),
+            Config=self.transfer_config,
+        )
+
+    def _list(self, prefix: str) -> Tuple[List[str], Dict[str, int]]:
+        full_prefix = self._key(prefix).rstrip("/") + "/" if self._key(prefix) else ""
+        dirs: List[str] = []
+        files: Dict[str, int] = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=full_prefix, Delimiter="/"):
+            for common in page.get("CommonPrefixes", []):
+                dirs.append(common["Prefix"][len(full_prefix) :].rstrip("/"))
+            for item in page.get("Contents", []):
+                files[item["Key"][len(full_prefix) :]] = item["Size"]
+        return dirs, files
+
+    def list_dir(self, prefix: str) -> Tuple[List[str], List[str]]:
+        dirs, files = self._list(prefix)
+        return sorted(dirs), sorted(files)
+
+    def file_sizes(self, prefix: str) -> Dict[str, int]:
+        return self._list(prefix)[1]
+
+
+def open_storage(url: str) -> StorageBackend:
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme == "s3":
+        return S3Storage(parsed.netloc, parsed.path, endpoint_url=S3_ENDPOINT)
+    if parsed.scheme == "file":
+        return LocalStorage(Path(parsed.path))
+    # 单字母 scheme 是 Windows 盘符
+    if len(parsed.scheme) > 1:
+        raise ValueError(f"不支持的存储地址: {url}")
+    return LocalStorage(Path(url))
@@ -0,0 +1,98 @@
+"""与网络线程解耦的瓦片落盘阶段。
+
+网络线程把响应体交给 `TileWriter` 后立即返回去拉下一个瓦片；少量写线程从有界队列里成批
+取出数据写盘(本地后端每个目录只创建一次)。队列满时 `submit` 阻塞，对网络侧形成背压，内存占用
+有上限。实际写入由调用方传入的 `write` 完成(本地目录或对象存储)。写入结果按目录统计，
+调用方在写完成标记前用 `drain` 等待该目录全部落盘。
+"""
+
+import logging
+import queue
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class TileWriter:
+    def __init__(
+        self,
+        write: Callable[[Path, bytes], None],
+        *,
+        workers: int = 2,
+        max_pending: int = 256,
+        batch_size: int = 32,
+    ):
+        self.write = write
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[object]" = queue.Queue(maxsize=max_pending)
+        self._pending: Dict[Path, int] = defaultdict(int)
+        self._failed: Dict[Path, List[Path]] = defaultdict(list)
+        self._cond = threading.Condition()
+        self.written = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"tile-writer-{index}", daemon=True) for index in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path: Path, data: bytes) -> None:
+        with self._cond:
+            self._pending[path.parent] += 1
+        self._queue.put((path, data))
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch: List[Tuple[Path, bytes]] = [item]  # type: ignore[list-item]
+            stop = False
+            # 顺手取走队列里已就绪的数据，批量写入
+            while len(batch) < self.batch_size:
+                try:
+                    extra = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if extra is _STOP:
+                    stop = True
+                    break
+                batch.append(extra)  # type: ignore[arg-type]
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Tuple[Path, bytes]]) -> None:
+        results: List[Tuple[Path, bool]] = []
+        for path, data in batch:
+            try:
+                self.write(path, data)
+                results.append((path, True))
+            except Exception as exc:
+                logger.error("写入瓦片文件失败 %s: %s", path, exc)
+                results.append((path, False))
+        with self._cond:
+            for path, ok in results:
+                self._pending[path.parent] -= 1
+                if ok:
+                    self.written += 1
+                else:
+                    self._failed[path.parent].append(path)
+            self._cond.notify_all()
+
+    def drain(self, directory: Path, timeout: Optional[float] = None) -> List[Path]:
+        """等待 directory 下已提交的瓦片全部写完，返回写入失败的路径并清空该目录的记录。"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending.get(directory, 0) <= 0, timeout=timeout)
+            self._pending.pop(directory, None)
+            return self._failed.pop(directory, [])
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,139 @@
+"""请求级结构化追踪与低开销异步日志。
+
+`TraceWriter` 把每个 HTTP 请求的追踪记录放入有界队列，由后台线程批量写成 JSONL，
+工作线程只做一次非阻塞入队；队列满时丢弃并计数，绝不阻塞下载。
+`install_async_logging` 把 logger 的处理器挪到 QueueListener 线程，控制台格式化与输出
+不再占用工作线程。`ProgressSummary` 用周期性汇总代替逐条瓦片日志。
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACE_QUEUE_SIZE = 50_000
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_INTERVAL = 1.0
+
+
+class TraceWriter:
+    def __init__(self, path: Path, *, max_queue: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+
+    def start(self) -> "TraceWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+        return self
+
+    def emit(self, kind: str, **fields: object) -> None:
+        fields["ts"] = time.time()
+        fields["kind"] = kind
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self, first: Dict) -> List[Dict]:
+        batch = [first]
+        while len(batch) < TRACE_BATCH_SIZE:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 收到结束信号，放回去让主循环退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        with self.path.open("a", encoding="utf-8") as fp:
+            while True:
+                try:
+                    item = self._queue.get(timeout=TRACE_FLUSH_INTERVAL)
+                except queue.Empty:
+                    fp.flush()
+                    continue
+                if item is None:
+                    break
+                batch = self._drain(item)
+                fp.write("".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch))
+                self.written += len(batch)
+            fp.flush()
+
+    def close(self) -> None:
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        if self.dropped:
+            logger.warning("追踪队列已满，共丢弃 %s 条记录", self.dropped)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """进程内队列无需序列化，直接转交原始记录，把格式化留给监听线程。"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def install_async_logging(target: logging.Logger) -> QueueListener:
+    handlers = list(target.handlers)
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(_DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class ProgressSummary:
+    """按时间间隔汇总计数，替代逐条 INFO 日志。"""
+
+    def __init__(self, target: logging.Logger, label: str, interval: float):
+        self.target = target
+        self.label = label
+        self.interval = interval
+        self.total_count = 0
+        self.total_bytes = 0
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, size: int) -> None:
+        with self._lock:
+            self.total_count += 1
+            self.total_bytes += size
+            self._window_count += 1
+            self._window_bytes += size
+            now = time.monotonic()
+            elapsed = now - self._window_started
+            if elapsed < self.interval:
+                return
+            window_count, window_bytes = self._window_count, self._window_bytes
+            self._window_count = 0
+            self._window_bytes = 0
+            self._window_started = now
+        self.target.info(
+            "%s: 最近 %.0fs 新增 %s 个 (%.1f MB, %.1f 个/s)，累计 %s 个 (%.1f MB)",
+            self.label,
+            elapsed,
+            window_count,
+            window_bytes / 1_048_576,
+            window_count / elapsed,
+            self.total_count,
+            self.total_bytes / 1_048_576,
+        )
@@ -0,0 +1,104 @@
+"""全局与按主机的在途请求数、带宽上限。
+
+所有工作线程共享同一个 `TrafficLimiter`：请求发出前按 全局 -> 主机 的固定顺序占用并发槽
+(固定顺序避免互相等待)，响应到达后按实际字节数扣减令牌桶。令牌桶允许短时透支，
+透支部分由下一次调用方补足等待，长期平均速率不超过上限。
+
+按主机的限制也作用于其子域名：配置 `ltfc.net` 时 cag.ltfc.net 与 cag-ac.ltfc.net 共用同一组槽位
+和令牌桶；同时配置了更具体的主机名时以更具体的为准。
+"""
+
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+
+def parse_size(text: str) -> int:
+    """解析 `20M`、`512k`、`1G` 形式的字节数(1024 进制)，纯数字按字节计。"""
+    text = text.strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text or 0))
+
+
+def parse_host_map(text: str) -> Dict[str, str]:
+    """解析 `host=value,host=value` 形式的配置。"""
+    result: Dict[str, str] = {}
+    for item in text.split(","):
+        if "=" in item:
+            host, value = item.split("=", 1)
+            result[host.strip()] = value.strip()
+    return result
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float) -> None:
+        """扣减 amount 个令牌，余额为负时等待补足。"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            deficit = -self._tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+class TrafficLimiter:
+    def __init__(
+        self,
+        *,
+        max_in_flight: int = 0,
+        host_in_flight: Optional[Dict[str, int]] = None,
+        bandwidth: int = 0,
+        host_bandwidth: Optional[Dict[str, int]] = None,
+    ):
+        # 0 表示不限制
+        self._global_slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._host_slots = {host.lower(): threading.BoundedSemaphore(limit) for host, limit in (host_in_flight or {}).items() if limit > 0}
+        self._global_bucket = TokenBucket(bandwidth) if bandwidth > 0 else None
+        self._host_buckets = {host.lower(): TokenBucket(rate) for host, rate in (host_bandwidth or {}).items() if rate > 0}
+        self._resolved: Dict[Tuple[str, bool], Optional[str]] = {}
+
+    def _match(self, host: str, configured: Dict[str, object], kind: bool) -> Optional[str]:
+        """返回 host 对应的配置键：host 本身或其最具体的上级域名；kind 区分槽位与令牌桶两张表。"""
+        key = (host, kind)
+        if key not in self._resolved:
+            host = host.lower()
+            match = None
+            while host:
+                if host in configured:
+                    match = host
+                    break
+                host = host.partition(".")[2]
+            self._resolved[key] = match
+        return self._resolved[key]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._global_slots or self._host_slots or self._global_bucket or self._host_buckets)
+
+    @contextmanager
+    def slot(self, host: str) -> Iterator[None]:
+        with ExitStack() as stack:
+            for semaphore in (self._global_slots, self._host_slots.get(self._match(host, self._host_slots, False))):
+                if semaphore is not None:
+                    semaphore.acquire()
+                    stack.callback(semaphore.release)
+            yield
+
+    def consume(self, host: str, size: int) -> None:
+        if size <= 0:
+            return
+        for bucket in (self._global_bucket, self._host_buckets.get(self._match(host, self._host_buckets, True))):
+            if bucket is not None:
+                bucket.consume(size)
@@ -1,7 +1,20 @@
+"""把 `{"data": [...], "total": N}` 形式的列表导出(或 .jsonl)流式转换为 CSV / Parquet。
+
+`data` 数组逐条增量解析(安装了 ijson 时使用 ijson，否则用标准库 raw_decode 分块解析)，
+内存占用与单条记录大小相关，与文件大小无关，作品、资源级别的大导出也能处理。
+
+列名有两种确定方式：
+- `--schema preferred` 或 `--schema fields.txt`(每行一个列名)：预先给定列，单遍写出，多余的键被丢弃并计数；
+- 默认：第一遍把记录压缩写入临时 JSONL 并收集全部键，第二遍逐行读回写出，不再重复解析原始大文件。
+"""
+
+import argparse
 import csv
 import json
+import os
+import tempfile
 from pathlib import Path
-from typing import Any, Dict, Iterable, List
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional
 
 PREFERRED_FIELD_ORDER = [
     "Id",
@@ -54,8 +67,8 @@ def flatten_value(value: Any) -> str:
     return json.dumps(value, ensure_ascii=False)
 
 
-def collect_fieldnames(records: Iterable[Dict[str, Any]]) -> List[str]:
-    key_set = {key for record in records for key in record.keys()}
+def order_fieldnames(keys: Iterable[str]) -> List[str]:
+    key_set = set(keys)
     fieldnames: List[str] = []
 
     for field in PREFERRED_FIELD_ORDER:
@@ -67,29 +80,243 @@ def collect_fieldnames(records: Iterable[Dict[str, Any]]) -> List[str]:
     return fieldnames
 
 
-def main() -> None:
-    if not INPUT_JSON.exists():
-        raise FileNotFoundError(f"未找到 {INPUT_JSON}")
+def collect_fieldnames(records: Iterable[Dict[str, Any]]) -> List[str]:
+    return order_fieldnames(key for record in records for key in record.keys())
+
+
+VALUE_DELIMITERS = frozenset(" \t\r\n,:]}")
+
+
+def _iter_json_array(fp: IO[str], chunk_size: int) -> Iterator[Any]:
+    """标准库实现：在分块读取的缓冲区上用 raw_decode 逐个解析顶层对象 `data` 数组中的元素。"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
 
-    payload = json.loads(INPUT_JSON.read_text(encoding="utf-8"))
-    raw_records = payload.get("data", [])
-    records = [item for item in raw_records if isinstance(item, dict)]
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
 
-    if not records:
-        OUTPUT_CSV.write_text("", encoding="utf-8")
-        print("response.json 中未找到有效数据，已创建空的 artists.csv")
+    def skip_ws() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                return ""
+
+    def decode() -> Any:
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 元素跨越缓冲区边界，继续读入；读到文件末尾仍失败则是真的格式错误
+                if not fill():
+                    raise
+                continue
+            # 数字可能被缓冲区边界截断(如 "3." 被解析成 3)，确认其后紧跟分隔符
+            if (end == len(buffer) or buffer[end] not in VALUE_DELIMITERS) and not eof and fill():
+                continue
+            pos = end
+            return value
+
+    def expect(char: str) -> None:
+        nonlocal pos
+        if skip_ws() != char:
+            raise ValueError(f"JSON 格式异常：期望 {char!r}，位置 {pos}")
+        pos += 1
+
+    expect("{")
+    while skip_ws() not in ("}", ""):
+        key = decode()
+        expect(":")
+        if skip_ws() != "[" or key != "data":
+            decode()  # 其他字段(如 total)解析后丢弃
+        else:
+            pos += 1
+            while skip_ws() != "]":
+                yield decode()
+                if skip_ws() == ",":
+                    pos += 1
+            pos += 1
+        if skip_ws() == ",":
+            pos += 1
+
+
+def iter_records(path: Path, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """逐条返回记录。`.jsonl` 每行一条记录，或是 get_ID 检查点中的一页 {"skip", "data": [...]}。"""
+    if path.suffix == ".jsonl":
+        with path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if isinstance(item, dict) and isinstance(item.get("data"), list) and "skip" in item:
+                    yield from (record for record in item["data"] if isinstance(record, dict))
+                elif isinstance(item, dict):
+                    yield item
         return
+    try:
+        import ijson
+    except ImportError:  # 可选依赖，未安装时用标准库分块解析
+        ijson = None
+    if ijson is not None:
+        with path.open("rb") as binary:
+            for item in ijson.items(binary, "data.item", use_float=True):
+                if isinstance(item, dict):
+                    yield item
+        return
+    with path.open("r", encoding="utf-8") as fp:
+        for item in _iter_json_array(fp, chunk_size):
+            if isinstance(item, dict):
+                yield item
+
+
+class CsvSink:
+    def __init__(self, path: Path, fieldnames: List[str]):
+        self.fp = path.open("w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.fp, fieldnames=fieldnames)
+        self.writer.writeheader()
+
+    def write(self, row: Dict[str, str]) -> None:
+        self.writer.writerow(row)
 
-    fieldnames = collect_fieldnames(records)
+    def close(self) -> None:
+        self.fp.close()
 
-    with OUTPUT_CSV.open("w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for record in records:
-            flattened = {field: flatten_value(record.get(field)) for field in fieldnames}
-            writer.writerow(flattened)
 
-    print(f"共写入 {len(records)} 条记录到 {OUTPUT_CSV.name}")
+class ParquetSink:
+    """按批写 Parquet；所有列与 CSV 一致按字符串存储。"""
+
+    def __init__(self, path: Path, fieldnames: List[str], batch_size: int):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise SystemExit("输出 Parquet 需要安装 pyarrow (pip install pyarrow)") from exc
+        self._pa = pa
+        self.fieldnames = fieldnames
+        self.batch_size = batch_size
+        self.schema = pa.schema([(name, pa.string()) for name in fieldnames])
+        self.writer = pq.ParquetWriter(str(path), self.schema, compression="zstd")
+        self._rows: List[Dict[str, str]] = []
+
+    def write(self, row: Dict[str, str]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        columns = {name: [row[name] for row in self._rows] for name in self.fieldnames}
+        self.writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+        self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+
+def open_sink(path: Path, fieldnames: List[str], fmt: str, batch_size: int):
+    if fmt == "parquet":
+        return ParquetSink(path, fieldnames, batch_size)
+    return CsvSink(path, fieldnames)
+
+
+def load_schema(spec: str) -> List[str]:
+    if spec == "preferred":
+        return list(PREFERRED_FIELD_ORDER)
+    return [line.strip() for line in Path(spec).read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+def convert(
+    input_path: Path,
+    output_path: Path,
+    *,
+    fieldnames: Optional[List[str]] = None,
+    fmt: str = "csv",
+    batch_size: int = 10_000,
+) -> int:
+    """流式转换，返回写出的记录数。给定 fieldnames 时单遍完成，否则先溢写临时文件再写出。"""
+    count = 0
+    if fieldnames is not None:
+        dropped: Dict[str, int] = {}
+        known = set(fieldnames)
+        sink = open_sink(output_path, fieldnames, fmt, batch_size)
+        try:
+            for record in iter_records(input_path):
+                for key in record.keys() - known:
+                    dropped[key] = dropped.get(key, 0) + 1
+                sink.write({field: flatten_value(record.get(field)) for field in fieldnames})
+                count += 1
+        finally:
+            sink.close()
+        if dropped:
+            print(f"预设列之外的字段已丢弃: {dropped}")
+        return count
+
+    keys: Dict[str, None] = {}
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", dir=output_path.parent, delete=False, encoding="utf-8") as spill:
+        spill_path = Path(spill.name)
+        for record in iter_records(input_path):
+            keys.update(dict.fromkeys(record.keys()))
+            spill.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            count += 1
+    try:
+        if count == 0:
+            output_path.write_text("", encoding="utf-8")
+            return 0
+        fieldnames = order_fieldnames(keys)
+        sink = open_sink(output_path, fieldnames, fmt, batch_size)
+        try:
+            with spill_path.open("r", encoding="utf-8") as fp:
+                for line in fp:
+                    record = json.loads(line)
+                    sink.write({field: flatten_value(record.get(field)) for field in fieldnames})
+        finally:
+            sink.close()
+    finally:
+        os.unlink(spill_path)
+    return count
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把列表导出 JSON 流式转换为 CSV / Parquet")
+    parser.add_argument("input", nargs="?", type=Path, default=INPUT_JSON, help="输入 .json 或 .jsonl")
+    parser.add_argument("output", nargs="?", type=Path, default=None, help="输出文件，默认与输入同名")
+    parser.add_argument("--format", choices=("csv", "parquet"), default=None, help="输出格式，默认按输出扩展名判断")
+    parser.add_argument("--schema", default=None, help="预设列：preferred 或每行一个列名的文件；不指定时两遍溢写")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Parquet 每批行数")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    input_path: Path = args.input
+    if not input_path.exists():
+        raise FileNotFoundError(f"未找到 {input_path}")
+    fmt = args.format or ("parquet" if args.output is not None and args.output.suffix == ".parquet" else "csv")
+    output_path: Path = args.output or (OUTPUT_CSV if input_path == INPUT_JSON and fmt == "csv" else input_path.with_suffix("." + fmt))
+    fieldnames = load_schema(args.schema) if args.schema else None
+
+    count = convert(input_path, output_path, fieldnames=fieldnames, fmt=fmt, batch_size=args.batch_size)
+    if count == 0:
+        print(f"{input_path.name} 中未找到有效数据，已创建空的 {output_path.name}")
+        return
+    print(f"共写入 {count} 条记录到 {output_path.name}")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
+import argparse
+import bisect
 import csv
 import json
+import os
+import queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Set, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import requests
 from faker import Faker
@@ -72,15 +78,28 @@ PREFERRED_FIELD_ORDER = [
 OUTPUT_DIR = Path(__file__).resolve().parent
 OUTPUT_JSON = OUTPUT_DIR / "artists.json"
 OUTPUT_CSV = OUTPUT_DIR / "artists.csv"
+# 每抓完一页追加一行 {"skip", "count", "total", "data"}，抓取结束后压缩为 artists.json / artists.csv
+CHECKPOINT_JSONL = OUTPUT_DIR / "artists.pages.jsonl"
+
+ACCESS_TOKEN_URL = 'https://api.quanku.art/cag2.TouristService/getAccessToken'
+
+
+def fetch_token() -> str:
+    response = requests.post(ACCESS_TOKEN_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json()['token']
+
 
 def init():
-    response = requests.post('https://api.quanku.art/cag2.TouristService/getAccessToken', headers=HEADERS)
-    PAYLOAD_TEMPLATE["context"]["tourToken"] = response.json()['token']
+    PAYLOAD_TEMPLATE["context"]["tourToken"] = fetch_token()
 
-def build_payload(skip: int) -> Dict[str, Any]:
+def build_payload(skip: int, token: Optional[str] = None, limit: int = PAGE_SIZE) -> Dict[str, Any]:
     """基于模板构造分页请求体。"""
     payload = deepcopy(PAYLOAD_TEMPLATE)
     payload["page"]["skip"] = skip
+    payload["page"]["limit"] = limit
+    if token:
+        payload["context"]["tourToken"] = token
     return payload
 
 
@@ -107,9 +126,9 @@ def load_existing_data() -> Tuple[List[Record], int]:
     return sanitized_data, total_value
 
 
-def fetch_page(skip: int) -> Tuple[List[Record], int]:
+def fetch_page(skip: int, token: Optional[str] = None, limit: int = PAGE_SIZE) -> Tuple[List[Record], int]:
     """抓取单页数据，返回清洗后的记录以及服务端宣称的总数。"""
-    payload = build_payload(skip)
+    payload = build_payload(skip, token, limit)
 
     response = requests.post(API_URL, headers=HEADERS, json=payload, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
@@ -154,11 +173,13 @@ def collect_fieldnames(records: Iterable[Record]) -> List[str]:
 
 
 def write_json(records: List[Record], total: int) -> None:
-    """以 JSON 形式写入抓取结果。"""
-    OUTPUT_JSON.write_text(
-        json.dumps({"data": records, "total": total}, ensure_ascii=False, indent=2),
+    """以 JSON 形式写入抓取结果(紧凑编码，先写临时文件再替换)。"""
+    tmp_path = OUTPUT_JSON.with_name(OUTPUT_JSON.name + ".tmp")
+    tmp_path.write_text(
+        json.dumps({"data": records, "total": total}, ensure_ascii=False, separators=(",", ":")),
         encoding="utf-8",
     )
+    os.replace(tmp_path, OUTPUT_JSON)
 
 
 def write_csv(records: List[Record]) -> None:
@@ -178,52 +199,195 @@ def write_csv(records: List[Record]) -> None:
 
 
 def persist_progress(records: List[Record], total: int) -> None:
-    """将当前抓取进度同步到磁盘。"""
+    """将完整结果写入 artists.json 与 artists.csv。"""
     normalized_total = total if isinstance(total, int) and total > 0 else len(records)
     write_json(records, normalized_total)
     write_csv(records)
 
 
-def fetch_all(initial_records: List[Record], initial_total: int) -> Tuple[List[Record], int]:
-    """在断点续传基础上持续抓取，直到达到服务端声明的总数。"""
-    records: List[Record] = [item for item in initial_records if isinstance(item, dict)]
-    seen_ids: Set[Any] = {record.get("Id") for record in records if "Id" in record}
-
-    expected_total = initial_total or TOTAL_RECORDS
-    skip = len(records)
-
-    while skip < expected_total:
-        page_records, page_total = fetch_page(skip)
-        if not page_records:
-            break
-
-        for item in page_records:
-            item_id = item.get("Id") if isinstance(item, dict) else None
-            if item_id in seen_ids:
-                continue
-            records.append(item)
-            if item_id is not None:
-                seen_ids.add(item_id)
-
-        expected_total = page_total if isinstance(page_total, int) else expected_total
-        skip += len(page_records)
+class Checkpoint:
+    """追加式分页检查点：每页一行，写入代价与已抓取总量无关；末尾的半行(中断时写坏)在读取时忽略。"""
+
+    def __init__(self, path: Path = CHECKPOINT_JSONL):
+        self.path = path
+        self.pages: List[Tuple[int, int, List[Record]]] = []
+        self.total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                    if not isinstance(entry, dict) or not isinstance(entry.get("data", []), list):
+                        raise ValueError("不是分页记录")
+                    data = [item for item in entry.get("data", []) if isinstance(item, dict)]
+                    page = (int(entry.get("skip", 0)), int(entry.get("count", len(data))), data)
+                except (ValueError, TypeError):
+                    print(f"忽略检查点中损坏的行: {line[:80]!r}")
+                    continue
+                self.pages.append(page)
+                if isinstance(entry.get("total"), int):
+                    self.total = entry["total"]
+
+    def seed(self, records: List[Record], total: int) -> None:
+        """把旧版 artists.json 中的数据作为起始页写入检查点。"""
+        if records and not self.pages:
+            self.append(0, records, total)
+
+    def append(self, skip: int, records: List[Record], total: int) -> None:
+        line = json.dumps({"skip": skip, "count": len(records), "total": total, "data": records}, ensure_ascii=False)
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as fp:
+                fp.write(line + "\n")
+            self.pages.append((skip, len(records), records))
+            self.total = total
+
+    def covered(self) -> List[Tuple[int, int]]:
+        """已抓取的 [起点, 终点) 区间，已合并、排序。"""
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted((skip, skip + count) for skip, count, _ in self.pages if count > 0):
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    def pending(self, total: int, page_size: int) -> List[int]:
+        """尚未完整覆盖的分页起点。"""
+        merged = self.covered()
+        starts = [start for start, _ in merged]
+        result: List[int] = []
+        for skip in range(0, total, page_size):
+            end = min(skip + page_size, total)
+            index = bisect.bisect_right(starts, skip) - 1
+            if index < 0 or merged[index][1] < end:
+                result.append(skip)
+        return result
+
+    def records(self) -> List[Record]:
+        """按分页顺序合并、按 Id 去重后的全部记录。"""
+        records: List[Record] = []
+        seen_ids: Set[Any] = set()
+        for _, _, data in sorted(self.pages, key=lambda page: page[0]):
+            for item in data:
+                item_id = item.get("Id")
+                if item_id is not None and item_id in seen_ids:
+                    continue
+                records.append(item)
+                if item_id is not None:
+                    seen_ids.add(item_id)
+        return records
+
+    def compact(self, page_size: int) -> Tuple[List[Record], int, List[int]]:
+        """写出 artists.json / artists.csv；所有分页都已覆盖时才删除检查点，否则保留以便下次续抓。
+
+        返回 (记录, 总数, 仍缺失的分页起点)。
+        """
+        records = self.records()
+        total = self.total or len(records)
+        missing = self.pending(total, page_size)
+        persist_progress(records, total)
+        if not missing:
+            self.path.unlink(missing_ok=True)
+        return records, total, missing
+
+
+class TokenPool:
+    """多个 tourToken 轮流使用，每个 token 两次请求之间至少间隔 interval 秒。"""
+
+    def __init__(self, tokens: List[Optional[str]], interval: float):
+        self.interval = interval
+        self._queue: "queue.Queue[Tuple[float, Optional[str]]]" = queue.Queue()
+        for token in tokens:
+            self._queue.put((0.0, token))
+
+    def request(self, skip: int, limit: int) -> Tuple[List[Record], int]:
+        ready_at, token = self._queue.get()
+        try:
+            delay = ready_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            return fetch_page(skip, token, limit)
+        finally:
+            self._queue.put((time.monotonic() + self.interval, token))
+
+
+def fetch_all(
+    checkpoint: Checkpoint,
+    initial_total: int,
+    *,
+    tokens: Optional[List[Optional[str]]] = None,
+    page_size: int = PAGE_SIZE,
+    workers: int = 1,
+    interval: float = THROTTLE_SECONDS,
+) -> None:
+    """在检查点基础上补齐所有分页；workers > 1 时多页并发，由 TokenPool 按 token 限速。"""
+    pool = TokenPool(tokens or [None], interval)
+    expected_total = checkpoint.total or initial_total or TOTAL_RECORDS
+
+    # 先串行取第一个缺口，拿到服务端最新的总数再并发
+    pending = checkpoint.pending(expected_total, page_size)
+    if pending:
+        page_records, page_total = pool.request(pending[0], page_size)
+        checkpoint.append(pending[0], page_records, page_total)
+        expected_total = page_total
+        pending = checkpoint.pending(expected_total, page_size)
+
+    def fetch(skip: int) -> None:
+        page_records, page_total = pool.request(skip, page_size)
+        if page_records:
+            checkpoint.append(skip, page_records, page_total)
+        print(f"skip={skip} 获取 {len(page_records)} 条")
+
+    if workers <= 1:
+        for skip in pending:
+            fetch(skip)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(fetch, skip) for skip in pending]:
+            future.result()
 
-        persist_progress(records, expected_total)
-        time.sleep(THROTTLE_SECONDS)
 
-    return records, expected_total
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="分页抓取艺术家列表")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="每页条数")
+    parser.add_argument("--workers", type=int, default=1, help="并发请求的分页数")
+    parser.add_argument("--tokens", type=int, default=1, help="并发时使用的 tourToken 数，每个 token 独立限速")
+    parser.add_argument("--interval", type=float, default=THROTTLE_SECONDS, help="同一 token 两次请求的最小间隔(秒)")
+    parser.add_argument("--compact-only", action="store_true", help="只把现有检查点压缩为 artists.json / artists.csv")
+    return parser.parse_args()
 
 
 def main() -> None:
-    init()
-    """脚本入口：加载缓存，抓取数据并写出结果。"""
+    """脚本入口：加载检查点，抓取剩余分页并压缩写出结果。"""
+    args = parse_args()
+    checkpoint = Checkpoint()
+    checkpoint.load()
     existing_records, existing_total = load_existing_data()
-    if existing_records:
-        print(f"检测到已完成 {len(existing_records)} 条数据，继续抓取剩余部分。")
-
-    records, total = fetch_all(existing_records, existing_total)
-    persist_progress(records, total)
+    checkpoint.seed(existing_records, existing_total)
+    if checkpoint.pages:
+        print(f"检测到已完成 {sum(count for _, count, _ in checkpoint.pages)} 条数据，继续抓取剩余部分。")
+
+    if not args.compact_only:
+        init()
+        tokens: List[Optional[str]] = [PAYLOAD_TEMPLATE["context"]["tourToken"]]
+        tokens.extend(fetch_token() for _ in range(max(1, args.tokens) - 1))
+        fetch_all(
+            checkpoint,
+            existing_total,
+            tokens=tokens,
+            page_size=args.page_size,
+            workers=max(1, args.workers),
+            interval=args.interval,
+        )
+
+    records, total, missing = checkpoint.compact(args.page_size)
     print(f"共获取 {len(records)} 条数据，目标总数 {total}，已写入 {OUTPUT_CSV.name}")
+    if missing:
+        print(f"仍有 {len(missing)} 页未取得(skip={missing[:10]})，结果不完整，已保留检查点 {CHECKPOINT_JSONL.name}，重新运行可继续抓取。")
 
 
 if __name__ == "__main__":
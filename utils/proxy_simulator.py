@@ -0,0 +1,397 @@
+"""本地代理池模拟器。
+
+模拟 proxy.qg.net 的 allocate 接口，并为每个分配出去的“IP”在本机启动一个转发代理，
+可以按比例注入认证失败(407)、慢响应以及 IP 过期，用于在不购买真实 IP 的情况下
+压测下载器的代理轮换逻辑。
+
+用法::
+
+    python utils/proxy_simulator.py --port 18000 --auth-fail-rate 0.05 --ttl 60
+    QINGGOU_KEY=dummy QINGGOU_ALLOCATE_URL=http://127.0.0.1:18000/allocate python get_together.py
+
+访问 http://127.0.0.1:18000/stats 可查看分配次数、转发请求数以及注入的故障数。
+"""
+
+import argparse
+import http.client
+import json
+import random
+import select
+import socket
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+RELAY_BUFFER_SIZE = 64 * 1024
+RELAY_IDLE_TIMEOUT = 60
+UPSTREAM_TIMEOUT = 30
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+
+@dataclass
+class SimulatorConfig:
+    host: str = "127.0.0.1"
+    port: int = 18000
+    auth_fail_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_seconds: float = 5.0
+    ttl: float = 60.0
+    ttl_jitter: float = 0.0
+    expired_grace: float = 30.0
+    allocate_delay: float = 0.0
+    allocate_fail_rate: float = 0.0
+    max_num: int = 200
+    seed: Optional[int] = None
+
+
+@dataclass
+class SimulatorStats:
+    allocate_calls: int = 0
+    allocate_failures: int = 0
+    proxies_allocated: int = 0
+    proxies_active: int = 0
+    proxies_reaped: int = 0
+    requests_forwarded: int = 0
+    tunnels_opened: int = 0
+    auth_failures_injected: int = 0
+    expired_rejections: int = 0
+    slowdowns_injected: int = 0
+    bytes_relayed: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return {k: v for k, v in self.__dict__.items() if k != "lock"}
+
+
+class ForwardingProxyHandler(BaseHTTPRequestHandler):
+    """单个模拟 IP 的转发代理，支持 CONNECT 隧道与绝对 URI 的普通 HTTP 转发。"""
+
+    protocol_version = "HTTP/1.1"
+    server: "_ProxyServer"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - 覆盖基类签名
+        return
+
+    def _inject_faults(self) -> bool:
+        proxy = self.server.proxy
+        stats = proxy.simulator.stats
+        config = proxy.simulator.config
+        if proxy.expired:
+            stats.incr("expired_rejections")
+            self._reject_auth()
+            return False
+        if config.auth_fail_rate and proxy.simulator.random() < config.auth_fail_rate:
+            stats.incr("auth_failures_injected")
+            self._reject_auth()
+            return False
+        if config.slow_rate and proxy.simulator.random() < config.slow_rate:
+            stats.incr("slowdowns_injected")
+            time.sleep(config.slow_seconds)
+        return True
+
+    def _reject_auth(self) -> None:
+        body = b"Proxy Authentication Required"
+        self.send_response(407, "Proxy Authentication Required")
+        self.send_header("Proxy-Authenticate", 'Basic realm="simulator"')
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+    def do_CONNECT(self) -> None:
+        if not self._inject_faults():
+            return
+        host, _, port = self.path.rpartition(":")
+        try:
+            upstream = socket.create_connection((host, int(port or 443)), timeout=UPSTREAM_TIMEOUT)
+        except (OSError, ValueError) as exc:
+            self.send_error(502, f"无法连接上游: {exc}")
+            return
+        self.server.proxy.simulator.stats.incr("tunnels_opened")
+        self.send_response(200, "Connection established")
+        self.end_headers()
+        self._relay(self.connection, upstream)
+        self.close_connection = True
+
+    def _relay(self, client: socket.socket, upstream: socket.socket) -> None:
+        stats = self.server.proxy.simulator.stats
+        sockets = [client, upstream]
+        relayed = 0
+        try:
+            while True:
+                readable, _, errored = select.select(sockets, [], sockets, RELAY_IDLE_TIMEOUT)
+                if errored or not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(RELAY_BUFFER_SIZE)
+                    if not data:
+                        return
+                    target = upstream if sock is client else client
+                    target.sendall(data)
+                    relayed += len(data)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            stats.incr("bytes_relayed", relayed)
+
+    def _forward(self) -> None:
+        if not self._inject_faults():
+            return
+        parsed = urllib.parse.urlsplit(self.path)
+        if not parsed.scheme or not parsed.hostname:
+            self.send_error(400, "代理请求必须使用绝对 URI")
+            return
+        connection_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        upstream = connection_cls(parsed.hostname, parsed.port, timeout=UPSTREAM_TIMEOUT)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else None
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+        try:
+            upstream.request(self.command, path, body=body, headers=headers)
+            response = upstream.getresponse()
+            payload = response.read()
+        except OSError as exc:
+            self.send_error(502, f"上游请求失败: {exc}")
+            return
+        finally:
+            upstream.close()
+
+        self.send_response(response.status, response.reason)
+        for key, value in response.getheaders():
+            if key.lower() in HOP_BY_HOP_HEADERS or key.lower() == "content-length":
+                continue
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+        stats = self.server.proxy.simulator.stats
+        stats.incr("requests_forwarded")
+        stats.incr("bytes_relayed", len(payload))
+
+    do_GET = _forward
+    do_POST = _forward
+    do_PUT = _forward
+    do_DELETE = _forward
+    do_HEAD = _forward
+    do_OPTIONS = _forward
+
+
+class _ProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+    proxy: "SimulatedProxy"
+
+
+class SimulatedProxy:
+    def __init__(self, simulator: "ProxyPoolSimulator", ttl: float):
+        self.simulator = simulator
+        self.created_at = time.time()
+        self.deadline = self.created_at + ttl
+        self.server = _ProxyServer((simulator.config.host, 0), ForwardingProxyHandler)
+        self.server.proxy = self
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f"proxy-{self.port}", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    @property
+    def address(self) -> str:
+        return f"{self.simulator.config.host}:{self.port}"
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.deadline
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ProxyPoolSimulator:
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.stats = SimulatorStats()
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._proxies: List[SimulatedProxy] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = threading.Thread(target=self._reap_loop, name="proxy-reaper", daemon=True)
+
+    def random(self) -> float:
+        with self._rng_lock:
+            return self._rng.random()
+
+    def allocate(self, num: int) -> List[SimulatedProxy]:
+        num = max(1, min(num, self.config.max_num))
+        allocated: List[SimulatedProxy] = []
+        for _ in range(num):
+            jitter = self.config.ttl_jitter * (self.random() * 2 - 1)
+            proxy = SimulatedProxy(self, max(1.0, self.config.ttl + jitter))
+            proxy.start()
+            allocated.append(proxy)
+        with self._lock:
+            self._proxies.extend(allocated)
+        self.stats.incr("proxies_allocated", len(allocated))
+        self.stats.incr("proxies_active", len(allocated))
+        return allocated
+
+    def _reap_loop(self) -> None:
+        while not self._stop.wait(1.0):
+            cutoff = time.time() - self.config.expired_grace
+            with self._lock:
+                stale = [p for p in self._proxies if p.deadline < cutoff]
+                self._proxies = [p for p in self._proxies if p.deadline >= cutoff]
+            for proxy in stale:
+                proxy.stop()
+            if stale:
+                self.stats.incr("proxies_reaped", len(stale))
+                self.stats.incr("proxies_active", -len(stale))
+
+    def start(self) -> None:
+        self._reaper.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            proxies, self._proxies = self._proxies, []
+        for proxy in proxies:
+            proxy.stop()
+
+
+class AllocateHandler(BaseHTTPRequestHandler):
+    """模拟 allocate 接口，返回结构与下载器 `_fetch_proxy_hosts` 解析的格式一致。"""
+
+    server: "_AllocateServer"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - 覆盖基类签名
+        return
+
+    def _send_json(self, status: int, payload: Dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        parsed = urllib.parse.urlsplit(self.path)
+        simulator = self.server.simulator
+        if parsed.path == "/stats":
+            self._send_json(200, simulator.stats.snapshot())
+            return
+        if parsed.path != "/allocate":
+            self._send_json(404, {"Code": -1, "Msg": "not found"})
+            return
+
+        query = urllib.parse.parse_qs(parsed.query)
+        simulator.stats.incr("allocate_calls")
+        if not query.get("Key", [""])[0]:
+            self._send_json(200, {"Code": -1, "Msg": "Key 不能为空", "Data": []})
+            return
+        try:
+            num = int(query.get("Num", ["1"])[0])
+        except ValueError:
+            num = 1
+        if simulator.config.allocate_delay:
+            time.sleep(simulator.config.allocate_delay)
+        if simulator.config.allocate_fail_rate and simulator.random() < simulator.config.allocate_fail_rate:
+            simulator.stats.incr("allocate_failures")
+            self._send_json(200, {"Code": -2, "Msg": "模拟分配失败", "Data": []})
+            return
+
+        proxies = simulator.allocate(num)
+        data = [
+            {
+                "host": proxy.address,
+                "server": proxy.address,
+                "proxy_ip": simulator.config.host,
+                "deadline": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(proxy.deadline)),
+            }
+            for proxy in proxies
+        ]
+        self._send_json(200, {"Code": 0, "Num": len(data), "Data": data})
+
+
+class _AllocateServer(ThreadingHTTPServer):
+    daemon_threads = True
+    simulator: ProxyPoolSimulator
+
+
+def serve(config: SimulatorConfig) -> None:
+    simulator = ProxyPoolSimulator(config)
+    server = _AllocateServer((config.host, config.port), AllocateHandler)
+    server.simulator = simulator
+    simulator.start()
+    print(f"代理池模拟器已启动: http://{config.host}:{config.port}/allocate (统计: /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        simulator.stop()
+        print(json.dumps(simulator.stats.snapshot(), ensure_ascii=False, indent=2))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> SimulatorConfig:
+    parser = argparse.ArgumentParser(description="proxy.qg.net 分配接口与转发代理的本地模拟器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--auth-fail-rate", type=float, default=0.0, help="每个请求返回 407 的概率")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="每个请求被注入延迟的概率")
+    parser.add_argument("--slow-seconds", type=float, default=5.0, help="注入延迟的秒数")
+    parser.add_argument("--ttl", type=float, default=60.0, help="每个 IP 的有效期(秒)")
+    parser.add_argument("--ttl-jitter", type=float, default=0.0, help="有效期随机抖动幅度(秒)")
+    parser.add_argument("--expired-grace", type=float, default=30.0, help="过期后继续返回 407 的时长，之后端口关闭")
+    parser.add_argument("--allocate-delay", type=float, default=0.0, help="allocate 接口的响应延迟(秒)")
+    parser.add_argument("--allocate-fail-rate", type=float, default=0.0, help="allocate 接口返回失败的概率")
+    parser.add_argument("--max-num", type=int, default=200, help="单次分配的最大 IP 数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现故障序列")
+    args = parser.parse_args(argv)
+    return SimulatorConfig(
+        host=args.host,
+        port=args.port,
+        auth_fail_rate=args.auth_fail_rate,
+        slow_rate=args.slow_rate,
+        slow_seconds=args.slow_seconds,
+        ttl=args.ttl,
+        ttl_jitter=args.ttl_jitter,
+        expired_grace=args.expired_grace,
+        allocate_delay=args.allocate_delay,
+        allocate_fail_rate=args.allocate_fail_rate,
+        max_num=args.max_num,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    serve(parse_args())
@@ -0,0 +1,563 @@
+"""本地 S3 兼容对象存储模拟器(MinIO 风格的替身)。
+
+实现 `storage.S3Storage` 用到的接口：HeadObject / GetObject / PutObject / CopyObject、
+ListObjectsV2(前缀 + 分隔符 + 分页)以及分段上传与分段复制。对象保存在内存中，
+可以按比例注入 503 SlowDown 与响应延迟，用于在没有 MinIO / S3 的环境下验证存储后端，
+并统计各类请求次数(例如确认瓦片存在性检查走的是一次 List 而不是逐个 HEAD)。
+
+用法::
+
+    python utils/s3_simulator.py --port 19000 --bucket ltfc
+    AWS_ACCESS_KEY_ID=x AWS_SECRET_ACCESS_KEY=x LTFC_S3_ENDPOINT=http://127.0.0.1:19000 \\
+        LTFC_STORAGE=s3://ltfc/data python get_together.py
+
+    python utils/s3_simulator.py --smoke    启动临时实例，对 S3Storage 做一遍读写/列举/复制/分段上传自检
+
+访问 http://127.0.0.1:19000/_stats 可查看各类请求数与注入的故障数。
+"""
+
+import argparse
+import email.utils
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+DEFAULT_MAX_KEYS = 1000
+
+
+@dataclass
+class SimulatorConfig:
+    host: str = "127.0.0.1"
+    port: int = 19000
+    buckets: List[str] = field(default_factory=lambda: ["ltfc"])
+    error_rate: float = 0.0
+    latency: float = 0.0
+    page_size: int = DEFAULT_MAX_KEYS
+    seed: Optional[int] = None
+
+
+@dataclass
+class StoredObject:
+    data: bytes
+    modified: float
+    etag: str
+
+
+@dataclass
+class SimulatorStats:
+    requests: Dict[str, int] = field(default_factory=dict)
+    errors_injected: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, operation: str) -> None:
+        with self.lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "errors_injected": self.errors_injected,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+            }
+
+
+class ObjectStore:
+    """按桶保存对象与未完成的分段上传，所有操作加锁。"""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.stats = SimulatorStats()
+        self.buckets: Dict[str, Dict[str, StoredObject]] = {name: {} for name in config.buckets}
+        self.uploads: Dict[str, Tuple[str, str, Dict[int, bytes]]] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.seed)
+
+    def should_fail(self) -> bool:
+        if not self.config.error_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.config.error_rate
+
+    def get(self, bucket: str, key: str) -> Optional[StoredObject]:
+        with self._lock:
+            return self.buckets.get(bucket, {}).get(key)
+
+    def put(self, bucket: str, key: str, data: bytes, etag: Optional[str] = None) -> StoredObject:
+        stored = StoredObject(data, time.time(), etag or hashlib.md5(data).hexdigest())
+        with self._lock:
+            self.buckets.setdefault(bucket, {})[key] = stored
+        return stored
+
+    def delete(self, bucket: str, key: str) -> None:
+        with self._lock:
+            self.buckets.get(bucket, {}).pop(key, None)
+
+    def list(self, bucket: str, prefix: str, delimiter: str, start_after: str, max_keys: int) -> Tuple[List[Tuple[str, StoredObject]], List[str], Optional[str]]:
+        """返回 (对象, 公共前缀, 下一页起点)；对象与公共前缀合计不超过 max_keys 条。"""
+        with self._lock:
+            keys = sorted(key for key in self.buckets.get(bucket, {}) if key.startswith(prefix) and key > start_after)
+            objects = self.buckets.get(bucket, {})
+            contents: List[Tuple[str, StoredObject]] = []
+            prefixes: List[str] = []
+            last = None
+            for key in keys:
+                if delimiter:
+                    index = key.find(delimiter, len(prefix))
+                    if index >= 0:
+                        common = key[: index + len(delimiter)]
+                        if prefixes and prefixes[-1] == common:
+                            last = key
+                            continue
+                        if len(contents) + len(prefixes) >= max_keys:
+                            return contents, prefixes, last
+                        prefixes.append(common)
+                        last = key
+                        continue
+                if len(contents) + len(prefixes) >= max_keys:
+                    return contents, prefixes, last
+                contents.append((key, objects[key]))
+                last = key
+            return contents, prefixes, None
+
+    def create_upload(self, bucket: str, key: str) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self.uploads[upload_id] = (bucket, key, {})
+        return upload_id
+
+    def put_part(self, upload_id: str, number: int, data: bytes) -> Optional[str]:
+        with self._lock:
+            upload = self.uploads.get(upload_id)
+            if upload is None:
+                return None
+            upload[2][number] = data
+        return hashlib.md5(data).hexdigest()
+
+    def complete_upload(self, upload_id: str, numbers: List[int]) -> Optional[StoredObject]:
+        with self._lock:
+            upload = self.uploads.pop(upload_id, None)
+        if upload is None:
+            return None
+        bucket, key, parts = upload
+        digest = hashlib.md5(b"".join(hashlib.md5(parts[n]).digest() for n in numbers)).hexdigest()
+        return self.put(bucket, key, b"".join(parts[n] for n in numbers), f"{digest}-{len(numbers)}")
+
+    def abort_upload(self, upload_id: str) -> None:
+        with self._lock:
+            self.uploads.pop(upload_id, None)
+
+
+def _decode_aws_chunked(raw: bytes) -> bytes:
+    """解开 aws-chunked 编码(`<hex 长度>[;chunk-signature=...]\\r\\n<数据>\\r\\n ... 0\\r\\n<trailer>`)。"""
+    chunks: List[bytes] = []
+    pos = 0
+    while pos < len(raw):
+        end = raw.index(b"\r\n", pos)
+        size = int(raw[pos:end].split(b";", 1)[0], 16)
+        if size == 0:
+            break
+        chunks.append(raw[end + 2 : end + 2 + size])
+        pos = end + 2 + size + 2
+    return b"".join(chunks)
+
+
+def _iso(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(timestamp))
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    """路径风格(`/<bucket>/<key>`)的 S3 REST 接口。"""
+
+    protocol_version = "HTTP/1.1"
+    server: "_S3Server"
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002 - 覆盖基类签名
+        return
+
+    # ---- 请求解析与响应 ----
+
+    def _target(self) -> Tuple[str, str, Dict[str, str]]:
+        parsed = urllib.parse.urlsplit(self.path)
+        bucket, _, key = parsed.path.lstrip("/").partition("/")
+        query = {name: values[0] for name, values in urllib.parse.parse_qs(parsed.query, keep_blank_values=True).items()}
+        return urllib.parse.unquote(bucket), urllib.parse.unquote(key), query
+
+    def _read_body(self) -> bytes:
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            pieces: List[bytes] = []
+            while True:
+                size = int(self.rfile.readline().split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                pieces.append(self.rfile.read(size))
+                self.rfile.readline()
+            raw = b"".join(pieces)
+        else:
+            raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "aws-chunked" in self.headers.get("Content-Encoding", "") or self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            raw = _decode_aws_chunked(raw)
+        self.server.store.stats.incr("bytes_in", len(raw))
+        return raw
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None, length: Optional[int] = None) -> None:
+        """发送响应；HEAD 请求用 length 报告对象大小，但不写响应体。"""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+        self.end_headers()
+        if self.command != "HEAD" and body:
+            self.wfile.write(body)
+            self.server.store.stats.incr("bytes_out", len(body))
+
+    def _send_xml(self, status: int, root: str, inner: str) -> None:
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{S3_NAMESPACE}">{inner}</{root}>'.encode("utf-8")
+        self._send(status, body, {"Content-Type": "application/xml"})
+
+    def _error(self, status: int, code: str, message: str = "") -> None:
+        if self.command == "HEAD":
+            self._send(status)
+            return
+        body = f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>'
+        self._send(status, body.encode("utf-8"), {"Content-Type": "application/xml"})
+
+    def _prepare(self, operation: str) -> bool:
+        store = self.server.store
+        store.stats.record(operation)
+        if store.config.latency:
+            time.sleep(store.config.latency)
+        if store.should_fail():
+            store.stats.incr("errors_injected")
+            if self.command in ("PUT", "POST"):
+                self._read_body()
+            self._error(503, "SlowDown", "模拟限流")
+            return False
+        return True
+
+    def _copy_source(self) -> Optional[StoredObject]:
+        source = urllib.parse.unquote(self.headers["x-amz-copy-source"].split("?", 1)[0]).lstrip("/")
+        bucket, _, key = source.partition("/")
+        return self.server.store.get(bucket, key)
+
+    # ---- 各 HTTP 方法 ----
+
+    def do_HEAD(self) -> None:
+        bucket, key, _ = self._target()
+        if not self._prepare("HeadObject" if key else "HeadBucket"):
+            return
+        store = self.server.store
+        if not key:
+            self._send(200 if bucket in store.buckets else 404)
+            return
+        stored = store.get(bucket, key)
+        if stored is None:
+            self._error(404, "NoSuchKey")
+            return
+        self._send(
+            200,
+            headers={
+                "ETag": f'"{stored.etag}"',
+                "Last-Modified": email.utils.formatdate(stored.modified, usegmt=True),
+            },
+            length=len(stored.data),
+        )
+
+    def do_GET(self) -> None:
+        bucket, key, query = self._target()
+        store = self.server.store
+        if bucket == "_stats":
+            self._send(200, json.dumps(store.stats.snapshot(), ensure_ascii=False).encode("utf-8"), {"Content-Type": "application/json"})
+            return
+        if not key:
+            self._list_objects(bucket, query)
+            return
+        if not self._prepare("GetObject"):
+            return
+        stored = store.get(bucket, key)
+        if stored is None:
+            self._error(404, "NoSuchKey", key)
+            return
+        self._send(
+            200,
+            stored.data,
+            {
+                "Content-Type": "application/octet-stream",
+                "ETag": f'"{stored.etag}"',
+                "Last-Modified": email.utils.formatdate(stored.modified, usegmt=True),
+            },
+        )
+
+    def _list_objects(self, bucket: str, query: Dict[str, str]) -> None:
+        if not self._prepare("ListObjectsV2"):
+            return
+        store = self.server.store
+        if bucket not in store.buckets:
+            self._error(404, "NoSuchBucket", bucket)
+            return
+        prefix = query.get("prefix", "")
+        delimiter = query.get("delimiter", "")
+        max_keys = min(int(query.get("max-keys") or DEFAULT_MAX_KEYS), store.config.page_size)
+        token = query.get("continuation-token") or ""
+        start_after = urllib.parse.unquote(token) if token else query.get("start-after", "")
+        contents, prefixes, next_key = store.list(bucket, prefix, delimiter, start_after, max_keys)
+        parts = [
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(contents) + len(prefixes)}</KeyCount>",
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{'true' if next_key else 'false'}</IsTruncated>",
+        ]
+        if delimiter:
+            parts.append(f"<Delimiter>{escape(delimiter)}</Delimiter>")
+        if token:
+            parts.append(f"<ContinuationToken>{escape(token)}</ContinuationToken>")
+        if next_key:
+            parts.append(f"<NextContinuationToken>{escape(urllib.parse.quote(next_key))}</NextContinuationToken>")
+        for key, stored in contents:
+            parts.append(
+                f"<Contents><Key>{escape(key)}</Key><LastModified>{_iso(stored.modified)}</LastModified>"
+                f'<ETag>"{stored.etag}"</ETag><Size>{len(stored.data)}</Size><StorageClass>STANDARD</StorageClass></Contents>'
+            )
+        for common in prefixes:
+            parts.append(f"<CommonPrefixes><Prefix>{escape(common)}</Prefix></CommonPrefixes>")
+        self._send_xml(200, "ListBucketResult", "".join(parts))
+
+    def do_PUT(self) -> None:
+        bucket, key, query = self._target()
+        store = self.server.store
+        if not key:
+            if self._prepare("CreateBucket"):
+                self._read_body()
+                store.buckets.setdefault(bucket, {})
+                self._send(200, headers={"Location": f"/{bucket}"})
+            return
+        if "uploadId" in query:
+            self._upload_part(query)
+            return
+        copy = "x-amz-copy-source" in self.headers
+        if not self._prepare("CopyObject" if copy else "PutObject"):
+            return
+        if bucket not in store.buckets:
+            self._read_body()
+            self._error(404, "NoSuchBucket", bucket)
+            return
+        if copy:
+            self._read_body()
+            source = self._copy_source()
+            if source is None:
+                self._error(404, "NoSuchKey", self.headers["x-amz-copy-source"])
+                return
+            stored = store.put(bucket, key, source.data, source.etag)
+            self._send_xml(200, "CopyObjectResult", f'<LastModified>{_iso(stored.modified)}</LastModified><ETag>"{stored.etag}"</ETag>')
+            return
+        stored = store.put(bucket, key, self._read_body())
+        self._send(200, headers={"ETag": f'"{stored.etag}"'})
+
+    def _upload_part(self, query: Dict[str, str]) -> None:
+        copy = "x-amz-copy-source" in self.headers
+        if not self._prepare("UploadPartCopy" if copy else "UploadPart"):
+            return
+        store = self.server.store
+        if copy:
+            self._read_body()
+            source = self._copy_source()
+            if source is None:
+                self._error(404, "NoSuchKey", self.headers["x-amz-copy-source"])
+                return
+            data = source.data
+            byte_range = self.headers.get("x-amz-copy-source-range")
+            if byte_range:
+                start, end = byte_range.split("=", 1)[1].split("-", 1)
+                data = data[int(start) : int(end) + 1]
+        else:
+            data = self._read_body()
+        etag = store.put_part(query["uploadId"], int(query.get("partNumber", "1")), data)
+        if etag is None:
+            self._error(404, "NoSuchUpload", query["uploadId"])
+            return
+        if copy:
+            self._send_xml(200, "CopyPartResult", f'<LastModified>{_iso(time.time())}</LastModified><ETag>"{etag}"</ETag>')
+        else:
+            self._send(200, headers={"ETag": f'"{etag}"'})
+
+    def do_POST(self) -> None:
+        bucket, key, query = self._target()
+        store = self.server.store
+        if "uploads" in query:
+            if not self._prepare("CreateMultipartUpload"):
+                return
+            self._read_body()
+            upload_id = store.create_upload(bucket, key)
+            self._send_xml(
+                200,
+                "InitiateMultipartUploadResult",
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>",
+            )
+            return
+        if "uploadId" in query:
+            if not self._prepare("CompleteMultipartUpload"):
+                return
+            root = ET.fromstring(self._read_body() or b"<CompleteMultipartUpload/>")
+            numbers = sorted(int(node.text or 0) for node in root.iter() if node.tag.endswith("PartNumber"))
+            try:
+                stored = store.complete_upload(query["uploadId"], numbers)
+            except KeyError:
+                self._error(400, "InvalidPart")
+                return
+            if stored is None:
+                self._error(404, "NoSuchUpload", query["uploadId"])
+                return
+            self._send_xml(
+                200,
+                "CompleteMultipartUploadResult",
+                f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><ETag>\"{stored.etag}\"</ETag>",
+            )
+            return
+        self._read_body()
+        self._error(501, "NotImplemented", "不支持的 POST 操作")
+
+    def do_DELETE(self) -> None:
+        bucket, key, query = self._target()
+        if not self._prepare("AbortMultipartUpload" if "uploadId" in query else "DeleteObject"):
+            return
+        if "uploadId" in query:
+            self.server.store.abort_upload(query["uploadId"])
+        else:
+            self.server.store.delete(bucket, key)
+        self._send(204)
+
+
+class _S3Server(ThreadingHTTPServer):
+    daemon_threads = True
+    store: ObjectStore
+
+
+def start_server(config: SimulatorConfig) -> _S3Server:
+    server = _S3Server((config.host, config.port), S3Handler)
+    server.store = ObjectStore(config)
+    threading.Thread(target=server.serve_forever, name="s3-simulator", daemon=True).start()
+    return server
+
+
+def serve(config: SimulatorConfig) -> None:
+    server = start_server(config)
+    host, port = server.server_address[:2]
+    print(f"S3 模拟器已启动: http://{host}:{port} 桶 {', '.join(config.buckets)} (统计: /_stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        print(json.dumps(server.store.stats.snapshot(), ensure_ascii=False, indent=2))
+
+
+def smoke(config: SimulatorConfig) -> None:
+    """在临时端口启动模拟器，对 storage.S3Storage 的全部操作做一遍自检，失败时以非零状态退出。"""
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from storage import S3Storage
+
+    # boto3 签名需要凭据，模拟器不校验
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "simulator")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "simulator")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    config.port = 0
+    config.page_size = 2  # 小分页，覆盖 ListObjectsV2 的翻页
+    server = start_server(config)
+    host, port = server.server_address[:2]
+    storage = S3Storage(config.buckets[0], "smoke", endpoint_url=f"http://{host}:{port}")
+    # 调小分段阈值，让分段上传与分段复制也走一遍
+    storage.transfer_config.multipart_threshold = 5 * 1024 * 1024
+    storage.transfer_config.multipart_chunksize = 5 * 1024 * 1024
+    failures: List[str] = []
+
+    def check(condition: bool, message: str) -> None:
+        print(f"{'ok  ' if condition else 'FAIL'} {message}")
+        if not condition:
+            failures.append(message)
+
+    try:
+        tile_dir = "rawdata/a/w/r/v/tile"
+        for name in ("0_0.jpg", "0_1.jpg", "1_0.jpg"):
+            storage.write_bytes(f"{tile_dir}/{name}", name.encode("utf-8") * 10)
+        storage.write_bytes("rawdata/a/w/r/v/.completed", b"1")
+        check(storage.exists(f"{tile_dir}/0_0.jpg"), "exists: 已写入的键")
+        check(not storage.exists(f"{tile_dir}/9_9.jpg"), "exists: 不存在的键")
+        check(storage.read_bytes(f"{tile_dir}/0_1.jpg") == b"0_1.jpg" * 10, "read_bytes 内容一致")
+        stat = storage.stat(f"{tile_dir}/1_0.jpg")
+        check(stat is not None and stat[0] == 70, f"stat 大小: {stat}")
+        check(storage.stat("missing") is None, "stat: 不存在的键返回 None")
+        check(storage.list_dir("rawdata/a/w/r/v") == (["tile"], [".completed"]), "list_dir 区分子目录与文件")
+        sizes = storage.file_sizes(tile_dir)
+        check(sizes == {"0_0.jpg": 70, "0_1.jpg": 70, "1_0.jpg": 70}, f"file_sizes 跨分页: {sizes}")
+        storage.copy(f"{tile_dir}/0_0.jpg", "cleaned/0_0.jpg")
+        check(storage.read_bytes("cleaned/0_0.jpg") == b"0_0.jpg" * 10, "copy 小对象")
+
+        big = os.urandom(12 * 1024 * 1024)
+        with tempfile.TemporaryDirectory() as tmp:
+            local = Path(tmp) / "merged.jpg"
+            local.write_bytes(big)
+            storage.upload_file(local, "cleaned/merged.jpg")
+        check(storage.read_bytes("cleaned/merged.jpg") == big, "upload_file 分段上传")
+        storage.copy("cleaned/merged.jpg", "cleaned/merged-copy.jpg")
+        check(storage.read_bytes("cleaned/merged-copy.jpg") == big, "copy 分段复制")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(json.dumps(server.store.stats.snapshot(), ensure_ascii=False, indent=2))
+    if failures:
+        raise SystemExit(f"{len(failures)} 项自检失败")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> Tuple[SimulatorConfig, bool]:
+    parser = argparse.ArgumentParser(description="S3 兼容对象存储的本地模拟器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=19000)
+    parser.add_argument("--bucket", action="append", default=None, help="预先创建的桶，可重复，默认 ltfc")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="每个请求返回 503 SlowDown 的概率")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求注入的延迟(秒)")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_MAX_KEYS, help="ListObjectsV2 每页最多返回的条数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现故障序列")
+    parser.add_argument("--smoke", action="store_true", help="对 storage.S3Storage 做一遍自检后退出(需要 boto3)")
+    args = parser.parse_args(argv)
+    config = SimulatorConfig(
+        host=args.host,
+        port=args.port,
+        buckets=args.bucket or ["ltfc"],
+        error_rate=args.error_rate,
+        latency=args.latency,
+        page_size=max(1, args.page_size),
+        seed=args.seed,
+    )
+    return config, args.smoke
+
+
+if __name__ == "__main__":
+    simulator_config, run_smoke = parse_args()
+    if run_smoke:
+        smoke(simulator_config)
+    else:
+        serve(simulator_config)